@@ -1,8 +1,13 @@
 import os
-import smtplib
+import threading
 from email.message import EmailMessage
 from typing import Any, Dict
 
+from audit_log import get_audit_logger
+from db_pool import ConnectionPool
+from metrics import REGISTRY
+from notification_outbox import NotificationOutbox, SmtpSession
+
 # Optional Twilio support for SMS notifications
 try:
     from twilio.rest import Client as TwilioClient
@@ -21,10 +26,70 @@ def _get_smtp_config():
     }
 
 
+# Fraud alerts are queued here and delivered by background workers
+OUTBOX_DB_PATH = os.environ.get('NOTIFY_DB_PATH', os.path.join(os.path.dirname(__file__), 'notification_outbox.db'))
+# Block / notification audit trail (JSON lines, written by a background flusher)
+AUDIT_LOG_PATH = os.environ.get('FRAUD_AUDIT_LOG', os.path.join(os.path.dirname(__file__), 'fraud_audit.log'))
+
+BLOCKED = REGISTRY.counter('transactions_blocked_total', 'Transactions blocked by the fraud pipeline')
+ALERTS = REGISTRY.counter('fraud_alerts_total', 'Fraud alerts by channel (queued, or audit log only)', ('channel',))
+
+
+class FraudEmailSender:
+    """Outbox sender for fraud alert emails over a reused SMTP session"""
+
+    def __init__(self):
+        cfg = _get_smtp_config()
+        self.session = SmtpSession(cfg['host'], cfg['port'], cfg['user'], cfg['password'])
+
+    def send(self, payload):
+        msg = EmailMessage()
+        msg['Subject'] = payload['subject']
+        msg['From'] = self.session.user
+        msg['To'] = payload['to']
+        msg.set_content(payload['body'])
+        self.session.send(msg)
+
+    def close(self):
+        self.session.close()
+
+
+class FraudSmsSender:
+    """Outbox sender for fraud alert SMS; one Twilio client per worker"""
+
+    def __init__(self):
+        self.client = TwilioClient(os.environ.get('TWILIO_ACCOUNT_SID'), os.environ.get('TWILIO_AUTH_TOKEN'))
+
+    def send(self, payload):
+        self.client.messages.create(body=payload['body'], from_=payload['from'], to=payload['to'])
+
+    def close(self):
+        pass
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> NotificationOutbox:
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = NotificationOutbox(ConnectionPool(OUTBOX_DB_PATH), {
+                    'fraud_email': FraudEmailSender,
+                    'fraud_sms': FraudSmsSender,
+                }, name='fraud_alerts').start()
+    return _outbox
+
+
 def send_notification(transaction: Any, subject: str = None, body: str = None) -> bool:
     """Send a notification about a suspicious transaction.
 
-    Falls back to printing the message if SMTP or Twilio is not configured.
+    Email/SMS alerts are queued in the notification outbox and delivered in the
+    background, so this returns as soon as they are enqueued. The alert is also
+    recorded in the audit log, which is the only record when SMTP and Twilio are
+    not configured.
     Returns True if notification was (attempted) sent, False otherwise.
     """
     cfg = _get_smtp_config()
@@ -44,48 +109,30 @@ def send_notification(transaction: Any, subject: str = None, body: str = None) -
     subject = subject or f"Fraud Alert: Suspicious transaction detected"
     body = body or f"Suspicious transaction detected:\n\n{tx_summary}\n\nTake immediate action."
 
-    # Use SMTP if configured
-    sent_any = False
+    messages = []
     if cfg['host'] and cfg['port'] and cfg['user'] and cfg['password'] and cfg['to']:
-        try:
-            msg = EmailMessage()
-            msg['Subject'] = subject
-            msg['From'] = cfg['user']
-            msg['To'] = cfg['to']
-            msg.set_content(body)
-
-            with smtplib.SMTP(cfg['host'], cfg['port']) as server:
-                server.starttls()
-                server.login(cfg['user'], cfg['password'])
-                server.send_message(msg)
-
-            print(f"✅ Notification sent to {cfg['to']}")
-            sent_any = True
-        except Exception as e:
-            print(f"⚠️ Notification failed (SMTP): {e}")
-            print("Falling back to console print for notification.")
+        messages.append(('fraud_email', {'to': cfg['to'], 'subject': subject, 'body': body}, None))
 
-    # Try SMS if configured
+    # Queue an SMS too if Twilio is configured
     twilio_sid = os.environ.get('TWILIO_ACCOUNT_SID')
     twilio_token = os.environ.get('TWILIO_AUTH_TOKEN')
     twilio_from = os.environ.get('TWILIO_FROM')
     notify_phone = os.environ.get('NOTIFY_PHONE')
     if TWILIO_AVAILABLE and twilio_sid and twilio_token and twilio_from and notify_phone:
+        messages.append(('fraud_sms', {'to': notify_phone, 'from': twilio_from, 'body': body}, None))
+
+    channels = [kind for kind, _, _ in messages]
+    error = None
+    if messages:
         try:
-            client = TwilioClient(twilio_sid, twilio_token)
-            sms = client.messages.create(body=body, from_=twilio_from, to=notify_phone)
-            print(f"✅ SMS notification sent to {notify_phone} (sid={sms.sid})")
-            sent_any = True
+            get_outbox().enqueue_many(messages)
         except Exception as e:
-            print(f"⚠️ SMS notification failed: {e}")
-            print("Falling back to console print for notification.")
+            channels, error = [], str(e)
 
-    # Fallback: print the notification if nothing was sent
-    if not sent_any:
-        print("\n=== FRAUD NOTIFICATION ===")
-        print("Subject:", subject)
-        print(body)
-        print("=== END NOTIFICATION ===\n")
+    get_audit_logger(AUDIT_LOG_PATH).log('fraud_notification', subject=subject, body=body,
+                                         queued=channels, error=error)
+    for channel in channels or ['audit_log']:
+        ALERTS.inc(channel=channel)
 
     return True
 
@@ -93,7 +140,7 @@ def send_notification(transaction: Any, subject: str = None, body: str = None) -
 def block_transaction(transaction: Any) -> Dict[str, Any]:
     """Block the transaction.
 
-    For now, blocking prints a failure message and returns a dict indicating the block.
+    For now, blocking records the block in the audit log and returns a dict indicating it.
     In a real system this should integrate with the transaction processor to stop the transfer.
     """
     try:
@@ -107,10 +154,9 @@ def block_transaction(transaction: Any) -> Dict[str, Any]:
         tx_summary = {'transaction': str(transaction)}
 
     message = f"Transaction blocked: {tx_summary}"
-    # For audit we print; production should write to a log or DB and stop processing
-    print("\n❌ TRANSACTION BLOCKED ❌")
-    print(message)
-    print("Action: Transaction marked as failed / blocked.\n")
+    get_audit_logger(AUDIT_LOG_PATH).log('transaction_blocked', transaction=tx_summary,
+                                         action='marked as failed / blocked')
+    BLOCKED.inc()
 
     return {
         'status': 'blocked',
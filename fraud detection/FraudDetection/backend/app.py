@@ -1,46 +1,360 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+import atexit
+import io
+import os
+import json
+import time
+import joblib
+import numpy as np
 import pandas as pd
-import pickle
+from model_registry import ModelRegistry
+from tree_compiler import compiled_loader
+from feature_schema import (FeatureSchema, SchemaError, normalize_column, FRAUD_FEATURES, EMBEDDING_FEATURES, ACCOUNT_ID_FIELDS,
+                            CONTEXT_FIELDS, account_key, split_context)
+from micro_batcher import MicroBatcher, QueueFullError, BATCH_RESULT_TIMEOUT
+from feature_store import OnlineFeatureStore, FEATURE_STORE_PATH, ROLLING_FEATURES, parse_event_time
+from incremental_graph import IncrementalGraph, GRAPH_STATE_PATH, GRAPH_COMPACT_INTERVAL
+from embedding_store import EmbeddingStore, EMBEDDING_STORE_PATH
+from gcn_inference import InductiveGCN, GCN_GRAPH_PATH, GCN_WEIGHTS_PATH
+from asgi_bridge import WsgiBridge
+from metrics import REGISTRY, METRICS_ENABLED, CONTENT_TYPE, stage_timers, track_model_versions
+from profiler import RequestProfiler
+
+try:
+    from Pipeline_fixed import process_transaction
+    PIPELINE_AVAILABLE = True
+except Exception:
+    process_transaction = None
+    PIPELINE_AVAILABLE = False
+
+try:
+    from Pipeline_fixed import send_sms_only
+except Exception:
+    send_sms_only = None
+
+BASE_DIR = os.path.dirname(__file__)
 
 app = Flask(__name__)
 
-# Load the trained XGBClassifier model
-model = joblib.load("xgb_model.pkl")
-
-# Features used during training
-features = [
-    'amount_paid', 'sender_bank', 'receiver_bank', 'receiving_currency',
-    'payment_currency', 'payment_format', 'transaction_difference',
-    'transaction_difference_percentage', 'log_amount_received', 'log_amount_paid',
-    'rolling_mean_amount_7d', 'rolling_std_amount_7d', 'hour', 'day_of_week',
-    'is_weekend', 'num_transactions_30d', 'avg_transaction_30d',
-    'degree_centrality', 'pagerank_score', 'cross_currency_transaction',
-    'time_diff', 'is_burst', 'z_score_amount', 'is_anomalous_amount',
-    'is_circular', 'currency_arbitrage'
-] + [f"gnn_embedding_{i}" for i in range(1, 17)]
+# The trained XGBClassifier model, loaded once and hot-swapped when the file changes; small
+# batches are scored by the compiled tree arrays (tree_compiler.py)
+fraud_models = ModelRegistry('fraud', {'model': os.path.join(BASE_DIR, 'xgb_model.pkl')},
+                             loader=compiled_loader(joblib.load)).start()
+
+# Rows per chunk when streaming an upload (see /upload?stream=true)
+UPLOAD_CHUNK_ROWS = int(os.getenv("UPLOAD_CHUNK_ROWS", "50000"))
+
+# Features used during training, in model column order (see feature_schema.FRAUD_FEATURES)
+features = FRAUD_FEATURES
+
+# Validates/normalizes upload headers and builds the float32 model matrix
+feature_schema = FeatureSchema(features)
+# Uploads may leave out the embeddings; they are then looked up by sender account
+base_schema = FeatureSchema(features[:-len(EMBEDDING_FEATURES)])
+
+# GNN node embeddings (GNN_Node_Embeddings.csv compiled by embedding_store.py), swapped on republish
+embedding_stores = ModelRegistry('embedding', {'store': EMBEDDING_STORE_PATH}, loader=EmbeddingStore).start()
+
+# The notebook's GCN in NumPy, for accounts the store has no embedding for (None until
+# export_gcn has written the weights)
+gcn_model = InductiveGCN.load(GCN_GRAPH_PATH, GCN_WEIGHTS_PATH)
+if gcn_model is not None:
+    atexit.register(gcn_model.save, GCN_GRAPH_PATH)
+
+
+def lookup_embeddings(accounts):
+    """Stored embeddings, computed by the GCN for accounts the store lacks. None if neither is available."""
+    artifact = embedding_stores.current()
+    if artifact is not None:
+        return artifact['store'].lookup(accounts, fallback=gcn_model.embed if gcn_model is not None else None)
+    if gcn_model is not None:
+        return gcn_model.embed(accounts)
+    return None
+
+
+class EmbeddingPlan:
+    """Upload plan for files without embedding columns: the other features, then the sender's embedding.
+
+    Embeddings are looked up by the ``sender_id`` column when the file has one, else by
+    the ``sender_account`` code (which only matches a store keyed by codes).
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.sender = plan.context.get(ACCOUNT_ID_FIELDS['sender_account'])
+        self.dtypes = dict(plan.dtypes)
+        if self.sender is None:
+            self.sender = plan.header[plan.positions[base_schema.columns.index('sender_account')]]
+            # float32 would round account codes above 2**24 before the lookup
+            self.dtypes[self.sender] = np.float64
+
+    def to_matrix(self, df):
+        return np.hstack([self.plan.to_matrix(df), lookup_embeddings(df[self.sender].to_numpy())])
+
+
+def compile_upload(handle):
+    """Column plan for an upload; files missing only the embedding columns get them looked up."""
+    try:
+        return feature_schema.compile_csv(handle, CONTEXT_FIELDS)
+    except SchemaError as e:
+        available = embedding_stores.current() is not None or gcn_model is not None
+        if not available or e.extra or set(e.missing) != set(EMBEDDING_FEATURES):
+            raise
+    return EmbeddingPlan(base_schema.compile_csv(handle, CONTEXT_FIELDS))
+
+
+def live_features():
+    """Features /score fills in itself when a transaction leaves them out."""
+    derived = ROLLING_FEATURES + ['degree_centrality', 'pagerank_score']
+    if embedding_stores.current() is not None or gcn_model is not None:
+        derived += EMBEDDING_FEATURES
+    return derived
+
+
+def transaction_accounts(values, context):
+    """(sender, receiver) state keys: the raw ``sender_id``/``receiver_id`` if sent, else the account codes."""
+    return tuple(account_key(context.get(ACCOUNT_ID_FIELDS[field], values[field]))
+                 for field in ('sender_account', 'receiver_account'))
+
+
+def with_embeddings(transaction, sender, receiver):
+    """Fill in any gnn_embedding_* fields a /score transaction lacks from the sender's embedding.
+
+    The transaction is added to the GCN's graph first, so a new sender is embedded
+    from its own first transaction onwards.
+    """
+    if gcn_model is not None:
+        amount = next(v for k, v in transaction.items() if normalize_column(k) == 'amount_paid')
+        gcn_model.add_transaction(sender, receiver, amount)
+
+    by_name = {normalize_column(k): k for k in transaction}
+    missing = [c for c in EMBEDDING_FEATURES if c not in by_name]
+    if not missing:
+        return transaction
+    vectors = lookup_embeddings([sender])
+    if vectors is None:
+        return transaction
+    enriched = dict(transaction)
+    for name, value in zip(EMBEDDING_FEATURES, vectors[0]):
+        if name in missing:
+            enriched[name] = float(value)
+    return enriched
+
+
+def score_matrix(X):
+    """Fraud probability per row, using whichever model version is live when the batch runs"""
+    artifact = fraud_models.current()
+    if artifact is None:
+        raise RuntimeError('Model not loaded')
+    return artifact['model'].predict_proba(X)[:, 1]
+
+
+# Single-transaction requests to /score are coalesced into matrix calls here
+scoring_batcher = MicroBatcher(score_matrix, name='fraud-scoring')
+
+# Per-sender rolling windows for /score, restored from the last snapshot
+feature_store = OnlineFeatureStore.load(FEATURE_STORE_PATH)
+feature_store.start_snapshots(FEATURE_STORE_PATH)
+atexit.register(feature_store.save, FEATURE_STORE_PATH)
+
+# Account graph for degree_centrality/pagerank_score, updated with each scored transaction
+transaction_graph = IncrementalGraph.load(GRAPH_STATE_PATH)
+transaction_graph.start_compaction(GRAPH_COMPACT_INTERVAL, path=GRAPH_STATE_PATH)
+atexit.register(transaction_graph.save, GRAPH_STATE_PATH)
+
+# /metrics: per-stage latency, decisions, scoring queue depth and model versions
+STAGES = stage_timers('fraud', ('parse', 'preprocess', 'predict', 'notify', 'total'))
+DECISIONS = REGISTRY.counter('fraud_decisions_total', 'Scored transactions by endpoint and decision',
+                             ('source', 'decision'))
+REGISTRY.gauge('scoring_queue_depth', 'Rows waiting in the /score micro-batcher') \
+    .set_function(lambda: scoring_batcher.stats()['queue_depth'])
+REGISTRY.gauge('transaction_graph_accounts', 'Accounts in the live transaction graph') \
+    .set_function(lambda: transaction_graph.stats()['accounts'])
+track_model_versions(fraud_models, embedding_stores)
+
+# cProfile/stack samples of selected requests, served under /admin/profiles (see profiler.py)
+profiler = RequestProfiler('fraud').install(app)
+
+
+def count_decisions(source, predictions):
+    flagged = int(np.count_nonzero(predictions))
+    DECISIONS.inc(flagged, source=source, decision='fraud')
+    DECISIONS.inc(len(predictions) - flagged, source=source, decision='clean')
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled (METRICS_ENABLED=false)'}), 404
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok', **fraud_models.describe(), 'batching': scoring_batcher.stats(),
+                    'graph': transaction_graph.stats(), 'embeddings': embedding_stores.describe(),
+                    'gcn': gcn_model.stats() if gcn_model is not None else None})
+
+def detach_upload(file):
+    """Return a handle on the uploaded file that stays open after the request is torn down.
+
+    Flask closes request.files before a streamed response body is consumed. Large
+    uploads are spooled to a temp file by werkzeug, so we dup its descriptor instead
+    of copying; small in-memory uploads are cheap to copy.
+    """
+    stream = file.stream
+    try:
+        fd = stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        stream.seek(0)
+        return io.BytesIO(stream.read())
+    handle = os.fdopen(os.dup(fd), 'rb')
+    handle.seek(0)
+    return handle
+
+
+def stream_predictions(file, model, plan, chunk_rows=UPLOAD_CHUNK_ROWS):
+    """Score a CSV upload chunk by chunk, yielding NDJSON lines as each chunk finishes.
+
+    Only one chunk is held in memory at a time, so arbitrarily large transaction
+    exports can be scored. Every column is parsed straight to float32.
+    """
+    offset = 0
+    try:
+        for chunk in pd.read_csv(file, chunksize=chunk_rows, dtype=plan.dtypes):
+            predictions = model.predict(plan.to_matrix(chunk))
+            count_decisions('upload', predictions)
+            lines = pd.DataFrame({
+                'transaction': np.arange(offset + 1, offset + len(chunk) + 1),
+                'fraud': np.asarray(predictions).astype(bool),
+            }).to_json(orient='records', lines=True)
+            offset += len(chunk)
+            yield lines if lines.endswith('\n') else lines + '\n'
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        yield json.dumps({'error': f'scoring failed after {offset} rows: {e}'}) + '\n'
+    finally:
+        file.close()
+
+
+def wants_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    artifact = fraud_models.current()
+    if artifact is None:
+        return jsonify({"error": "Model not loaded"}), 503
+
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
 
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No file selected"})
-    
-    df = pd.read_csv(file)
-    
-    # Prepare data for model
-    data = df.values.tolist()
+
+    model = artifact['model']
+    try:
+        feature_schema.check_model(model)
+    except SchemaError as e:
+        return jsonify({"error": str(e)}), 500
+
+    handle = detach_upload(file)
+    # one parse observation per upload: the header check plus, unless streaming, the read
+    parse_started = time.perf_counter()
+    try:
+        plan = compile_upload(handle)
+    except SchemaError as e:
+        handle.close()
+        return jsonify(e.to_dict()), 400
+
+    if wants_stream():
+        # the rows are parsed chunk by chunk while the response streams
+        STAGES['parse'].observe(time.perf_counter() - parse_started)
+        return Response(stream_with_context(stream_predictions(handle, model, plan)),
+                        mimetype='application/x-ndjson')
+
+    try:
+        df = pd.read_csv(handle, dtype=plan.dtypes)
+        STAGES['parse'].observe(time.perf_counter() - parse_started)
+        with STAGES['preprocess'].time():
+            X = plan.to_matrix(df)
+    except (SchemaError, ValueError) as e:
+        return jsonify({"error": f"Invalid transaction file: {e}"}), 400
+    finally:
+        handle.close()
     
     # Predict
-    predictions = model.predict(data)
+    with STAGES['predict'].time():
+        predictions = model.predict(X)
+    count_decisions('upload', predictions)
     
     result = [{'transaction': i+1, 'fraud': bool(pred)} for i, pred in enumerate(predictions)]
     
     return jsonify(result)
 
+@app.route('/score', methods=['POST'])
+def score_transaction():
+    """Score one transaction (JSON object of model features) and run it through the pipeline.
+
+    The sender's rolling features (7/30-transaction windows, time_diff, is_burst) come
+    from the online feature store, and degree_centrality/pagerank_score from the live
+    transaction graph, and gnn_embedding_1..16 from the embedding store, unless the caller
+    supplies them. Optional ``sender_id``/``receiver_id`` fields carry the raw account
+    IDs those stores are keyed by (the model's account features are label-encoded codes);
+    without them the codes are used as keys. An optional ``event_time`` field (epoch
+    seconds or ISO string) is the clock for time_diff/is_burst; without it the arrival
+    time is used. None of these context fields are model features. The fields are
+    validated before any of these stores is updated, so a rejected request leaves no
+    trace in them. Concurrent calls are micro-batched: each request
+    waits at most BATCH_MAX_WAIT_MS for others to join its batch before the model runs.
+    """
+    if fraud_models.current() is None:
+        return jsonify({"error": "Model not loaded"}), 503
+
+    started = time.perf_counter()
+    with STAGES['parse'].time():
+        transaction = request.get_json(silent=True)
+    if not isinstance(transaction, dict):
+        return jsonify({"error": "Expected a JSON object of transaction features"}), 400
+
+    try:
+        with STAGES['preprocess'].time():
+            fields, context = split_context(transaction)
+            event_time = parse_event_time(context['event_time']) if 'event_time' in context else None
+            values = feature_schema.check(fields, derived=live_features())
+            sender, receiver = transaction_accounts(values, context)
+            enriched = feature_store.enrich(fields, event_time, sender)
+            enriched = transaction_graph.enrich(enriched, sender, receiver)
+            enriched = with_embeddings(enriched, sender, receiver)
+            row = feature_schema.vector(enriched)
+    except SchemaError as e:
+        return jsonify(e.to_dict()), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with STAGES['predict'].time():
+            probability = float(scoring_batcher.predict(row, timeout=BATCH_RESULT_TIMEOUT))
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"scoring failed: {e}"}), 500
+
+    fraud = probability > 0.5
+    count_decisions('score', [fraud])
+    result = {'fraud': fraud, 'probability': round(probability, 6)}
+    if PIPELINE_AVAILABLE and process_transaction is not None:
+        with STAGES['notify'].time():
+            result['pipeline'] = process_transaction(transaction, fraud_flag=int(fraud), fraud_probability=probability)
+    STAGES['total'].observe(time.perf_counter() - started)
+    return jsonify(result)
+
+
 @app.route('/test', methods=['GET'])
 def test():
     return jsonify({"message": "API is working!"})
@@ -139,5 +453,8 @@ def pipeline_sms_test():
     except Exception as e:
         return jsonify({'error': f'sms invocation failed: {e}'}), 500
 
+# ASGI entry point: uvicorn app:asgi_app --port 5000 (see asgi_bridge.py)
+asgi_app = WsgiBridge(app, name='fraud')
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,236 @@
+"""ASGI serving for the Flask apps.
+
+``WsgiBridge`` turns a Flask app into an ASGI application (``app.asgi_app`` and
+``loan_api.asgi_app``), so the same routes and JSON contracts can run under an
+ASGI server:
+
+    uvicorn app:asgi_app --port 5000
+    uvicorn loan_api:asgi_app --port 5001
+
+The event loop only moves bytes. Request bodies are read without blocking and
+spooled to memory (or to disk when large). Each handler then runs on one of
+three bounded thread pools. Model routes (``/predict``, ``/upload``, ``/score``,
+``/pipeline_*``) go to the inference pool, except bulk ones (bodies over
+``ASGI_BULK_BYTES`` or of unknown length, i.e. CSV uploads), which go to a
+separate bulk pool. Everything else (health, admin, the SQLite queries behind
+them) goes to the I/O pool. Slow uploads therefore queue behind each other, not
+in front of single-record scoring or health checks. When a pool's workers and
+queue slots are all taken, the request gets a 503 straight away instead of
+queueing without limit. Emails were already delivered off the request path by
+the notification outbox.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Sequence
+
+from metrics import REGISTRY
+
+# Worker threads for single-record model requests; NumPy/XGBoost release the GIL, so a few per core pay off
+ASGI_INFERENCE_WORKERS = int(os.getenv("ASGI_INFERENCE_WORKERS", str(max(4, 2 * (os.cpu_count() or 1)))))
+# Worker threads for bulk model requests (CSV uploads), kept apart so they can't starve the above
+ASGI_BULK_WORKERS = int(os.getenv("ASGI_BULK_WORKERS", "2"))
+# Model requests with a body over this many bytes (or without a Content-Length) count as bulk
+ASGI_BULK_BYTES = int(os.getenv("ASGI_BULK_BYTES", str(256 * 1024)))
+# Worker threads for everything else (health, admin queries, static files)
+ASGI_IO_WORKERS = int(os.getenv("ASGI_IO_WORKERS", "8"))
+# Requests that may wait for a busy pool before new ones are turned away with a 503
+ASGI_MAX_PENDING = int(os.getenv("ASGI_MAX_PENDING", "64"))
+# Request bodies above this many bytes are spooled to a temp file instead of memory
+ASGI_SPOOL_BYTES = int(os.getenv("ASGI_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+INFERENCE_PREFIXES = ('/predict', '/upload', '/score', '/pipeline_')
+
+_pools = []
+REGISTRY.gauge('asgi_requests_in_flight', 'Requests running or queued per ASGI worker pool', ('pool',)) \
+    .set_function(lambda: {pool.name: pool.in_flight for pool in _pools})
+REJECTED = REGISTRY.counter('asgi_requests_rejected_total', 'Requests turned away with 503 per ASGI worker pool', ('pool',))
+
+
+class WorkerPool:
+    """Thread pool with a hard cap on queued work."""
+
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = workers
+        self.limit = workers + max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'asgi-{name}')
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.rejected += 1
+                REJECTED.inc(pool=self.name)
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {'workers': self.workers, 'in_flight': self.in_flight, 'capacity': self.limit,
+                'completed': self.completed, 'rejected': self.rejected}
+
+
+class WsgiBridge:
+    """ASGI application running a WSGI app on bounded thread pools."""
+
+    def __init__(self, wsgi_app, name: str = 'app', inference_workers: int = ASGI_INFERENCE_WORKERS,
+                 bulk_workers: int = ASGI_BULK_WORKERS, io_workers: int = ASGI_IO_WORKERS,
+                 max_pending: int = ASGI_MAX_PENDING, bulk_bytes: int = ASGI_BULK_BYTES,
+                 inference_prefixes: Sequence[str] = INFERENCE_PREFIXES):
+        self.wsgi_app = wsgi_app
+        self.name = name
+        self.bulk_bytes = bulk_bytes
+        self.inference_prefixes = tuple(inference_prefixes)
+        self.inference = WorkerPool(f'{name}-inference', inference_workers, max_pending)
+        self.bulk = WorkerPool(f'{name}-bulk', bulk_workers, max_pending)
+        self.io = WorkerPool(f'{name}-io', io_workers, max_pending)
+        self.pools = (self.inference, self.bulk, self.io)
+        _pools.extend(self.pools)
+
+    def pool_for(self, scope) -> WorkerPool:
+        if not scope['path'].startswith(self.inference_prefixes):
+            return self.io
+        if scope['method'] in ('GET', 'HEAD'):
+            return self.inference
+        length = dict(scope.get('headers', [])).get(b'content-length')
+        if length is None or not length.isdigit() or int(length) > self.bulk_bytes:
+            return self.bulk
+        return self.inference
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise RuntimeError(f"{self.name} only serves HTTP, not {scope['type']}")
+
+        pool = self.pool_for(scope)
+        if not pool.try_acquire():
+            return await self._busy(send, pool)
+        try:
+            body = await self._read_body(receive)
+            environ = self._environ(scope, body)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(pool.executor, self._run, environ, loop, send)
+        finally:
+            pool.release()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for pool in self.pools:
+                    pool.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _busy(self, send, pool: WorkerPool):
+        body = json.dumps({'error': f'{pool.name} pool is at capacity ({pool.limit} requests); retry shortly'}).encode()
+        await send({'type': 'http.response.start', 'status': 503, 'headers': [
+            (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+            (b'retry-after', b'1')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _read_body(receive):
+        body = tempfile.SpooledTemporaryFile(max_size=ASGI_SPOOL_BYTES)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    @staticmethod
+    def _environ(scope, body) -> Dict[str, Any]:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        path = scope.get('raw_path') or scope['path'].encode()
+        path = path.split(b'?', 1)[0].decode('latin-1')
+        root = scope.get('root_path', '')
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root,
+            'PATH_INFO': path[len(root):] if root and path.startswith(root) else path,
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+                continue
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run(self, environ, loop, send):
+        """Call the WSGI app on a worker thread, sending the response back through the loop.
+
+        Each chunk waits for the loop to accept it, so streamed responses
+        (``/upload?stream=true``) are produced no faster than the client reads them.
+        """
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: write(data)
+
+        def write(data):
+            if not response.get('sent'):
+                emit({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                response['sent'] = True
+            if data:
+                emit({'type': 'http.response.body', 'body': bytes(data), 'more_body': True})
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        write(chunk)
+                write(b'')
+                emit({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            environ['wsgi.input'].close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'inference': self.inference.stats(), 'bulk': self.bulk.stats(), 'io': self.io.stats()}
@@ -0,0 +1,199 @@
+import atexit
+import collections
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+# Buffering / rotation policy, overridable from the environment
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "100000"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", str(50 * 1024 * 1024)))
+# Rotate at least this often (seconds) even if the file is small; 0 disables time-based rotation
+AUDIT_ROTATE_SECONDS = float(os.getenv("AUDIT_ROTATE_SECONDS", "86400"))
+AUDIT_BACKUP_COUNT = int(os.getenv("AUDIT_BACKUP_COUNT", "5"))
+# 'never' leaves syncing to the OS, 'flush' fsyncs after every batch written
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "never").lower()
+# Wake the flusher early once this many records are waiting
+FLUSH_THRESHOLD = 1000
+
+
+class AuditLogger:
+    """JSON-lines audit log written by a background flusher thread.
+
+    ``log()`` only appends the record to an in-memory ring buffer, so callers on a
+    hot path never touch the file or wait on the GIL-bound encoder. The flusher
+    drains the buffer every ``flush_interval`` seconds (or sooner when it fills
+    up), serializes the batch and writes it with a single ``write`` call. If the
+    buffer overflows before it can be flushed, the oldest records are dropped and
+    counted rather than blocking the caller. A batch whose write fails goes back
+    to the front of the buffer and is retried on the next flush.
+
+    ``write`` is the synchronous variant for callers that must know the record
+    reached the file (e.g. a background sender deciding whether to retry).
+    """
+
+    def __init__(self, path: str, capacity: int = AUDIT_BUFFER_SIZE, flush_interval: float = AUDIT_FLUSH_INTERVAL,
+                 max_bytes: int = AUDIT_MAX_BYTES, rotate_seconds: float = AUDIT_ROTATE_SECONDS,
+                 backup_count: int = AUDIT_BACKUP_COUNT, fsync: str = AUDIT_FSYNC):
+        if fsync not in ('never', 'flush'):
+            raise ValueError(f"fsync policy must be 'never' or 'flush', got {fsync!r}")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.fsync = fsync
+        self.capacity = capacity
+        # deque.append/popleft are atomic, so producers never take a lock
+        self._buffer = collections.deque(maxlen=capacity)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._write_lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+
+    def log(self, event: str, **fields: Any):
+        """Queue one record; returns immediately."""
+        buffer = self._buffer
+        if len(buffer) >= self.capacity:
+            self.dropped += 1
+        buffer.append((time.time(), event, fields))
+        if self._thread is None:
+            self.start()
+        elif len(buffer) >= FLUSH_THRESHOLD:
+            self._wakeup.set()
+
+    def write(self, event: str, **fields: Any):
+        """Write one record now, after anything already buffered; raises if the write fails."""
+        with self._write_lock:
+            self._drain()
+            self._write([self._format(time.time(), event, fields)])
+
+    def start(self) -> 'AuditLogger':
+        with self._write_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log-flusher', daemon=True)
+                self._thread.start()
+        return self
+
+    def flush(self):
+        """Write everything buffered so far (blocks until done)."""
+        with self._write_lock:
+            self._drain()
+
+    def close(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+        with self._write_lock:
+            self._drain()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'path': self.path, 'buffered': len(self._buffer), 'written': self.written, 'dropped': self.dropped}
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self._write_lock:
+                    self._drain()
+            except Exception as e:
+                print(f"⚠️ Audit log flush failed: {e}")
+
+    @staticmethod
+    def _format(ts: float, event: str, fields: Dict[str, Any]) -> str:
+        record = {'ts': datetime.fromtimestamp(ts).isoformat(timespec='milliseconds'), 'event': event}
+        record.update(fields)
+        return json.dumps(record, default=str, ensure_ascii=False)
+
+    def _drain(self):
+        buffer = self._buffer
+        batch = []
+        while True:
+            try:
+                batch.append(buffer.popleft())
+            except IndexError:
+                break
+        if not batch:
+            return
+        try:
+            self._write([self._format(*record) for record in batch])
+        except Exception:
+            self._requeue(batch)
+            raise
+
+    def _requeue(self, batch):
+        # back in front of anything logged since, dropping the oldest if that overflows
+        excess = max(len(batch) + len(self._buffer) - self.capacity, 0)
+        self.dropped += min(excess, len(batch))
+        self._buffer.extendleft(reversed(batch[excess:]))
+
+    def _write(self, lines):
+        try:
+            f = self._open()
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            if self.fsync == 'flush':
+                os.fsync(f.fileno())
+        except Exception:
+            # reopen on the next attempt (the file may have been moved or its disk remounted)
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except Exception:
+                    pass
+                self._file = None
+            raise
+        self.written += len(lines)
+        self._maybe_rotate()
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._opened_at = time.time()
+        return self._file
+
+    def _maybe_rotate(self):
+        too_big = self.max_bytes > 0 and self._file.tell() >= self.max_bytes
+        too_old = self.rotate_seconds > 0 and time.time() - self._opened_at >= self.rotate_seconds
+        if not (too_big or too_old):
+            return
+        self._file.close()
+        self._file = None
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        # app.log -> app.log.1 -> app.log.2 ..., dropping the oldest
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f'{self.path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{i + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+
+_loggers: Dict[str, AuditLogger] = {}
+_loggers_lock = threading.Lock()
+
+
+def get_audit_logger(path: str, **options: Any) -> AuditLogger:
+    """One shared logger (and flusher thread) per file, flushed at interpreter exit."""
+    path = os.path.abspath(path)
+    audit = _loggers.get(path)
+    if audit is None:
+        with _loggers_lock:
+            audit = _loggers.get(path)
+            if audit is None:
+                audit = _loggers[path] = AuditLogger(path, **options)
+                atexit.register(audit.close)
+    return audit
@@ -0,0 +1,470 @@
+"""End-to-end benchmarks for the scoring, persistence and notification paths.
+
+Runs headless. Both Flask apps are driven through their test clients. SMTP and
+Twilio are replaced by stub senders, so nothing leaves the machine. Every
+database, audit log and state file goes to a temp directory. The data comes from
+synthetic generators matching the loan dataset and transaction2.csv schemas.
+
+Measured:
+    loan_predict_single        /predict latency per JSON application (p50/p90/p99)
+    loan_predict_batch         /predict CSV throughput at several batch sizes
+    fraud_score_single         /score latency (feature store, graph, batcher, pipeline)
+    fraud_upload_batch         /upload CSV throughput at several batch sizes
+    pipeline_process           Pipeline_fixed.process_transaction latency, fraud and clean
+    sqlite_insert              rejected_applications insert rate, with and without queued emails
+    outbox_drain               notification outbox delivery rate through the stub sender
+Each benchmark also records the process's peak RSS so far.
+
+Results are one JSON document. ``--compare`` diffs two of them and exits non-zero
+when a metric regressed by more than ``--threshold``.
+
+Usage:
+    python benchmark.py [-o bench.json] [--quick] [--only loan_predict_single,sqlite_insert]
+    python benchmark.py --compare base.json head.json [--threshold 0.15]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from importlib import metadata
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# transaction2.csv, with the identifier/timestamp columns as the notebook's label-encoded codes
+TRANSACTION_COLUMNS = [
+    'Timestamp', 'Sender_Bank', 'Sender_Account', 'Receiver_Bank', 'Receiver_Account', 'Amount_Received',
+    'Receiving_Currency', 'Amount_Paid', 'Payment_Currency', 'Payment_Format', 'Is_Laundering',
+    'Transaction_Difference', 'Transaction_Difference_Percentage', 'log_Amount_Received', 'log_Amount_Paid',
+    'Rolling_Mean_Amount_7D', 'Rolling_Std_Amount_7D', 'Hour', 'Day_of_Week', 'Is_Weekend',
+    'Num_Transactions_30D', 'Avg_Transaction_30D', 'Degree_Centrality', 'PageRank_Score',
+    'Cross_Currency_Transaction', 'Time_Diff', 'Is_Burst', 'Z_Score_Amount', 'Is_Anomalous_Amount',
+    'Is_Circular', 'Currency_Arbitrage',
+] + [f'GNN_Embedding_{i}' for i in range(1, 17)]
+# Synthetic amounts are lognormal; standardized with the population mean/std, so a row
+# doesn't depend on the batch it was generated in
+AMOUNT_MU, AMOUNT_SIGMA = 7.0, 1.5
+AMOUNT_MEAN = float(np.exp(AMOUNT_MU + AMOUNT_SIGMA ** 2 / 2))
+AMOUNT_STD = float(np.sqrt(np.expm1(AMOUNT_SIGMA ** 2)) * AMOUNT_MEAN)
+
+
+def synthetic_loan_applications(n: int, seed: int = 0, labels: bool = False) -> pd.DataFrame:
+    """Loan applications in the ranges of loan_approval_dataset.csv (plus name and email).
+
+    With ``labels``, ``loan_status`` ('Approved'/'Rejected') is drawn mostly from
+    the CIBIL score and loan-to-income ratio, like the real data.
+    """
+    rng = np.random.default_rng(seed)
+    income = rng.integers(2, 100, n) * 100000
+    loan = np.clip(income * rng.uniform(1.5, 4.0, n), 300000, 39500000).round(-5)
+    cibil = rng.integers(300, 901, n)
+    df = pd.DataFrame({
+        'loan_id': np.arange(1, n + 1),
+        'no_of_dependents': rng.integers(0, 6, n),
+        'education': rng.choice(['Graduate', 'Not Graduate'], n),
+        'self_employed': rng.choice(['Yes', 'No'], n),
+        'income_annum': income,
+        'loan_amount': loan.astype(np.int64),
+        'loan_term': rng.integers(1, 11, n) * 2,
+        'cibil_score': cibil,
+        'residential_assets_value': (income * rng.uniform(0, 3, n)).round(-5).astype(np.int64),
+        'commercial_assets_value': (income * rng.uniform(0, 2, n)).round(-5).astype(np.int64),
+        'luxury_assets_value': (income * rng.uniform(0.5, 4, n)).round(-5).astype(np.int64),
+        'bank_asset_value': (income * rng.uniform(0, 1.5, n)).round(-5).astype(np.int64),
+        'applicant_name': [f'Applicant {i}' for i in range(1, n + 1)],
+        'email': [f'applicant{i}@example.com' for i in range(1, n + 1)],
+    })
+    if labels:
+        score = (cibil - 550) / 60 - (loan / income - 2.75) + rng.normal(0, 0.5, n)
+        df['loan_status'] = np.where(score > 0, 'Approved', 'Rejected')
+    return df
+
+
+def synthetic_transactions(n: int, seed: int = 0, labels: bool = False, accounts: int = 5000) -> pd.DataFrame:
+    """Transactions with the columns of transaction2.csv, already encoded as the model expects."""
+    rng = np.random.default_rng(seed)
+    paid = rng.lognormal(AMOUNT_MU, AMOUNT_SIGMA, n)
+    received = paid * rng.choice([1.0, 1.0, 1.0, rng.uniform(0.9, 1.1)], n)
+    timestamps = 1662000000 + np.sort(rng.integers(0, 30 * 86400, n))
+    hours = (timestamps // 3600) % 24
+    days = (timestamps // 86400 + 3) % 7
+    sender = rng.integers(0, accounts, n)
+    receiver = rng.integers(0, accounts, n)
+    pay_currency = rng.integers(0, 15, n)
+    recv_currency = np.where(rng.random(n) < 0.9, pay_currency, rng.integers(0, 15, n))
+    z = (paid - AMOUNT_MEAN) / AMOUNT_STD
+    data = {
+        'Timestamp': timestamps, 'Sender_Bank': rng.integers(1, 3000, n), 'Sender_Account': sender,
+        'Receiver_Bank': rng.integers(1, 3000, n), 'Receiver_Account': receiver,
+        'Amount_Received': (received - AMOUNT_MEAN) / AMOUNT_STD, 'Receiving_Currency': recv_currency,
+        'Amount_Paid': z, 'Payment_Currency': pay_currency, 'Payment_Format': rng.integers(0, 7, n),
+        'Is_Laundering': (rng.random(n) < 0.01).astype(np.int64),
+        'Transaction_Difference': (received - paid) / AMOUNT_STD,
+        'Transaction_Difference_Percentage': (received - paid) / paid,
+        'log_Amount_Received': np.log1p(received), 'log_Amount_Paid': np.log1p(paid),
+        'Rolling_Mean_Amount_7D': z + rng.normal(0, 0.1, n), 'Rolling_Std_Amount_7D': np.abs(rng.normal(0, 1, n)),
+        'Hour': hours, 'Day_of_Week': days, 'Is_Weekend': (days >= 5).astype(np.int64),
+        'Num_Transactions_30D': rng.normal(0, 1, n), 'Avg_Transaction_30D': rng.lognormal(7, 1, n),
+        'Degree_Centrality': rng.normal(0, 1, n), 'PageRank_Score': rng.normal(0, 1, n),
+        'Cross_Currency_Transaction': (pay_currency != recv_currency).astype(np.int64),
+        'Time_Diff': rng.exponential(3600, n), 'Is_Burst': (rng.random(n) < 0.05).astype(np.int64),
+        'Z_Score_Amount': z, 'Is_Anomalous_Amount': (np.abs(z) > 3).astype(np.int64),
+        'Is_Circular': (sender == receiver).astype(np.int64), 'Currency_Arbitrage': (rng.random(n) < 0.01).astype(np.int64),
+    }
+    for i in range(1, 17):
+        data[f'GNN_Embedding_{i}'] = rng.normal(0, 0.5, n)
+    df = pd.DataFrame(data, columns=TRANSACTION_COLUMNS)
+    return df if labels else df.drop(columns=['Is_Laundering'])
+
+
+class StubSender:
+    """Stands in for SMTP/Twilio: counts deliveries, optionally sleeping like a remote call."""
+
+    latency = 0.0
+    delivered: Counter = Counter()
+    _lock = threading.Lock()
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    @classmethod
+    def factory(cls, kind: str) -> Callable[[], 'StubSender']:
+        return lambda: cls(kind)
+
+    def send(self, payload):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            StubSender.delivered[self.kind] += 1
+
+    def close(self):
+        pass
+
+
+def isolate(workdir: str, smtp_latency_ms: float = 0.0):
+    """Point every database, log and state file at ``workdir`` and swap in the stub senders.
+
+    Must run before the apps are imported: they open their stores at import time.
+    """
+    os.environ.update({
+        'NOTIFY_DB_PATH': os.path.join(workdir, 'notification_outbox.db'),
+        'FRAUD_AUDIT_LOG': os.path.join(workdir, 'fraud_audit.log'),
+        'EMAIL_LOG_FILE': os.path.join(workdir, 'rejection_emails.log'),
+        'FEATURE_STORE_PATH': os.path.join(workdir, 'feature_store.npz'),
+        'GRAPH_STATE_PATH': os.path.join(workdir, 'graph_state.col'),
+        'GCN_GRAPH_PATH': os.path.join(workdir, 'gcn_graph.col'),
+        'EMBEDDING_STORE_PATH': os.path.join(workdir, 'gnn_embeddings.col'),
+        # configured channels so alerts are queued; delivery goes to StubSender
+        'EMAIL_HOST': 'smtp.invalid', 'EMAIL_PORT': '587', 'EMAIL_USER': 'bench', 'EMAIL_PASS': 'bench',
+        'NOTIFY_EMAIL': 'alerts@example.com', 'TWILIO_ACCOUNT_SID': 'bench', 'TWILIO_AUTH_TOKEN': 'bench',
+        'TWILIO_FROM': '+10000000000', 'NOTIFY_PHONE': '+10000000001',
+        'OUTBOX_RATE_PER_SEC': '0', 'OUTBOX_POLL_INTERVAL': '0.05',
+    })
+    StubSender.latency = smtp_latency_ms / 1000
+
+    import rejection_handler
+    rejection_handler.DB_PATH = os.path.join(workdir, 'rejected_applications.db')
+    rejection_handler.RejectionEmailSender = StubSender.factory('rejection_email')
+
+    import Pipeline_fixed
+    Pipeline_fixed.FraudEmailSender = StubSender.factory('fraud_email')
+    Pipeline_fixed.FraudSmsSender = StubSender.factory('fraud_sms')
+    Pipeline_fixed.TWILIO_AVAILABLE = True
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, float]:
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        'n': int(len(ms)),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def csv_upload(df: pd.DataFrame) -> Dict[str, Any]:
+    return {'file': (io.BytesIO(df.to_csv(index=False).encode()), 'batch.csv')}
+
+
+def timed_batches(post: Callable[[pd.DataFrame], Any], make: Callable[[int, int], pd.DataFrame],
+                  sizes: Sequence[int], min_seconds: float) -> Dict[str, Dict[str, float]]:
+    """rows/sec per batch size; each size repeats until ``min_seconds`` have passed (at least twice)."""
+    out = {}
+    for size in sizes:
+        batches = [make(size, seed) for seed in range(3)]
+        post(batches[0])  # warm-up
+        elapsed, rows, calls = 0.0, 0, 0
+        while calls < 2 or elapsed < min_seconds:
+            started = time.perf_counter()
+            post(batches[calls % len(batches)])
+            elapsed += time.perf_counter() - started
+            rows += size
+            calls += 1
+        out[str(size)] = {'rows_per_sec': round(rows / elapsed, 1), 'ms_per_batch': round(elapsed / calls * 1000, 3)}
+    return out
+
+
+def expect_ok(response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:300]}')
+    return response
+
+
+def bench_loan_predict_single(cfg) -> Dict[str, Any]:
+    import loan_api
+    client = loan_api.app.test_client()
+    records = synthetic_loan_applications(cfg.single, seed=1).to_dict('records')
+    for record in records[:20]:
+        expect_ok(client.post('/predict', json=record))
+    samples, approved = [], 0
+    for record in records:
+        started = time.perf_counter()
+        response = expect_ok(client.post('/predict', json=record))
+        samples.append(time.perf_counter() - started)
+        approved += response.get_json()[0]['approved']
+    return {**latency_summary(samples), 'approved_fraction': round(approved / len(records), 3)}
+
+
+def bench_loan_predict_batch(cfg) -> Dict[str, Any]:
+    import loan_api
+    client = loan_api.app.test_client()
+    post = lambda df: expect_ok(client.post('/predict', data=csv_upload(df), content_type='multipart/form-data'))
+    return timed_batches(post, lambda n, seed: synthetic_loan_applications(n, seed=seed), cfg.sizes, cfg.min_seconds)
+
+
+def bench_fraud_score_single(cfg) -> Dict[str, Any]:
+    import app as fraud_app
+    client = fraud_app.app.test_client()
+    df = synthetic_transactions(cfg.single, seed=2)
+    # rolling, graph and embedding features come from the live stores
+    live = ['Rolling_Mean_Amount_7D', 'Rolling_Std_Amount_7D', 'Num_Transactions_30D', 'Avg_Transaction_30D',
+            'Time_Diff', 'Is_Burst', 'Degree_Centrality', 'PageRank_Score']
+    # the synthetic Timestamp codes are epoch seconds, so they double as the window clock
+    records = df.drop(columns=live).assign(event_time=df['Timestamp']).to_dict('records')
+    samples, flagged = [], 0
+    for record in records:
+        started = time.perf_counter()
+        response = expect_ok(client.post('/score', json=record))
+        samples.append(time.perf_counter() - started)
+        flagged += response.get_json()['fraud']
+    return {**latency_summary(samples), 'fraud_fraction': round(flagged / len(records), 3)}
+
+
+def bench_fraud_upload_batch(cfg) -> Dict[str, Any]:
+    import app as fraud_app
+    client = fraud_app.app.test_client()
+    post = lambda df: expect_ok(client.post('/upload', data=csv_upload(df), content_type='multipart/form-data'))
+    return timed_batches(post, lambda n, seed: synthetic_transactions(n, seed=seed), cfg.sizes, cfg.min_seconds)
+
+
+def bench_pipeline_process(cfg) -> Dict[str, Any]:
+    from Pipeline_fixed import process_transaction
+    records = synthetic_transactions(cfg.single, seed=3).to_dict('records')
+    out = {}
+    for name, flag in (('fraud', 1), ('clean', 0)):
+        samples = []
+        for record in records:
+            started = time.perf_counter()
+            process_transaction(record, fraud_flag=flag, fraud_probability=0.9 if flag else 0.1)
+            samples.append(time.perf_counter() - started)
+        out[name] = latency_summary(samples)
+    return out
+
+
+def bench_sqlite_insert(cfg) -> Dict[str, Any]:
+    from rejection_handler import save_rejected_applications_bulk
+    out = {}
+    for with_email in (False, True):
+        def post(df):
+            names = df['applicant_name'] if with_email else None
+            save_rejected_applications_bulk(df, np.full(len(df), 0.8), df['email'], names=names)
+        key = 'with_outbox' if with_email else 'rows_only'
+        out[key] = timed_batches(post, lambda n, seed: synthetic_loan_applications(n, seed=seed),
+                                 [s for s in cfg.sizes if s <= 10000], cfg.min_seconds)
+    return out
+
+
+def bench_outbox_drain(cfg) -> Dict[str, Any]:
+    from rejection_handler import get_outbox
+    outbox = get_outbox()
+    # let earlier benchmarks' messages finish first
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        stats = outbox.stats()
+        if not stats.get('pending', 0) and not stats.get('sending', 0):
+            break
+        time.sleep(0.05)
+    n = cfg.messages
+    target = StubSender.delivered['rejection_email'] + n
+    started = time.perf_counter()
+    outbox.enqueue_many(('rejection_email', {'name': f'Applicant {i}', 'email': f'a{i}@example.com',
+                                             'data': {}, 'probability': 0.8}, None) for i in range(n))
+    while StubSender.delivered['rejection_email'] < target:
+        if time.perf_counter() - started > 300:
+            raise RuntimeError(f"outbox delivered {n - (target - StubSender.delivered['rejection_email'])}/{n} in 300s")
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    return {'messages': n, 'seconds': round(elapsed, 3), 'messages_per_sec': round(n / elapsed, 1),
+            'workers': outbox.workers, 'smtp_latency_ms': StubSender.latency * 1000}
+
+
+BENCHMARKS = {
+    'loan_predict_single': bench_loan_predict_single,
+    'loan_predict_batch': bench_loan_predict_batch,
+    'fraud_score_single': bench_fraud_score_single,
+    'fraud_upload_batch': bench_fraud_upload_batch,
+    'pipeline_process': bench_pipeline_process,
+    'sqlite_insert': bench_sqlite_insert,
+    'outbox_drain': bench_outbox_drain,
+}
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    versions = {}
+    for package in ('numpy', 'pandas', 'scikit-learn', 'xgboost', 'flask'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'versions': versions, 'started_at': datetime.now().isoformat(timespec='seconds')}
+
+
+def run(names: Sequence[str], cfg) -> Dict[str, Any]:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        isolate(workdir, cfg.smtp_latency_ms)
+        for name in names:
+            started = time.perf_counter()
+            result = BENCHMARKS[name](cfg)
+            result['peak_rss_mb'] = peak_rss_mb()
+            results[name] = result
+            print(f"✅ {name} ({time.perf_counter() - started:.1f}s): {json.dumps(result)}")
+    return results
+
+
+def flatten(tree: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in tree.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def higher_is_better(metric: str):
+    """True/False for throughput/latency-style metrics, None for descriptive ones (n, fractions, ...)."""
+    leaf = metric.rsplit('.', 1)[-1]
+    if leaf.endswith('per_sec'):
+        return True
+    if leaf.endswith('_ms') and leaf not in ('smtp_latency_ms',) or leaf in ('seconds', 'peak_rss_mb'):
+        return False
+    return None
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a metric-by-metric diff; returns the regressed metrics."""
+    old, new = flatten(base['results']), flatten(head['results'])
+    print(f"{'metric':<55}{'base':>12}{'head':>12}{'change':>9}")
+    regressions = []
+    for metric in sorted(set(old) & set(new)):
+        direction = higher_is_better(metric)
+        if direction is None:
+            continue
+        a, b = old[metric], new[metric]
+        change = (b - a) / a if a else 0.0
+        worse = -change if direction else change
+        flag = ''
+        if worse > threshold:
+            flag = '  ❌ regression'
+            regressions.append(metric)
+        elif worse < -threshold:
+            flag = '  ✅ faster' if 'rss' not in metric else '  ✅ smaller'
+        print(f"{metric:<55}{a:>12g}{b:>12g}{change:>+9.1%}{flag}")
+    only = sorted(set(old) ^ set(new))
+    if only:
+        print(f"⚠️ {len(only)} metrics present in only one run (e.g. {only[0]})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', help='write results JSON here (default: stdout only)')
+    parser.add_argument('--only', help='comma-separated benchmarks to run: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help='fewer requests and smaller batches')
+    parser.add_argument('--single', type=int, help='requests per single-row latency benchmark')
+    parser.add_argument('--sizes', help='comma-separated batch sizes')
+    parser.add_argument('--messages', type=int, help='messages for outbox_drain')
+    parser.add_argument('--min-seconds', type=float, help='minimum timed seconds per batch size')
+    parser.add_argument('--smtp-latency-ms', type=float, default=0.0, help='simulated per-message send time')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='diff two result files')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative change counted as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            head = json.load(f)
+        print(f"base {base['environment'].get('commit')}  vs  head {head['environment'].get('commit')}")
+        regressions = compare(base, head, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print('✅ No regressions')
+        return
+
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    args.single = args.single or (100 if args.quick else 500)
+    args.sizes = [int(s) for s in args.sizes.split(',')] if args.sizes else (
+        [1, 100, 1000] if args.quick else [1, 10, 100, 1000, 10000])
+    args.messages = args.messages or (200 if args.quick else 2000)
+    args.min_seconds = args.min_seconds if args.min_seconds is not None else (0.2 if args.quick else 1.0)
+
+    report = {'environment': environment(),
+              'config': {k: getattr(args, k) for k in ('single', 'sizes', 'messages', 'min_seconds', 'smtp_latency_ms')}}
+    report['results'] = run(names, args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"✅ Results written to {args.output}")
+    else:
+        print(text)
+    # skip the apps' atexit hooks: they would save state into the already removed temp dir
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
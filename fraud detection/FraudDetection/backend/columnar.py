@@ -0,0 +1,85 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+MAGIC = b'FDCOLS1\n'
+# Column data starts on cache-line boundaries so mapped arrays are aligned
+ALIGN = 64
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_columns(path: str, columns: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None):
+    """Write named arrays to one file that ``ColumnarFile`` can memory-map.
+
+    Layout: magic, 8-byte header length, JSON header (dtype/shape/offset per
+    column plus ``meta``), then each column's raw C-order bytes. The file is
+    written to a temp name and renamed, so readers never see a partial file.
+    """
+    arrays = {name: np.ascontiguousarray(values) for name, values in columns.items()}
+    # dtype.str keeps the byte order ('<f4') and fixed-width byte strings ('|S12')
+    entries, offset = {}, 0
+    for name, values in arrays.items():
+        entries[name] = {'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset}
+        offset = _aligned(offset + values.nbytes)
+
+    header = json.dumps({'columns': entries, 'meta': meta or {}}).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, values in arrays.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(values.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+class ColumnarFile:
+    """Read-only, memory-mapped view of a file written by ``write_columns``.
+
+    Columns are numpy views into one shared mapping, so opening a file costs a
+    header parse and pages are only read from disk when they are touched.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a columnar feature file')
+            header_len = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_len))
+        data_start = _aligned(len(MAGIC) + 8 + header_len)
+
+        self.meta: Dict[str, Any] = header['meta']
+        self._raw = np.memmap(path, dtype=np.uint8, mode='r')
+        self.columns: Dict[str, np.ndarray] = {}
+        for name, entry in header['columns'].items():
+            dtype = np.dtype(entry['dtype'])
+            shape = tuple(entry['shape'])
+            start = data_start + entry['offset']
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            self.columns[name] = self._raw[start:start + nbytes].view(dtype).reshape(shape)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def close(self):
+        # the mapping is unmapped once the last view onto it is garbage collected
+        self.columns = {}
+        self._raw = None
+
+
+def encode_keys(keys) -> np.ndarray:
+    """Account identifiers as fixed-width UTF-8 byte strings (sortable, mappable)."""
+    return np.char.encode(np.asarray(keys).astype(str), 'utf-8')
@@ -0,0 +1,101 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Pool sizing / lock waiting, overridable from the environment
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+# sqlite3 keeps this many prepared statements per connection; since connections are
+# reused and our SQL strings are constants, each statement is only compiled once
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections in WAL mode.
+
+    WAL lets readers run alongside a writer, and the busy timeout makes writers
+    queue on the lock instead of failing with "database is locked". Connections
+    are in autocommit mode; use ``transaction()`` to group writes.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, timeout=BUSY_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            # same exception sqlite raises when its own busy timeout runs out
+            raise sqlite3.OperationalError(
+                f'Connection pool for {self.path} exhausted: all {self.size} connections '
+                f'stayed busy for {self.timeout:g}s (raise DB_POOL_SIZE or DB_BUSY_TIMEOUT)') from None
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the ``with`` block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection inside a write transaction, committed on success."""
+        with self.connection() as conn:
+            # IMMEDIATE takes the write lock up front so two writers can't deadlock on upgrade
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.commit()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
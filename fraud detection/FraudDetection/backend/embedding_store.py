@@ -0,0 +1,271 @@
+"""Serving-time lookup of the notebook's GNN node embeddings.
+
+The notebook trains a GCN and writes one 16-dim embedding per account to
+GNN_Node_Embeddings.csv, which is then merged onto transactions by
+Sender_Account. Here that CSV is compiled into a columnar file holding the
+float32 embedding matrix, the account keys and an open-addressing hash table
+(account -> row). Keys are the file's raw account IDs, not the model's
+label-encoded ``sender_account`` codes, so callers look accounts up by ID. Opening the file parses a JSON header and memory-maps the
+rest. Lookups are vectorized over whole uploads.
+
+Each rebuild writes ``gnn_embeddings.<version>.col`` next to the live file, then
+publishes it by swapping the live file atomically. The model registry picks the new
+version up without a restart.
+
+Usage:
+    python embedding_store.py GNN_Node_Embeddings.csv [-o gnn_embeddings.col]
+    python embedding_store.py --list
+    python embedding_store.py --publish VERSION     # roll back/forward to a kept version
+"""
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from columnar import ColumnarFile, write_columns
+from feature_schema import account_keys
+
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", os.path.join(os.path.dirname(__file__), 'gnn_embeddings.col'))
+# Vector for accounts without an embedding: 'nan' (what the notebook's left merge gives,
+# and XGBoost treats as missing), 'zeros', 'mean', or comma-separated values
+EMBEDDING_DEFAULT = os.getenv("EMBEDDING_DEFAULT", "nan")
+# Old versions kept next to the live file for rollback
+EMBEDDING_KEEP_VERSIONS = int(os.getenv("EMBEDDING_KEEP_VERSIONS", "3"))
+
+ACCOUNT_COLUMN = 'Sender_Account'
+EMBEDDING_PREFIX = 'GNN_Embedding_'
+
+# 64-bit FNV-1a
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def hash_keys(keys: np.ndarray) -> np.ndarray:
+    """FNV-1a of each fixed-width byte key, vectorized over keys.
+
+    Zero bytes are skipped, so a key hashes the same whatever width its array is padded to.
+    """
+    keys = np.ascontiguousarray(keys)
+    width = keys.dtype.itemsize
+    raw = keys.view(np.uint8).reshape(len(keys), width)
+    h = np.full(len(keys), FNV_OFFSET, dtype=np.uint64)
+    for j in range(width):
+        byte = raw[:, j].astype(np.uint64)
+        h = np.where(byte != 0, (h ^ byte) * FNV_PRIME, h)
+    return h
+
+
+def build_table(keys: np.ndarray) -> np.ndarray:
+    """Linear-probing table of row numbers (-1 = empty), at most half full."""
+    size = 1 << max(4, int(2 * len(keys) - 1).bit_length())
+    mask = np.uint64(size - 1)
+    table = np.full(size, -1, dtype=np.int32)
+    slots = hash_keys(keys) & mask
+    pending = np.arange(len(keys))
+    # each round, every still-unplaced key claims its slot if free (first key wins), else moves one on
+    while len(pending):
+        candidate = slots[pending].astype(np.int64)
+        free = table[candidate] == -1
+        claimed, first = np.unique(candidate[free], return_index=True)
+        winners = pending[free][first]
+        table[claimed] = winners
+        placed = np.zeros(len(pending), dtype=bool)
+        placed[np.flatnonzero(free)[first]] = True
+        pending = pending[~placed]
+        slots[pending] = (slots[pending] + np.uint64(1)) & mask
+    return table
+
+
+def file_version(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def versioned_path(path: str, version: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f'{root}.{version}{ext}'
+
+
+def publish(versioned: str, path: str = EMBEDDING_STORE_PATH):
+    """Make ``versioned`` the live store with an atomic rename (hard link, or a copy where unsupported)."""
+    tmp = f'{path}.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(versioned, tmp)
+    except OSError:
+        shutil.copyfile(versioned, tmp)
+    os.replace(tmp, path)
+
+
+def list_versions(path: str = EMBEDDING_STORE_PATH):
+    """Kept versions as (version, path, meta), newest first."""
+    root, ext = os.path.splitext(path)
+    versions = []
+    for candidate in glob.glob(f'{glob.escape(root)}.*{ext}'):
+        version = candidate[len(root) + 1:len(candidate) - len(ext)]
+        if '.' in version:
+            continue
+        meta = ColumnarFile(candidate).meta
+        versions.append((version, candidate, meta))
+    versions.sort(key=lambda v: v[2].get('built_at', ''), reverse=True)
+    return versions
+
+
+def build_store(csv_path: str, path: str = EMBEDDING_STORE_PATH, keep: int = EMBEDDING_KEEP_VERSIONS) -> str:
+    """Compile the notebook's GNN_Node_Embeddings.csv into a new store version and publish it."""
+    version = file_version(csv_path)
+    df = pd.read_csv(csv_path, dtype={ACCOUNT_COLUMN: str})
+    columns = sorted((c for c in df.columns if c.startswith(EMBEDDING_PREFIX)),
+                     key=lambda c: int(c[len(EMBEDDING_PREFIX):]))
+    if ACCOUNT_COLUMN not in df.columns or not columns:
+        raise ValueError(f'{csv_path} needs {ACCOUNT_COLUMN} and {EMBEDDING_PREFIX}N columns')
+
+    duplicated = df[ACCOUNT_COLUMN].duplicated()
+    if duplicated.any():
+        print(f"⚠️ {int(duplicated.sum())} duplicate accounts in {csv_path}; keeping the first row of each")
+        df = df[~duplicated]
+
+    keys = account_keys(df[ACCOUNT_COLUMN].to_numpy())
+    vectors = df[columns].to_numpy(dtype=np.float32)
+    target = versioned_path(path, version)
+    write_columns(target, {
+        'account': keys,
+        'vectors': vectors,
+        'table': build_table(keys),
+        'mean': np.nanmean(vectors, axis=0).astype(np.float32) if len(vectors) else np.zeros(len(columns), np.float32),
+    }, meta={
+        'version': version, 'source': os.path.basename(csv_path), 'rows': len(keys),
+        'dim': len(columns), 'columns': columns, 'built_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    publish(target, path)
+
+    for _, old, _ in list_versions(path)[max(keep, 1):]:
+        os.remove(old)
+    return version
+
+
+class EmbeddingStore:
+    """Memory-mapped account -> embedding table written by ``build_store``."""
+
+    def __init__(self, path: str = EMBEDDING_STORE_PATH, default: str = EMBEDDING_DEFAULT):
+        self.file = ColumnarFile(path)
+        self.meta = self.file.meta
+        self.version = self.meta.get('version')
+        self.keys = self.file['account']
+        self.vectors = self.file['vectors']
+        self.table = self.file['table']
+        self.dim = self.vectors.shape[1]
+        self._mask = np.uint64(len(self.table) - 1)
+        self.default = self._default_vector(default)
+
+    def _default_vector(self, default) -> np.ndarray:
+        if not isinstance(default, str):
+            vector = np.asarray(default, dtype=np.float32)
+        elif default == 'nan':
+            vector = np.full(self.dim, np.nan, dtype=np.float32)
+        elif default == 'zeros':
+            vector = np.zeros(self.dim, dtype=np.float32)
+        elif default == 'mean':
+            vector = np.array(self.file['mean'], dtype=np.float32)
+        else:
+            vector = np.array([float(v) for v in default.split(',')], dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ValueError(f'Default embedding must have {self.dim} values, got {vector.size}')
+        return vector
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, accounts) -> np.ndarray:
+        """Row per account, -1 for accounts without an embedding."""
+        queries = account_keys(accounts)
+        out = np.full(len(queries), -1, dtype=np.int64)
+        if not len(self.keys) or not len(queries):
+            return out
+        # keys longer than any stored key can't match (and must not be truncated into one)
+        fits = np.char.str_len(queries) <= self.keys.dtype.itemsize
+        pending = np.flatnonzero(fits)
+        queries = queries.astype(self.keys.dtype)
+        slots = hash_keys(queries[pending]) & self._mask
+        while len(pending):
+            row = self.table[slots.astype(np.int64)].astype(np.int64)
+            occupied = row >= 0
+            match = occupied.copy()
+            match[occupied] = self.keys[row[occupied]] == queries[pending[occupied]]
+            out[pending[match]] = row[match]
+            # probing stops at a match or an empty slot
+            again = occupied & ~match
+            pending, slots = pending[again], (slots[again] + np.uint64(1)) & self._mask
+        return out
+
+    def lookup(self, accounts, fallback: Optional[Callable] = None) -> np.ndarray:
+        """(n, dim) float32 embeddings; accounts without one get the default vector.
+
+        ``fallback(accounts)`` is asked first for accounts not in the store (e.g.
+        ``InductiveGCN.embed``); rows it returns as NaN still get the default.
+        """
+        accounts = np.asarray(accounts)
+        rows = self.rows(accounts)
+        known = rows >= 0
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        out[known] = self.vectors[rows[known]]
+        out[~known] = self.default
+        if fallback is not None and not known.all():
+            unknown = np.flatnonzero(~known)
+            # pass normalized keys, so float-parsed upload columns (12.0) match accounts seen as 12
+            computed = fallback(np.char.decode(account_keys(accounts[unknown]), 'utf-8'))
+            found = ~np.isnan(computed).any(axis=1)
+            out[unknown[found]] = computed[found]
+        return out
+
+    def get(self, account) -> Optional[np.ndarray]:
+        row = self.rows([account])[0]
+        return np.array(self.vectors[row]) if row >= 0 else None
+
+    def describe(self) -> Dict[str, object]:
+        return {'version': self.version, 'accounts': len(self), 'dim': self.dim,
+                'built_at': self.meta.get('built_at'), 'source': self.meta.get('source')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', nargs='?', help='GNN_Node_Embeddings.csv from the notebook')
+    parser.add_argument('-o', '--output', default=EMBEDDING_STORE_PATH, help='live store path')
+    parser.add_argument('--keep', type=int, default=EMBEDDING_KEEP_VERSIONS, help='versions to keep')
+    parser.add_argument('--list', action='store_true', help='list kept versions')
+    parser.add_argument('--publish', metavar='VERSION', help='make a kept version live')
+    args = parser.parse_args()
+
+    if args.list:
+        live = EmbeddingStore(args.output).version if os.path.exists(args.output) else None
+        for version, _, meta in list_versions(args.output):
+            marker = '*' if version == live else ' '
+            print(f"{marker} {version}  {meta.get('built_at')}  {meta.get('rows')} accounts  from {meta.get('source')}")
+        return
+    if args.publish:
+        publish(versioned_path(args.output, args.publish), args.output)
+        print(f"✅ Embedding store version {args.publish} is live at {args.output}")
+        return
+    if not args.input:
+        parser.error('input CSV is required unless --list or --publish is given')
+
+    start = time.perf_counter()
+    version = build_store(args.input, args.output, keep=args.keep)
+    store = EmbeddingStore(args.output)
+    print(f"✅ Embedding store version {version}: {len(store)} accounts x {store.dim} dims "
+          f"written to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
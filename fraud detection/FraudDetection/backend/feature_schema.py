@@ -0,0 +1,236 @@
+import csv
+import io
+import re
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from columnar import encode_keys
+
+EMBEDDING_FEATURES = [f"gnn_embedding_{i}" for i in range(1, 17)]
+
+# Features the fraud model was trained on, in the column order of the notebook's training
+# frame (Merged_Behavioral_GNN_Features.csv without Is_Laundering). Identifier and timestamp
+# columns are label-encoded in the notebook, so they arrive here as numeric codes.
+FRAUD_FEATURES = [
+    'timestamp', 'sender_bank', 'sender_account', 'receiver_bank', 'receiver_account',
+    'amount_received', 'receiving_currency', 'amount_paid', 'payment_currency',
+    'payment_format', 'transaction_difference', 'transaction_difference_percentage',
+    'log_amount_received', 'log_amount_paid', 'rolling_mean_amount_7d',
+    'rolling_std_amount_7d', 'hour', 'day_of_week', 'is_weekend',
+    'num_transactions_30d', 'avg_transaction_30d', 'degree_centrality',
+    'pagerank_score', 'cross_currency_transaction', 'time_diff', 'is_burst',
+    'z_score_amount', 'is_anomalous_amount', 'is_circular', 'currency_arbitrage'
+] + EMBEDDING_FEATURES
+# Label column of the training frame
+FRAUD_LABEL = 'is_laundering'
+
+# Raw account IDs (not model features) for the model's label-encoded account codes. The
+# embedding store, the graphs and the rolling windows are keyed by the raw IDs of the
+# historical data, so a code alone never matches them.
+ACCOUNT_ID_FIELDS = {'sender_account': 'sender_id', 'receiver_account': 'receiver_id'}
+# Non-feature fields a transaction may carry: the raw account IDs and the raw event time
+CONTEXT_FIELDS = ('sender_id', 'receiver_id', 'event_time')
+
+
+def normalize_column(name) -> str:
+    """Canonical header form: 'Amount_Paid', ' amount paid' and 'AMOUNT-PAID' all become 'amount_paid'."""
+    return re.sub(r'[\s\-]+', '_', str(name).strip()).lower()
+
+
+def account_key(account) -> str:
+    """One account identifier as the key per-account state uses; 12.0 keys the same as 12."""
+    if isinstance(account, (float, np.floating)):
+        if np.isfinite(account) and float(account).is_integer():
+            return str(int(account))
+    elif not isinstance(account, (str, int, np.integer)):
+        raise ValueError(f'Account identifiers must be strings or numbers, got {account!r}')
+    return str(account)
+
+
+def account_keys(accounts) -> np.ndarray:
+    """Account identifiers as byte-string keys; integral floats (12.0) key the same as ints (12)."""
+    values = np.asarray(accounts)
+    if values.dtype.kind == 'f':
+        integral = np.isfinite(values) & (values == np.round(values))
+        if integral.all():
+            values = values.astype(np.int64)
+    return encode_keys(values)
+
+
+def split_context(record: Dict[str, object]):
+    """(feature fields, context fields keyed by normalized name) of one JSON transaction."""
+    fields, context = {}, {}
+    for key, value in record.items():
+        name = normalize_column(key)
+        if name in CONTEXT_FIELDS:
+            context[name] = value
+        else:
+            fields[key] = value
+    return fields, context
+
+
+class SchemaError(ValueError):
+    """Raised when an input's columns don't match the feature schema."""
+
+    def __init__(self, message: str, missing: Sequence[str] = (), extra: Sequence[str] = (),
+                 non_numeric: Sequence[str] = ()):
+        super().__init__(message)
+        self.missing = list(missing)
+        self.extra = list(extra)
+        self.non_numeric = list(non_numeric)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            'error': str(self),
+            'missing_columns': self.missing,
+            'extra_columns': self.extra,
+            'non_numeric_columns': self.non_numeric,
+        }
+
+
+class CompiledSchema:
+    """Column plan for one concrete input header.
+
+    ``positions[j]`` is the position in the input of the j-th model feature, so an
+    input frame can be copied straight into model order without reindexing.
+    ``context`` maps the normalized name of each context column (e.g. 'sender_id')
+    to its header name; those columns are read as strings and kept out of the matrix.
+    """
+
+    def __init__(self, schema: 'FeatureSchema', header: Sequence[str], positions: np.ndarray,
+                 context: Dict[str, str] = None):
+        self.schema = schema
+        self.header = list(header)
+        self.positions = positions
+        self.context = dict(context or {})
+        # pd.read_csv dtype map: parse every feature column straight to the model dtype
+        self.dtypes = {col: schema.dtype for col in self.header}
+        self.dtypes.update({col: str for col in self.context.values()})
+
+    def to_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """Copy ``df`` into a preallocated C-contiguous matrix in model column order."""
+        non_numeric = [str(df.columns[pos]) for pos in self.positions
+                       if not (pd.api.types.is_numeric_dtype(df.dtypes.iloc[pos])
+                               or pd.api.types.is_bool_dtype(df.dtypes.iloc[pos]))]
+        if non_numeric:
+            raise SchemaError('Feature columns must be numeric', non_numeric=non_numeric)
+
+        out = np.empty((len(df), len(self.positions)), dtype=self.schema.dtype)
+        for j, pos in enumerate(self.positions):
+            out[:, j] = df.iloc[:, pos].to_numpy()
+        return out
+
+
+class FeatureSchema:
+    """The ordered feature list a model was trained on.
+
+    Headers are normalized (case, whitespace, hyphens) before matching, and any
+    missing or unexpected column is rejected before scoring starts.
+    """
+
+    def __init__(self, columns: Sequence[str], dtype=np.float32):
+        self.columns: List[str] = [normalize_column(c) for c in columns]
+        self.dtype = np.dtype(dtype)
+        self._index = {c: i for i, c in enumerate(self.columns)}
+        if len(self._index) != len(self.columns):
+            raise ValueError('Feature schema contains duplicate columns')
+        self._compiled: Dict[tuple, CompiledSchema] = {}
+
+    def __len__(self):
+        return len(self.columns)
+
+    def compile(self, header: Sequence[str], context: Sequence[str] = ()) -> CompiledSchema:
+        """Validate an input header and build (or reuse) its column plan.
+
+        Columns named in ``context`` (normalized names) are allowed next to the features.
+        """
+        key = (tuple(header), tuple(context))
+        plan = self._compiled.get(key)
+        if plan is not None:
+            return plan
+
+        normalized = [normalize_column(c) for c in header]
+        seen = {}
+        duplicates = []
+        for pos, col in enumerate(normalized):
+            if col in seen:
+                duplicates.append(col)
+            seen[col] = pos
+        missing = [c for c in self.columns if c not in seen]
+        extra = [header[pos] for pos, col in enumerate(normalized)
+                 if col not in self._index and col not in context]
+        if duplicates:
+            raise SchemaError(f'Duplicate columns after normalization: {duplicates}', extra=duplicates)
+        if missing or extra:
+            raise SchemaError(
+                f'Input columns do not match the model feature schema '
+                f'({len(missing)} missing, {len(extra)} unexpected)',
+                missing=missing, extra=extra)
+
+        plan = CompiledSchema(self, header, np.array([seen[c] for c in self.columns], dtype=np.intp),
+                              context={c: header[seen[c]] for c in context if c in seen})
+        # a service only ever sees a handful of distinct headers
+        if len(self._compiled) < 64:
+            self._compiled[key] = plan
+        return plan
+
+    def compile_csv(self, handle, context: Sequence[str] = ()) -> CompiledSchema:
+        """Read and validate the header line of a seekable CSV handle, then rewind it.
+
+        The header ends at the first \\n, \\r\\n or bare \\r, whichever the file uses.
+        """
+        start = handle.tell()
+        try:
+            if isinstance(handle, io.TextIOBase):
+                first = handle.readline()
+            else:
+                text = io.TextIOWrapper(handle, encoding='utf-8-sig', newline=None)
+                try:
+                    first = text.readline()
+                finally:
+                    text.detach()
+            first = re.split(r'\r\n|\r|\n', first, maxsplit=1)[0]
+            header = next(csv.reader(io.StringIO(first)), [])
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise SchemaError(f'Could not read the CSV header: {e}')
+        finally:
+            handle.seek(start)
+        return self.compile(header, context)
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        return self.compile([str(c) for c in df.columns]).to_matrix(df)
+
+    def check(self, record: Dict[str, object], derived: Sequence[str] = ()) -> Dict[str, object]:
+        """Validate a JSON transaction whose ``derived`` features are filled in later.
+
+        Returns the record keyed by normalized feature name.
+        """
+        values = {normalize_column(k): v for k, v in record.items()}
+        derived = set(derived)
+        missing = [c for c in self.columns if c not in values and c not in derived]
+        extra = [k for k in record if normalize_column(k) not in self._index]
+        if missing or extra:
+            raise SchemaError(
+                f'Transaction fields do not match the model feature schema '
+                f'({len(missing)} missing, {len(extra)} unexpected)',
+                missing=missing, extra=extra)
+        supplied = [c for c in self.columns if c in values]
+        try:
+            np.array([values[c] for c in supplied], dtype=self.dtype)
+        except (TypeError, ValueError):
+            non_numeric = [c for c in supplied if not isinstance(values[c], (int, float, bool))]
+            raise SchemaError('Feature values must be numeric', non_numeric=non_numeric)
+        return values
+
+    def vector(self, record: Dict[str, object]) -> np.ndarray:
+        """One JSON transaction (feature name -> value) as a model-ordered row."""
+        values = self.check(record)
+        return np.array([values[c] for c in self.columns], dtype=self.dtype)
+
+    def check_model(self, model) -> None:
+        """Raise if a loaded model was trained on a different number of features."""
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features is not None and n_features != len(self.columns):
+            raise SchemaError(f'Model expects {n_features} features but the schema defines {len(self.columns)}')
@@ -0,0 +1,289 @@
+"""Online per-account rolling features for /score.
+
+Usage (bootstrap the snapshot, and the training scaling, from history):
+    python feature_store.py IBM_AML_Preprocessed.csv -o feature_store.npz
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from feature_schema import account_key, normalize_column
+
+# Snapshot file for restart, and how often (seconds) the background thread writes it
+FEATURE_STORE_PATH = os.getenv("FEATURE_STORE_PATH", os.path.join(os.path.dirname(__file__), 'feature_store.npz'))
+FEATURE_SNAPSHOT_INTERVAL = float(os.getenv("FEATURE_SNAPSHOT_INTERVAL", "60"))
+
+# Window lengths from the notebook: rolling(7) and rolling(30) over each sender's
+# transactions (windows count transactions, not days)
+SHORT_WINDOW = 7
+LONG_WINDOW = 30
+# Transactions closer together than this (seconds) are a burst
+BURST_SECONDS = 60
+
+ROLLING_FEATURES = [
+    'rolling_mean_amount_7d', 'rolling_std_amount_7d', 'num_transactions_30d',
+    'avg_transaction_30d', 'time_diff', 'is_burst',
+]
+# Standardized in the notebook's training frame (avg_transaction_30d is not)
+SCALED_FEATURES = ['rolling_mean_amount_7d', 'rolling_std_amount_7d', 'num_transactions_30d']
+# Raw event time of a /score transaction (the model's 'timestamp' feature is a label-encoded code)
+EVENT_TIME_FIELD = 'event_time'
+# The windows run over raw currency amounts like the notebook's; /score only carries the
+# standardized amount_paid, so the raw amount is recovered from log1p(amount)
+AMOUNT_FIELD = 'log_amount_paid'
+
+
+def to_epoch_seconds(value) -> float:
+    """Numbers are taken as epoch seconds; strings/datetimes are parsed (naive ones as UTC, like pandas)."""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def parse_event_time(value) -> float:
+    """A transaction's ``event_time`` field in epoch seconds (ValueError if it can't be read)."""
+    try:
+        return to_epoch_seconds(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid {EVENT_TIME_FIELD} {value!r}: expected epoch seconds or an ISO string ({e})')
+
+
+class OnlineFeatureStore:
+    """Per-account running windows for the model's behavioural features.
+
+    Each account owns one row in a set of preallocated arrays: a ring of its last
+    30 amounts, running sum/sum-of-squares over the last 7 and sum over the last 30,
+    a transaction count and the last timestamp. ``update`` evicts the amount
+    leaving each window and adds the new one, so it costs the same however long an
+    account's history is. Running sums are recomputed from the ring every time it
+    wraps to stop floating-point drift.
+
+    Features include the current transaction, matching the notebook's
+    ``rolling(n, min_periods=1)`` (std is NaN for an account's first transaction,
+    as is ``time_diff``). ``update`` returns raw values; ``enrich`` standardizes
+    ``SCALED_FEATURES`` with ``scaling`` like the training frame. Accounts are
+    keyed by their raw ID (see ``feature_schema.account_key``), like the
+    preprocessed CSV the store is bootstrapped from.
+    """
+
+    def __init__(self, capacity: int = 1024, scaling: Optional[Dict[str, tuple]] = None):
+        self._slots: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # per-feature (mean, std) used to standardize served values like the training frame
+        self.scaling = dict(scaling or {})
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.ring = np.zeros((capacity, LONG_WINDOW), dtype=np.float64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.sum7 = np.zeros(capacity, dtype=np.float64)
+        self.sumsq7 = np.zeros(capacity, dtype=np.float64)
+        self.sum30 = np.zeros(capacity, dtype=np.float64)
+        self.last_ts = np.full(capacity, np.nan, dtype=np.float64)
+
+    def _grow(self):
+        old = (self.ring, self.count, self.sum7, self.sumsq7, self.sum30, self.last_ts)
+        n = len(self.count)
+        self._allocate(n * 2)
+        for new, prev in zip((self.ring, self.count, self.sum7, self.sumsq7, self.sum30, self.last_ts), old):
+            new[:n] = prev
+
+    def __len__(self):
+        return len(self._slots)
+
+    @classmethod
+    def from_history(cls, accounts, amounts, timestamps) -> 'OnlineFeatureStore':
+        """Replay raw (account, amount, epoch seconds) history in time order.
+
+        ``scaling`` is set from the replayed values, which is how the notebook
+        standardizes these features over all transactions.
+        """
+        accounts = list(accounts)
+        store = cls(capacity=max(1024, 2 * len(set(accounts))))
+        raw = {name: np.empty(len(accounts)) for name in SCALED_FEATURES}
+        for i, (account, amount, ts) in enumerate(zip(accounts, amounts, timestamps)):
+            computed = store.update(account, amount, ts)
+            for name in SCALED_FEATURES:
+                raw[name][i] = computed[name]
+        store.scaling = {name: (float(np.nanmean(v)), float(np.nanstd(v)) or 1.0) for name, v in raw.items()}
+        return store
+
+    def _slot(self, account) -> int:
+        key = account_key(account)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._slots)
+            if slot >= len(self.count):
+                self._grow()
+            self._slots[key] = slot
+        return slot
+
+    def update(self, account, amount: float, timestamp) -> Dict[str, float]:
+        """Record one transaction (``timestamp`` is its raw event time) and return its unscaled rolling features."""
+        amount = float(amount)
+        ts = to_epoch_seconds(timestamp)
+        with self._lock:
+            s = self._slot(account)
+            ring = self.ring[s]
+            n = int(self.count[s])
+            pos = n % LONG_WINDOW
+
+            if n >= LONG_WINDOW:
+                self.sum30[s] -= ring[pos]
+            if n >= SHORT_WINDOW:
+                leaving = ring[(n - SHORT_WINDOW) % LONG_WINDOW]
+                self.sum7[s] -= leaving
+                self.sumsq7[s] -= leaving * leaving
+            ring[pos] = amount
+            n += 1
+            self.count[s] = n
+            self.sum30[s] += amount
+            self.sum7[s] += amount
+            self.sumsq7[s] += amount * amount
+
+            if pos == LONG_WINDOW - 1:
+                self._resync(s, n)
+
+            n7 = min(n, SHORT_WINDOW)
+            n30 = min(n, LONG_WINDOW)
+            mean7 = self.sum7[s] / n7
+            if n7 > 1:
+                var7 = max(self.sumsq7[s] - n7 * mean7 * mean7, 0.0) / (n7 - 1)
+                std7 = var7 ** 0.5
+            else:
+                std7 = float('nan')
+            previous = self.last_ts[s]
+            time_diff = ts - previous
+            self.last_ts[s] = ts
+            avg30 = self.sum30[s] / n30
+
+        return {
+            'rolling_mean_amount_7d': float(mean7),
+            'rolling_std_amount_7d': float(std7),
+            'num_transactions_30d': float(n30),
+            'avg_transaction_30d': float(avg30),
+            'time_diff': float(time_diff),
+            'is_burst': 1.0 if time_diff < BURST_SECONDS else 0.0,
+        }
+
+    def _resync(self, s: int, n: int):
+        ring = self.ring[s]
+        last7 = ring[[(n - k) % LONG_WINDOW for k in range(1, min(n, SHORT_WINDOW) + 1)]]
+        self.sum30[s] = ring.sum()
+        self.sum7[s] = last7.sum()
+        self.sumsq7[s] = (last7 * last7).sum()
+
+    def enrich(self, transaction: Dict[str, Any], event_time=None, account=None,
+               account_field: str = 'sender_account', amount_field: str = AMOUNT_FIELD) -> Dict[str, Any]:
+        """Update the store with a transaction and fill in any rolling features it lacks.
+
+        ``account`` is the sender's raw ID; without it ``account_field`` is used.
+        ``event_time`` (epoch seconds or ISO string) drives ``time_diff``/``is_burst``;
+        without it the time of the call is used. Field names are matched after the same
+        normalization as the feature schema, so 'Sender_Account' and 'log Amount Paid'
+        work too. Values the caller already supplied are left alone.
+        """
+        by_name = {normalize_column(k): k for k in transaction}
+        try:
+            if account is None:
+                account = transaction[by_name[account_field]]
+            amount = float(np.expm1(float(transaction[by_name[amount_field]])))
+        except KeyError as e:
+            raise ValueError(f'Transaction is missing {e.args[0]!r}, needed for rolling features')
+
+        computed = self.update(account, amount, time.time() if event_time is None else event_time)
+        for name, (mean, std) in self.scaling.items():
+            if name in computed:
+                computed[name] = (computed[name] - mean) / std
+        enriched = dict(transaction)
+        for name, value in computed.items():
+            if name not in by_name:
+                enriched[name] = value
+        return enriched
+
+    def save(self, path: str = FEATURE_STORE_PATH):
+        """Write a snapshot atomically (temp file + rename)."""
+        with self._lock:
+            n = len(self._slots)
+            accounts = np.array(list(self._slots), dtype=str)
+            arrays = {name: getattr(self, name)[:n].copy()
+                      for name in ('ring', 'count', 'sum7', 'sumsq7', 'sum30', 'last_ts')}
+        scaled = list(self.scaling)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, accounts=accounts, scaling_names=np.array(scaled, dtype=str),
+                     scaling=np.array([self.scaling[name] for name in scaled], dtype=np.float64).reshape(-1, 2),
+                     **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = FEATURE_STORE_PATH) -> 'OnlineFeatureStore':
+        """Restore a snapshot, or return an empty store if there is none."""
+        if not os.path.exists(path):
+            store = cls()
+        else:
+            with np.load(path) as snapshot:
+                accounts = snapshot['accounts'].tolist()
+                scaling = {}
+                if 'scaling' in snapshot.files:
+                    scaling = {name: tuple(values) for name, values in
+                               zip(snapshot['scaling_names'].tolist(), snapshot['scaling'].tolist())}
+                store = cls(capacity=max(1024, 2 * len(accounts)), scaling=scaling)
+                n = len(accounts)
+                for name in ('ring', 'count', 'sum7', 'sumsq7', 'sum30', 'last_ts'):
+                    getattr(store, name)[:n] = snapshot[name]
+            store._slots = {account: i for i, account in enumerate(accounts)}
+        if not store.scaling:
+            print(f"⚠️ No feature scaling in {path}; rolling features are served unstandardized "
+                  f"(bootstrap it with: python feature_store.py <history.csv>)")
+        return store
+
+    def start_snapshots(self, path: str = FEATURE_STORE_PATH, interval: float = FEATURE_SNAPSHOT_INTERVAL,
+                        stop: Optional[threading.Event] = None) -> threading.Thread:
+        """Save a snapshot every ``interval`` seconds from a daemon thread."""
+        stop = stop or threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.save(path)
+                except Exception as e:
+                    print(f"⚠️ Feature store snapshot failed: {e}")
+
+        thread = threading.Thread(target=run, name='feature-store-snapshot', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', help='historical transactions CSV, in time order')
+    parser.add_argument('-o', '--output', default=FEATURE_STORE_PATH)
+    parser.add_argument('--sender', default='Sender_Account', help='raw sender ID column')
+    parser.add_argument('--amount', default='log_Amount_Paid', help='log1p(amount) column')
+    parser.add_argument('--time', default='Timestamp', help='raw event time column')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    history = pd.read_csv(args.input, usecols=[args.sender, args.amount, args.time], dtype={args.sender: str})
+    seconds = pd.to_datetime(history[args.time]).to_numpy(dtype='datetime64[ns]').view(np.int64) / 1e9
+    store = OnlineFeatureStore.from_history(history[args.sender].tolist(),
+                                            np.expm1(history[args.amount].to_numpy(dtype=np.float64)).tolist(),
+                                            seconds.tolist())
+    store.save(args.output)
+    print(f"✅ Feature store for {len(store)} accounts ({len(history)} transactions) written to {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
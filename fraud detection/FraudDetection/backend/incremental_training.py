@@ -0,0 +1,325 @@
+"""Warm-start retraining from newly labelled rows.
+
+Full retraining re-reads all the history. This mode continues the live model from
+the rows labelled since its last incremental update:
+- ``loan``: rejected applications an analyst has labelled
+  (``POST /admin/rejected-applications/labels``), or new rows appended to a
+  labelled CSV (``--data``). ``--add-trees`` more trees are grown on the new rows
+  with ``warm_start``. The existing trees are kept as they are, and the live
+  preprocessing plan is reused unchanged.
+- ``fraud``: new rows of a labelled transaction CSV (``--data``, with
+  ``Is_Laundering``). XGBoost continues boosting from the current booster for
+  ``--add-rounds`` rounds.
+
+Part of the new rows (``--holdout-fraction``) is held out, optionally alongside a
+fixed labelled file (``--holdout``). The old and new models are scored on each
+holdout. The new model replaces the live file only if no metric drops by more
+than ``--tolerance``. The registries in the running apps then hot-swap it, and the
+previous file is kept as ``<model>.prev``. What has been consumed (the last label
+id, rows read per CSV) is recorded in ``RETRAIN_STATE_PATH`` only when a model is
+published. Rows from a rejected attempt are therefore offered again next time,
+together with whatever arrives in between.
+
+Usage:
+    python incremental_training.py loan [--add-trees 20] [--holdout labelled.csv] [--dry-run]
+    python incremental_training.py fraud --data new_transactions.csv [--add-rounds 50]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, average_precision_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from feature_schema import FeatureSchema, FRAUD_FEATURES, FRAUD_LABEL, normalize_column
+from model_registry import pickle_loader
+from preprocessing_plan import plan_loader, PLAN_PATH
+from rejection_handler import get_labelled_applications
+
+BASE_DIR = os.path.dirname(__file__)
+# Consumed-row watermarks and the history of incremental runs
+RETRAIN_STATE_PATH = os.getenv("RETRAIN_STATE_PATH", os.path.join(BASE_DIR, 'retrain_state.json'))
+# Fewer new rows than this is not worth a new model version
+RETRAIN_MIN_ROWS = int(os.getenv("RETRAIN_MIN_ROWS", "20"))
+# Largest drop in any holdout metric that still publishes
+RETRAIN_TOLERANCE = float(os.getenv("RETRAIN_TOLERANCE", "0.005"))
+# Runs kept in the state file's history
+HISTORY_LENGTH = 50
+
+MODELS = {
+    # live file, how it is written, holdout metrics (all higher-is-better)
+    'loan': {'path': os.path.join(BASE_DIR, 'loan_model.pkl'), 'dump': 'pickle',
+             'metrics': ('accuracy', 'roc_auc')},
+    'fraud': {'path': os.path.join(BASE_DIR, 'xgb_model.pkl'), 'dump': 'joblib',
+              'metrics': ('roc_auc', 'average_precision')},
+}
+LOAN_LABELS = {'approved': 1, 'rejected': 0}
+
+
+def file_sha(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def load_state(path: str = RETRAIN_STATE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state: Dict[str, Any], path: str = RETRAIN_STATE_PATH):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def read_new_csv_rows(path: str, offset: int = 0) -> pd.DataFrame:
+    """Rows of an append-only CSV after the first ``offset`` data rows."""
+    return pd.read_csv(path, skiprows=range(1, offset + 1) if offset else None)
+
+
+def loan_labels(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64)
+    return values.astype(str).str.strip().str.lower().map(LOAN_LABELS).to_numpy(dtype=np.float64)
+
+
+def loan_frame(df: pd.DataFrame, plan) -> Tuple[np.ndarray, np.ndarray]:
+    """Plan-transformed features and 0/1 labels; rows without a usable label are dropped."""
+    label = next((c for c in df.columns if str(c).strip() == 'loan_status'), None)
+    if label is None:
+        raise ValueError('Labelled loan data must have a loan_status column')
+    y = loan_labels(df[label])
+    keep = ~np.isnan(y)
+    return plan.transform_frame(df[keep].drop(columns=[label])), y[keep].astype(int)
+
+
+def fraud_frame(df: pd.DataFrame, schema: FeatureSchema) -> Tuple[np.ndarray, np.ndarray]:
+    """Model-ordered float32 features and labels of a labelled transaction frame."""
+    label = next((c for c in df.columns if normalize_column(c) == FRAUD_LABEL), None)
+    if label is None:
+        raise ValueError(f'Labelled transaction data must have an {FRAUD_LABEL} column')
+    df = df.dropna(subset=[label])
+    return schema.transform(df.drop(columns=[label])), df[label].to_numpy().astype(int)
+
+
+def new_loan_rows(state: Dict[str, Any], plan, data: Optional[str]):
+    """(X, y, watermark update) for loan rows labelled since the last published run."""
+    if data:
+        source = os.path.abspath(data)
+        offset = state.get('offsets', {}).get(source, 0)
+        df = read_new_csv_rows(data, offset)
+        X, y = loan_frame(df, plan)
+        return X, y, {'offsets': {source: offset + len(df)}}
+    after = state.get('label_watermark', 0)
+    df = get_labelled_applications(after)
+    if df.empty:
+        return np.empty((0, len(plan.columns))), np.empty(0, dtype=int), {}
+    X, y = loan_frame(df.drop(columns=['label_id']), plan)
+    return X, y, {'label_watermark': int(df['label_id'].max())}
+
+
+def new_fraud_rows(state: Dict[str, Any], schema: FeatureSchema, data: Optional[str]):
+    if not data:
+        raise ValueError('fraud retraining needs --data (a labelled transaction CSV)')
+    source = os.path.abspath(data)
+    offset = state.get('offsets', {}).get(source, 0)
+    df = read_new_csv_rows(data, offset)
+    X, y = fraud_frame(df, schema)
+    return X, y, {'offsets': {source: offset + len(df)}}
+
+
+def warm_start_forest(model, X: np.ndarray, y: np.ndarray, add_trees: int):
+    """A copy of ``model`` with ``add_trees`` more trees, grown on (X, y) only."""
+    grown = copy.deepcopy(model)
+    grown.set_params(warm_start=True, n_estimators=model.n_estimators + add_trees)
+    grown.fit(X, y)
+    grown.set_params(warm_start=False)
+    return grown
+
+
+def continue_boosting(model, X: np.ndarray, y: np.ndarray, add_rounds: int):
+    """A new XGBClassifier: the current booster plus ``add_rounds`` rounds fitted on (X, y)."""
+    params = model.get_params()
+    params.pop('use_label_encoder', None)
+    params.update(n_estimators=add_rounds, early_stopping_rounds=None)
+    boosted = type(model)(**params)
+    boosted.fit(X, y, xgb_model=model.get_booster())
+    return boosted
+
+
+def score(model, X: np.ndarray, y: np.ndarray, metrics) -> Dict[str, Optional[float]]:
+    proba = model.predict_proba(X)[:, 1]
+    both = len(np.unique(y)) == 2
+    out = {}
+    for metric in metrics:
+        if metric == 'accuracy':
+            out[metric] = float(accuracy_score(y, proba > 0.5))
+        elif metric == 'roc_auc':
+            out[metric] = float(roc_auc_score(y, proba)) if both else None
+        elif metric == 'average_precision':
+            out[metric] = float(average_precision_score(y, proba)) if both else None
+    return out
+
+
+def gate(old, new, holdouts: List[Tuple[str, np.ndarray, np.ndarray]], metrics, tolerance: float):
+    """Compare old and new on every holdout; (passed, per-holdout metrics, reasons)."""
+    results, failures, checked = {}, [], 0
+    for name, X, y in holdouts:
+        before, after = score(old, X, y, metrics), score(new, X, y, metrics)
+        results[name] = {'rows': int(len(y))}
+        for metric in metrics:
+            results[name][metric] = {'old': before[metric], 'new': after[metric]}
+            if before[metric] is None or after[metric] is None:
+                continue
+            checked += 1
+            if after[metric] < before[metric] - tolerance:
+                failures.append(f'{name} {metric} {before[metric]:.4f} -> {after[metric]:.4f}')
+    if not checked:
+        failures.append('no holdout metric could be computed (need both classes in a holdout)')
+    return not failures, results, failures
+
+
+def publish(model, path: str, dump: str):
+    """Atomically replace the live model file, keeping the previous one as ``.prev``."""
+    tmp = f'{path}.tmp'
+    if dump == 'joblib':
+        joblib.dump(model, tmp)
+    else:
+        with open(tmp, 'wb') as f:
+            pickle.dump(model, f)
+    if os.path.exists(path):
+        shutil.copy2(path, f'{path}.prev')
+    os.replace(tmp, path)
+
+
+def retrain(kind: str, data: Optional[str] = None, holdout: Optional[str] = None, model_path: Optional[str] = None,
+            plan_path: Optional[str] = None, add_trees: int = 20, add_rounds: int = 50,
+            holdout_fraction: float = 0.2, tolerance: float = RETRAIN_TOLERANCE, min_rows: int = RETRAIN_MIN_ROWS,
+            dry_run: bool = False, state_path: str = RETRAIN_STATE_PATH, seed: int = 42) -> Dict[str, Any]:
+    spec = MODELS[kind]
+    model_path = model_path or spec['path']
+    state = load_state(state_path)
+    model_state = state.setdefault(kind, {})
+    started = time.perf_counter()
+    old = pickle_loader(model_path) if spec['dump'] == 'pickle' else joblib.load(model_path)
+    version_before = file_sha(model_path)
+    if model_state.get('version') not in (None, version_before):
+        print(f"⚠️ {model_path} changed since the last incremental run; continuing from the stored watermark")
+
+    if kind == 'loan':
+        if plan_path is None:
+            plan_path = PLAN_PATH if os.path.exists(PLAN_PATH) else os.path.join(BASE_DIR, 'scaler.pkl')
+        plan = plan_loader(plan_path)
+        X, y, consumed = new_loan_rows(model_state, plan, data)
+        prepare = lambda df: loan_frame(df, plan)
+    else:
+        schema = FeatureSchema(FRAUD_FEATURES)
+        X, y, consumed = new_fraud_rows(model_state, schema, data)
+        prepare = lambda df: fraud_frame(df, schema)
+
+    run = {'at': datetime.now().isoformat(timespec='seconds'), 'kind': kind, 'new_rows': int(len(y)),
+           'version_before': version_before}
+    if len(y) < min_rows:
+        run['status'] = 'insufficient_data'
+        print(f"⚠️ {len(y)} new labelled rows (need {min_rows}); {model_path} left as is")
+        return run
+
+    holdouts = []
+    X_train, y_train = X, y
+    if holdout_fraction > 0:
+        try:
+            X_train, X_new_holdout, y_train, y_new_holdout = train_test_split(
+                X, y, test_size=holdout_fraction, random_state=seed, stratify=y)
+            holdouts.append(('new_rows', X_new_holdout, y_new_holdout))
+        except ValueError as e:
+            print(f"⚠️ New rows can't be split for a holdout ({e}); training on all of them")
+    if holdout:
+        X_fixed, y_fixed = prepare(pd.read_csv(holdout))
+        holdouts.append((os.path.basename(holdout), X_fixed, y_fixed))
+    if set(np.unique(y_train)) != set(old.classes_):
+        run['status'] = 'insufficient_data'
+        print(f"⚠️ New training rows only cover classes {np.unique(y_train).tolist()}; "
+              f"waiting for more labels before extending the model")
+        return run
+
+    fit_started = time.perf_counter()
+    if kind == 'loan':
+        new = warm_start_forest(old, X_train, y_train, add_trees)
+        run['trees'] = [len(old.estimators_), len(new.estimators_)]
+    else:
+        new = continue_boosting(old, X_train, y_train, add_rounds)
+        run['rounds'] = [old.get_booster().num_boosted_rounds(), new.get_booster().num_boosted_rounds()]
+    run['fit_seconds'] = round(time.perf_counter() - fit_started, 3)
+    run['train_rows'] = int(len(y_train))
+
+    passed, run['holdouts'], failures = gate(old, new, holdouts, spec['metrics'], tolerance)
+    if not passed:
+        run['status'] = 'rejected'
+        run['reasons'] = failures
+        print(f"❌ Not published: {'; '.join(failures)}")
+    elif dry_run:
+        run['status'] = 'dry_run'
+        print(f"✅ Holdout check passed (dry run, {model_path} left as is)")
+    else:
+        publish(new, model_path, spec['dump'])
+        run['status'] = 'published'
+        run['version_after'] = model_state['version'] = file_sha(model_path)
+        if 'label_watermark' in consumed:
+            model_state['label_watermark'] = consumed['label_watermark']
+        model_state.setdefault('offsets', {}).update(consumed.get('offsets', {}))
+        print(f"✅ Published {model_path} (version {run['version_after']}); previous kept as {model_path}.prev")
+    run['seconds'] = round(time.perf_counter() - started, 3)
+
+    model_state['history'] = (model_state.get('history', []) + [run])[-HISTORY_LENGTH:]
+    save_state(state, state_path)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm-start retraining from newly labelled rows')
+    parser.add_argument('kind', choices=sorted(MODELS))
+    parser.add_argument('--data', help='labelled CSV appended to over time (loan default: analyst labels in the DB)')
+    parser.add_argument('--holdout', help='fixed labelled CSV both models are also scored on')
+    parser.add_argument('--holdout-fraction', type=float, default=0.2, help='share of the new rows held out')
+    parser.add_argument('--add-trees', type=int, default=20, help='trees added to the loan forest')
+    parser.add_argument('--add-rounds', type=int, default=50, help='boosting rounds added to the fraud model')
+    parser.add_argument('--tolerance', type=float, default=RETRAIN_TOLERANCE)
+    parser.add_argument('--min-rows', type=int, default=RETRAIN_MIN_ROWS)
+    parser.add_argument('--model', help='model file to extend (default: the live one)')
+    parser.add_argument('--plan', help='loan preprocessing plan (default: the live one)')
+    parser.add_argument('--state', default=RETRAIN_STATE_PATH)
+    parser.add_argument('--dry-run', action='store_true', help='train and validate, but do not publish')
+    args = parser.parse_args()
+
+    run = retrain(args.kind, args.data, args.holdout, args.model, args.plan, args.add_trees, args.add_rounds,
+                  args.holdout_fraction, args.tolerance, args.min_rows, args.dry_run, args.state)
+    for name, metrics in run.get('holdouts', {}).items():
+        for metric, values in metrics.items():
+            if isinstance(values, dict):
+                old, new = (f'{v:.4f}' if v is not None else 'n/a' for v in (values['old'], values['new']))
+                print(f"  {name:<20}{metric:<20}{old:>10} -> {new}")
+    print(json.dumps({k: v for k, v in run.items() if k != 'holdouts'}))
+    sys.exit(1 if run['status'] == 'rejected' else 0)
+
+
+if __name__ == '__main__':
+    main()
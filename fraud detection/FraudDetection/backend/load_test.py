@@ -0,0 +1,241 @@
+"""Load-test harness: the Flask dev server against the ASGI entry point.
+
+Sends the same request mix to each target from a pool of keep-alive client
+threads. It reports throughput, latency percentiles and status codes per target.
+``--spawn`` starts both servers for one app on free local ports: Flask's
+threaded dev server (debug off) and uvicorn on ``asgi_app``. Otherwise pass
+running servers with ``--target``.
+
+``--background-file`` keeps slow CSV uploads going while the measured requests
+run. This shows whether one heavy upload holds up everyone else.
+
+Usage:
+    python load_test.py --spawn loan [--concurrency 16] [--requests 2000]
+    python load_test.py --spawn loan --background-file big.csv --background-path /predict
+    python load_test.py --target flask=http://localhost:5001 --target asgi=http://localhost:8001 \
+        --path /predict --json @applicant.json
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# An applicant the bundled loan model approves, so the test doesn't fill rejected_applications.db
+SAMPLE_APPLICANT = {
+    'no_of_dependents': 2, 'education': 'Graduate', 'self_employed': 'No', 'income_annum': 9600000,
+    'loan_amount': 29900000, 'loan_term': 12, 'cibil_score': 778, 'residential_assets_value': 2400000,
+    'commercial_assets_value': 17600000, 'luxury_assets_value': 22700000, 'bank_asset_value': 8000000,
+}
+APPS = {
+    # module holding app/asgi_app, default path
+    'loan': ('loan_api', '/predict'),
+    'fraud': ('app', '/health'),
+}
+
+
+class Request:
+    """One prepared HTTP request (method, path, body, headers)."""
+
+    def __init__(self, method: str, path: str, body: bytes = b'', headers: Optional[Dict[str, str]] = None):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = dict(headers or {})
+        if body:
+            self.headers.setdefault('Content-Length', str(len(body)))
+
+
+def json_request(path: str, payload) -> Request:
+    return Request('POST', path, json.dumps(payload).encode(), {'Content-Type': 'application/json'})
+
+
+def upload_request(path: str, csv_path: str, field: str = 'file') -> Request:
+    boundary = uuid.uuid4().hex
+    with open(csv_path, 'rb') as f:
+        content = f.read()
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+            f'filename="{os.path.basename(csv_path)}"\r\nContent-Type: text/csv\r\n\r\n').encode()
+    body += content + f'\r\n--{boundary}--\r\n'.encode()
+    return Request('POST', path, body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+
+def send(conn: http.client.HTTPConnection, req: Request) -> int:
+    conn.request(req.method, req.path, body=req.body or None, headers=req.headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def run_load(base_url: str, req: Request, concurrency: int, total: int, warmup: int = 10,
+             stop: Optional[threading.Event] = None) -> Dict[str, object]:
+    """Send ``total`` requests from ``concurrency`` threads; latency is measured per request."""
+    parts = urlsplit(base_url)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+        while True:
+            with lock:
+                if remaining[0] <= 0 or (stop is not None and stop.is_set()):
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                status = send(conn, req)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+                status = 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+        conn.close()
+
+    warm = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+    for _ in range(warmup):
+        send(warm, req)
+    warm.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000
+    ok = sum(c for s, c in statuses.items() if s == 200)
+    return {
+        'requests': len(latencies),
+        'ok': ok,
+        'seconds': round(wall, 2),
+        'rps': round(len(latencies) / wall, 1) if wall else None,
+        'p50_ms': round(float(np.percentile(ms, 50)), 1) if len(ms) else None,
+        'p90_ms': round(float(np.percentile(ms, 90)), 1) if len(ms) else None,
+        'p99_ms': round(float(np.percentile(ms, 99)), 1) if len(ms) else None,
+        'max_ms': round(float(ms.max()), 1) if len(ms) else None,
+        'statuses': {str(s): c for s, c in sorted(statuses.items(), key=str)},
+    }
+
+
+def background_load(base_url: str, req: Request, concurrency: int, stop: threading.Event) -> List[threading.Thread]:
+    """Keep ``concurrency`` clients sending ``req`` until ``stop`` is set."""
+    threads = [threading.Thread(target=run_load, args=(base_url, req, 1, 1 << 30, 0, stop), daemon=True)
+               for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(base_url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/health', timeout=5) as r:
+                if r.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f'{base_url} did not become ready within {timeout:.0f}s')
+
+
+def spawn(module: str) -> List[Tuple[str, str, subprocess.Popen]]:
+    """Start the Flask dev server and uvicorn for ``module``; returns (name, url, process)."""
+    servers = []
+    flask_port, asgi_port = free_port(), free_port()
+    commands = {
+        'flask': [sys.executable, '-c',
+                  f"import {module}; {module}.app.run(host='127.0.0.1', port={flask_port}, threaded=True)"],
+        'asgi': [sys.executable, '-m', 'uvicorn', f'{module}:asgi_app', '--host', '127.0.0.1',
+                 '--port', str(asgi_port), '--log-level', 'warning', '--no-access-log'],
+    }
+    for name, command in commands.items():
+        port = flask_port if name == 'flask' else asgi_port
+        process = subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        servers.append((name, f'http://127.0.0.1:{port}', process))
+    for _, url, _ in servers:
+        wait_ready(url)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--spawn', choices=sorted(APPS), help='start Flask and ASGI servers for this app')
+    parser.add_argument('--target', action='append', default=[], metavar='NAME=URL', help='running server to test')
+    parser.add_argument('--path', help='request path (default: /predict for loan, /health for fraud)')
+    parser.add_argument('--json', help='JSON body, or @file (default for /predict: a sample applicant)')
+    parser.add_argument('--file', help='CSV to upload as multipart field "file"')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--background-file', help='CSV uploaded continuously during the run')
+    parser.add_argument('--background-path', default='/upload')
+    parser.add_argument('--background-concurrency', type=int, default=1)
+    args = parser.parse_args()
+
+    if not args.spawn and not args.target:
+        parser.error('pass --spawn APP or at least one --target NAME=URL')
+    path = args.path or (APPS[args.spawn][1] if args.spawn else '/predict')
+    if args.file:
+        req = upload_request(path, args.file)
+    elif args.json:
+        payload = json.load(open(args.json[1:])) if args.json.startswith('@') else json.loads(args.json)
+        req = json_request(path, payload)
+    elif path == '/predict':
+        req = json_request(path, SAMPLE_APPLICANT)
+    else:
+        req = Request('GET', path)
+
+    servers = spawn(APPS[args.spawn][0]) if args.spawn else []
+    targets = [(name, url) for name, url, _ in servers] + [tuple(t.split('=', 1)) for t in args.target]
+    results = {}
+    try:
+        for name, url in targets:
+            stop = threading.Event()
+            background = []
+            if args.background_file:
+                background = background_load(url, upload_request(args.background_path, args.background_file),
+                                             args.background_concurrency, stop)
+            results[name] = run_load(url, req, args.concurrency, args.requests)
+            stop.set()
+            for t in background:
+                t.join(timeout=120)
+            print(f"✅ {name}: {json.dumps(results[name])}")
+    finally:
+        for _, _, process in servers:
+            process.terminate()
+            process.wait(timeout=30)
+
+    print(f"\n{req.method} {path}  concurrency={args.concurrency}"
+          + (f"  background={args.background_concurrency}x {args.background_path}" if args.background_file else ''))
+    print(f"{'target':<10}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}  statuses")
+    for name, r in results.items():
+        print(f"{name:<10}{r['rps']:>10}{r['p50_ms']:>10}{r['p90_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}  {r['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,21 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory
 from flask_cors import CORS
 import os
 import pandas as pd
 import numpy as np
-import pickle
+import time
+from urllib.parse import urlencode
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache, feature_keys, PREDICTION_CACHE_MAX_ROWS
+from tree_compiler import compiled_loader
+from preprocessing_plan import plan_loader, PLAN_PATH
+from asgi_bridge import WsgiBridge
+from metrics import REGISTRY, METRICS_ENABLED, CONTENT_TYPE, stage_timers, track_model_versions
+from profiler import RequestProfiler
 from rejection_handler import (
-    save_rejected_application, send_rejection_email,
-    get_rejected_applications, get_rejection_stats, init_database
+    save_rejected_applications_bulk,
+    query_rejected_applications, get_rejection_stats, get_rejection_rollups, init_database,
+    save_application_labels, DEFAULT_PAGE_SIZE
 )
 
 BASE_DIR = os.path.dirname(__file__)
@@ -19,30 +28,67 @@ CORS(app)
 # Initialize database on startup
 init_database()
 
+# Model and preprocessing plan are loaded once and hot-swapped when the files change; the
+# forest is compiled to packed node arrays for small batches (tree_compiler.py). Models
+# trained before train_loan_model.py wrote the plan get one derived from scaler.pkl.
+loan_models = ModelRegistry('loan', {'model': MODEL_PATH,
+                                     'plan': PLAN_PATH if os.path.exists(PLAN_PATH) else SCALER_PATH},
+                            loader=compiled_loader(plan_loader)).start()
 
-def load_model_and_scaler():
-    if not os.path.exists(MODEL_PATH) or not os.path.exists(SCALER_PATH):
-        return None, None
-    with open(MODEL_PATH, 'rb') as f:
-        model = pickle.load(f)
-    with open(SCALER_PATH, 'rb') as f:
-        scaler = pickle.load(f)
-    return model, scaler
+# Probabilities for recently seen applications; emptied whenever the model is swapped
+prediction_cache = PredictionCache()
+loan_models.add_listener(prediction_cache.invalidate)
 
+# /metrics: per-stage latency of /predict, decisions, cache size and model version
+STAGES = stage_timers('loan', ('parse', 'preprocess', 'predict', 'persist', 'total'))
+DECISIONS = REGISTRY.counter('loan_decisions_total', 'Scored loan applications by decision', ('decision',))
+APPROVED, REJECTED = DECISIONS.labels(decision='approved'), DECISIONS.labels(decision='rejected')
+REGISTRY.gauge('prediction_cache_entries', 'Probabilities held in the prediction cache') \
+    .set_function(lambda: len(prediction_cache))
+track_model_versions(loan_models)
 
-def preprocess_input(df):
-    # Basic cleaning and mapping consistent with training
-    df = df.copy()
-    df.columns = df.columns.str.strip()
-    if 'education' in df.columns and df['education'].dtype == object:
-        df['education'] = df['education'].str.strip().map({'Graduate':1, 'Not Graduate':0})
-    if 'self_employed' in df.columns and df['self_employed'].dtype == object:
-        df['self_employed'] = df['self_employed'].str.strip().map({'Yes':1, 'No':0})
-    # select numeric features
-    X = df.select_dtypes(include=[np.number]).fillna(0)
-    # Drop target and id columns if present
-    X = X.drop(columns=['loan_status', 'loan_id'], errors='ignore')
-    return X
+# cProfile/stack samples of selected requests, served under /admin/profiles (see profiler.py)
+profiler = RequestProfiler('loan').install(app)
+
+
+def load_model_and_plan():
+    artifact = loan_models.current()
+    if artifact is None:
+        return None, None, None
+    return artifact['model'], artifact['plan'], artifact.version
+
+
+def first_present(df, columns, default=None):
+    """Per row, the first non-empty value among `columns` (like chained `or` over dict.get)"""
+    out = pd.Series(default, index=df.index, dtype=object)
+    for col in reversed(columns):
+        if col in df.columns:
+            values = df[col]
+            present = values.notna() & (values.astype(str) != '')
+            out = values.where(present, out)
+    return out
+
+
+def predict_proba_cached(model, X, version):
+    """predict_proba for plan-transformed rows; small requests reuse probabilities cached for identical rows.
+
+    Returns (proba, cache_hits). Only the model call is skipped for cached rows;
+    everything downstream still runs per submission.
+    """
+    if len(X) > PREDICTION_CACHE_MAX_ROWS:
+        return model.predict_proba(X), 0
+    keys = feature_keys(X, version)
+    cached = prediction_cache.get_many(keys)
+    missing = [i for i, value in enumerate(cached) if value is None]
+    proba = np.empty((len(X), len(model.classes_)), dtype=np.float64)
+    if missing:
+        computed = model.predict_proba(X[missing])
+        proba[missing] = computed
+        prediction_cache.put_many([keys[i] for i in missing], list(computed))
+    for i, value in enumerate(cached):
+        if value is not None:
+            proba[i] = value
+    return proba, len(X) - len(missing)
 
 
 @app.route('/', methods=['GET'])
@@ -52,14 +98,21 @@ def home():
 
 @app.route('/health', methods=['GET'])
 def health():
-    model, scaler = load_model_and_scaler()
-    return jsonify({'status':'ok', 'model_loaded': model is not None})
+    return jsonify({'status':'ok', **loan_models.describe(), 'prediction_cache': prediction_cache.stats()})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled (METRICS_ENABLED=false)'}), 404
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    model, scaler = load_model_and_scaler()
-    if model is None or scaler is None:
+    started = time.perf_counter()
+    model, plan, version = load_model_and_plan()
+    if model is None or plan is None:
         return jsonify({'error':'Model not trained. Run training first.'}), 400
 
     # Accept JSON single record or CSV file upload
@@ -67,84 +120,139 @@ def predict():
     applicant_name = None
     if request.files and 'file' in request.files:
         file = request.files['file']
-        df = pd.read_csv(file)
-        df_original = df.copy()  # Keep original data with all fields
-        X = preprocess_input(df)
+        with STAGES['parse'].time():
+            df_original = pd.read_csv(file)
+        with STAGES['preprocess'].time():
+            X = plan.transform_frame(df_original)
     else:
-        payload = request.get_json(force=True)
+        with STAGES['parse'].time():
+            payload = request.get_json(force=True)
         # Extract email and name from payload if provided
         if isinstance(payload, dict):
             applicant_email = payload.get('email') or payload.get('applicant_email')
             applicant_name = payload.get('applicant_name')
-            df = pd.DataFrame([payload])
-        elif isinstance(payload, list):
-            df = pd.DataFrame(payload)
+            records = [payload]
+        elif isinstance(payload, list) and all(isinstance(r, dict) for r in payload):
+            records = payload
         else:
             return jsonify({'error':'Invalid JSON payload'}), 400
-        df_original = df.copy()  # Keep original data with all fields
-        X = preprocess_input(df)
+        # the plan reads the records directly; a frame is only built for rejected rows
+        with STAGES['preprocess'].time():
+            X = plan.transform_records(records)
+        df_original = None
 
-    # align columns to scaler / training features
-    try:
-        X_scaled = scaler.transform(X)
-    except ValueError as e:
-        # If feature names don't match, try to reindex to scaler feature names
-        feature_names = scaler.get_feature_names_out() if hasattr(scaler, 'get_feature_names_out') else None
-        if feature_names is not None:
-            X = X.reindex(columns=feature_names, fill_value=0)
-        X_scaled = scaler.transform(X)
-
-    probs = model.predict_proba(X_scaled)[:,1] if hasattr(model, 'predict_proba') else None
-    preds = model.predict(X_scaled)
-
-    results = []
-    for i in range(len(preds)):
-        approved = bool(preds[i])
-        probability = float(probs[i]) if probs is not None else None
-        
-        result = {
-            'index': int(i),
-            'approved': approved,
-            'probability': probability
-        }
-        
-        # If rejected, save to database and send email notification
-        if not approved:
-            # Get the original data for this row (before preprocessing)
-            original_data = df_original.iloc[i].to_dict()
-            
-            # Use the email and name extracted earlier from the payload
-            email_to_use = applicant_email or original_data.get('email') or original_data.get('applicant_email')
-            name_to_use = applicant_name or original_data.get('applicant_name', 'Applicant')
-            
-            # Save to database
-            save_rejected_application(original_data, 1 - probability, email_to_use)
-            
-            # Send email if email provided
-            if email_to_use:
-                email_sent = send_rejection_email(
-                    name_to_use,
-                    email_to_use,
-                    original_data,
-                    1 - probability
-                )
-                result['email_sent'] = email_sent
-                if not email_sent:
-                    result['email_warning'] = 'Email notification failed - check server configuration'
-            else:
-                result['email_sent'] = False
+    cache_hits = 0
+    with STAGES['predict'].time():
+        if hasattr(model, 'predict_proba'):
+            proba, cache_hits = predict_proba_cached(model, X, version)
+            probs = proba[:, 1]
+            # same decision as model.predict without a second pass over the forest
+            preds = model.classes_[proba.argmax(axis=1)]
+        else:
+            probs = None
+            preds = model.predict(X)
+
+    approved = preds.astype(bool)
+    n_approved = int(approved.sum())
+    APPROVED.inc(n_approved)
+    REJECTED.inc(len(approved) - n_approved)
+    results = pd.DataFrame({
+        'index': np.arange(len(preds)),
+        'approved': approved,
+        'probability': probs.astype(float) if probs is not None else None,
+    }).to_dict('records')
+
+    # Rejected rows are persisted in bulk; their emails go to the notification outbox
+    # in the same transaction and are delivered in the background
+    rejected = np.flatnonzero(~approved)
+    if len(rejected):
+        if df_original is not None:
+            df_rejected = df_original.iloc[rejected]
+        else:
+            df_rejected = pd.DataFrame([records[i] for i in rejected])
+        rejection_probs = 1 - probs[rejected]
+
+        emails = first_present(df_rejected, ['email', 'applicant_email'])
+        if applicant_email:
+            emails[:] = applicant_email
+        names = first_present(df_rejected, ['applicant_name'], 'Applicant')
+        if applicant_name:
+            names[:] = applicant_name
+
+        with STAGES['persist'].time():
+            rejection_ids = save_rejected_applications_bulk(df_rejected, rejection_probs, emails, names=names)
+
+        for pos, email, rejection_id in zip(rejected, emails, rejection_ids):
+            result = results[pos]
+            result['rejection_id'] = rejection_id
+            # email_sent flips to 1 in rejected_applications once delivery is confirmed
+            result['email_sent'] = False
+            result['email_queued'] = bool(email)
+            if not email:
                 result['email_warning'] = 'No email address provided'
-        
-        results.append(result)
 
-    return jsonify(results)
+    elapsed = time.perf_counter() - started
+    STAGES['total'].observe(elapsed)
+    rows_per_sec = len(results) / elapsed if elapsed > 0 else float('inf')
+    response = jsonify(results)
+    response.headers['X-Rows-Per-Second'] = f'{rows_per_sec:.1f}'
+    response.headers['X-Scoring-Time-Ms'] = f'{elapsed * 1000:.1f}'
+    response.headers['X-Cache-Hits'] = str(cache_hits)
+    return response
 
 
 @app.route('/admin/rejected-applications', methods=['GET'])
 def admin_rejected_applications():
-    """Get all rejected applications (admin endpoint)"""
-    applications = get_rejected_applications()
-    return jsonify(applications)
+    """Get one page of rejected applications (admin endpoint)
+
+    Query params: limit, cursor, fields (comma separated), email, min_cibil, max_cibil,
+    start_date, end_date, email_sent. The body stays a JSON array; the cursor for the
+    next page is returned in the X-Next-Cursor header and a Link rel="next" header.
+    """
+    args = request.args
+    email_sent = args.get('email_sent')
+    fields = args.get('fields')
+    try:
+        applications, next_cursor = query_rejected_applications(
+            limit=args.get('limit', DEFAULT_PAGE_SIZE),
+            cursor=args.get('cursor'),
+            columns=[f.strip() for f in fields.split(',') if f.strip()] if fields else None,
+            email=args.get('email'),
+            min_cibil=args.get('min_cibil'),
+            max_cibil=args.get('max_cibil'),
+            start_date=args.get('start_date'),
+            end_date=args.get('end_date'),
+            email_sent=None if email_sent is None else email_sent.lower() in ('1', 'true', 'yes'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify(applications)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = args.to_dict()
+        next_args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    return response
+
+
+@app.route('/admin/rejected-applications/labels', methods=['POST'])
+def admin_label_applications():
+    """Record analyst decisions for incremental retraining (incremental_training.py)
+
+    Body: {"labels": [{"id": 12, "loan_status": "Approved"}, ...], "analyst": "..."}
+    or just the list. Relabelling an application replaces its earlier label.
+    """
+    body = request.get_json(silent=True)
+    labels = body.get('labels') if isinstance(body, dict) else body
+    if not isinstance(labels, list) or not all(isinstance(l, dict) for l in labels):
+        return jsonify({'error': 'Expected a list of {"id": ..., "loan_status": ...} objects'}), 400
+    try:
+        stored = save_application_labels([(l['id'], l['loan_status']) for l in labels],
+                                         analyst=body.get('analyst') if isinstance(body, dict) else None)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid label: {e}'}), 400
+    return jsonify({'labelled': stored, 'skipped': len(labels) - stored})
 
 
 @app.route('/admin/rejection-stats', methods=['GET'])
@@ -154,5 +262,25 @@ def admin_rejection_stats():
     return jsonify(stats)
 
 
+@app.route('/admin/rejection-stats/rollups', methods=['GET'])
+def admin_rejection_rollups():
+    """Hourly/daily rejection rollups: ?granularity=hour|day&start=...&end=...&limit=N"""
+    args = request.args
+    try:
+        rollups = get_rejection_rollups(
+            granularity=args.get('granularity', 'hour'),
+            start=args.get('start'),
+            end=args.get('end'),
+            limit=args.get('limit', 168),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(rollups)
+
+
+# ASGI entry point: uvicorn loan_api:asgi_app --port 5001 (see asgi_bridge.py)
+asgi_app = WsgiBridge(app, name='loan')
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,306 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Both apps share one registry per process. Each serves it as plain text on
+``GET /metrics``:
+- per-stage latency histograms (``request_stage_seconds{app,stage}``)
+- decision counters
+- gauges for queue depths and the loaded model versions
+
+Recording is a lock and a few additions. Gauges whose value already lives
+somewhere else (queue sizes, outbox backlog, model version) are callbacks, run
+only when ``/metrics`` is scraped. With ``METRICS_ENABLED=false`` every record
+call returns immediately and ``/metrics`` answers 404.
+"""
+import bisect
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Set to false to turn recording (and the /metrics endpoint) off
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; spans a cached single-row prediction (sub-ms) up to a large CSV upload
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def labels(self, **labels):
+        """The child for one label combination; hold on to it on hot paths."""
+        key = self._key(labels)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', *self.samples()]
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float):
+        if METRICS_ENABLED:
+            self.value = float(value)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0, **labels):
+        if METRICS_ENABLED:
+            self.labels(**labels).inc(amount)
+
+    def samples(self):
+        for key, child in sorted(self._children.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}'
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time by ``set_function``.
+
+    The function returns a number, or a dict of label-value tuples to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._function: Optional[Callable] = None
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float, **labels):
+        if METRICS_ENABLED:
+            self.labels(**labels).set(value)
+
+    def set_function(self, function: Callable):
+        self._function = function
+        return self
+
+    def samples(self):
+        values = {key: child.value for key, child in self._children.items()}
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception:
+                result = None
+            if isinstance(result, dict):
+                values.update({tuple(map(str, k if isinstance(k, tuple) else (k,))): v
+                               for k, v in result.items() if v is not None})
+            elif result is not None:
+                values[()] = result
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'total', '_lock')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+
+    def time(self):
+        return _Timer(self) if METRICS_ENABLED else _NULL_TIMER
+
+    def snapshot(self) -> Dict[str, object]:
+        """Cumulative bucket counts, count and sum as a dict (for JSON status endpoints)."""
+        with self._lock:
+            counts, total = list(self.counts), self.total
+        cumulative = list(itertools.accumulate(counts))
+        buckets = {_format_value(b): c for b, c in zip(self.bounds, cumulative)}
+        buckets['+Inf'] = cumulative[-1]
+        return {'buckets': buckets, 'count': cumulative[-1], 'sum': round(total, 6)}
+
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float, **labels):
+        if METRICS_ENABLED:
+            self.labels(**labels).observe(value)
+
+    def time(self, **labels):
+        """Context manager observing the elapsed seconds of its block."""
+        return self.labels(**labels).time() if METRICS_ENABLED else _NULL_TIMER
+
+    def samples(self):
+        for key, child in sorted(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.total
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f'Metric {name} is already registered differently')
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Shared by both apps (told apart by the app label)
+STAGE_SECONDS = REGISTRY.histogram(
+    'request_stage_seconds', 'Time spent per request stage', ('app', 'stage'))
+NOTIFICATIONS = REGISTRY.counter(
+    'notifications_total', 'Outbox deliveries by message kind and outcome', ('kind', 'outcome'))
+NOTIFY_SECONDS = REGISTRY.histogram(
+    'notification_send_seconds', 'Time to hand one message to SMTP/Twilio', ('kind',))
+MODEL_INFO = REGISTRY.gauge(
+    'model_info', 'Loaded model version (value is always 1)', ('model', 'version'))
+
+
+def stage_timers(app: str, stages: Sequence[str]) -> Dict[str, _HistogramChild]:
+    """Histogram children for ``app``'s stages, resolved once at import."""
+    return {stage: STAGE_SECONDS.labels(app=app, stage=stage) for stage in stages}
+
+
+_tracked_registries = []
+
+
+def _model_versions():
+    out = {}
+    for registry in _tracked_registries:
+        artifact = registry.current()
+        if artifact is not None:
+            out[(registry.name, artifact.version)] = 1
+    return out
+
+
+MODEL_INFO.set_function(_model_versions)
+
+
+def track_model_versions(*registries):
+    """Report each ModelRegistry's current version through ``model_info``."""
+    _tracked_registries.extend(registries)
@@ -0,0 +1,158 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from metrics import REGISTRY
+
+# Batching policy, overridable from the environment
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "256"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "10000"))
+# How long a caller waits for its result before giving up
+BATCH_RESULT_TIMEOUT = float(os.getenv("BATCH_RESULT_TIMEOUT", "10"))
+
+
+class QueueFullError(RuntimeError):
+    """Raised by ``submit`` when the scheduler already holds ``max_queue`` pending rows."""
+
+
+def _powers_of_two(limit):
+    bounds, b = [], 1
+    while b < limit:
+        bounds.append(b)
+        b *= 2
+    return bounds + [limit]
+
+
+BATCH_SIZE_ROWS = REGISTRY.histogram(
+    'batch_size_rows', 'Rows per micro-batched model call', ('batcher',), buckets=_powers_of_two(BATCH_MAX_SIZE))
+BATCH_QUEUE_DEPTH = REGISTRY.histogram(
+    'batch_queue_depth_rows', 'Rows waiting when a batch is dispatched', ('batcher',),
+    buckets=_powers_of_two(max(BATCH_MAX_QUEUE, 1)))
+BATCH_LATENCY = REGISTRY.histogram(
+    'batch_latency_seconds', 'Time from submit to result for one row', ('batcher',))
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-row predictions into matrix calls.
+
+    Callers ``submit`` one feature vector and get a Future back (or block in
+    ``predict``). A single scheduler thread takes the first waiting row, keeps
+    collecting until ``max_batch_size`` rows are queued or ``max_wait_ms`` has
+    passed since that first row arrived, stacks them into one matrix and calls
+    ``predict_fn`` once. Result ``i`` of the returned array goes back to the
+    ``i``-th caller, so under load each model call amortizes its overhead over
+    many rows while a lone request waits at most ``max_wait_ms``.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray], max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS, max_queue: int = BATCH_MAX_QUEUE,
+                 dtype=np.float32, name: str = 'batcher'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.dtype = np.dtype(dtype)
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # this batcher's series in the shared metrics registry (also on /metrics)
+        self.batch_sizes = BATCH_SIZE_ROWS.labels(batcher=name)
+        self.queue_depths = BATCH_QUEUE_DEPTH.labels(batcher=name)
+        self.latency = BATCH_LATENCY.labels(batcher=name)
+        self.rejected = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+
+    def start(self) -> 'MicroBatcher':
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'{self.name}-scheduler', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, row) -> Future:
+        """Queue one feature vector; the Future resolves to its prediction."""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        try:
+            self._queue.put_nowait((np.asarray(row, dtype=self.dtype), future, time.perf_counter()))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError(f'{self.name} queue is full ({self._queue.maxsize} pending rows)')
+        return future
+
+    def predict(self, row, timeout: float = BATCH_RESULT_TIMEOUT):
+        return self.submit(row).result(timeout)
+
+    def _collect(self) -> List[tuple]:
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # drain whatever is already queued without sleeping
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            depth = self._queue.qsize()
+            self.queue_depths.observe(depth + len(batch))
+            self.max_queue_depth = max(self.max_queue_depth, depth + len(batch))
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                X = np.stack([row for row, _, _ in batch])
+                results = self.predict_fn(X)
+            except Exception as e:
+                self.errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, enqueued), result in zip(batch, results):
+                self.latency.observe(done - enqueued)
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_depth_at_dispatch': self.queue_depths.snapshot(),
+            'latency_seconds': self.latency.snapshot(),
+        }
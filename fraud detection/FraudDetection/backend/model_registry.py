@@ -0,0 +1,180 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+# How often (seconds) the watcher thread checks artifact files for changes
+RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "5"))
+
+
+def pickle_loader(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _file_signature(path: str):
+    """Cheap change detector: (mtime_ns, size). None if the file is missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _checksum(paths: Dict[str, str]) -> str:
+    digest = hashlib.sha256()
+    for key in sorted(paths):
+        digest.update(key.encode())
+        with open(paths[key], 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def estimate_memory_bytes(obj: Any, _seen=None) -> int:
+    """Approximate in-memory size of a fitted model (numpy buffers dominate)."""
+    if _seen is None:
+        _seen = {}
+    if id(obj) in _seen:
+        return 0
+    # keep a reference so temporary objects (e.g. __getstate__ dicts) can't recycle ids
+    _seen[id(obj)] = obj
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    # xgboost: the booster lives in C++, its raw buffer is a good proxy
+    if hasattr(obj, 'get_booster'):
+        try:
+            return len(obj.get_booster().save_raw())
+        except Exception:
+            pass
+    # sklearn Tree objects expose their node/value arrays through __getstate__
+    if type(obj).__name__ == 'Tree' and hasattr(obj, '__getstate__'):
+        return sum(estimate_memory_bytes(v, _seen) for v in obj.__getstate__().values())
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_memory_bytes(v, _seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_memory_bytes(v, _seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + estimate_memory_bytes(vars(obj), _seen)
+    return sys.getsizeof(obj)
+
+
+class ModelArtifact:
+    """An immutable snapshot of one loaded set of model files."""
+
+    def __init__(self, objects: Dict[str, Any], version: str, load_seconds: float, memory_bytes: int):
+        self.objects = objects
+        self.version = version
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+
+    def __getitem__(self, key):
+        return self.objects[key]
+
+
+class ModelRegistry:
+    """Loads model artifacts once per process and hot-swaps them when the files change.
+
+    Callers grab a snapshot with ``current()`` and use it for the whole request, so a
+    swap in the middle of a request never mixes an old model with a new scaler and
+    in-flight requests keep using the artifact they started with.
+    """
+
+    def __init__(self, name: str, paths: Dict[str, str], loader: Callable[[str], Any] = pickle_loader,
+                 reload_interval: float = RELOAD_INTERVAL):
+        self.name = name
+        self.paths = dict(paths)
+        self.loader = loader
+        self.reload_interval = reload_interval
+        self._artifact: Optional[ModelArtifact] = None
+        self._signatures = None
+        self._last_error = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._listeners = []
+
+    def add_listener(self, callback: Callable[[ModelArtifact], Any]):
+        """Call ``callback(new_artifact)`` after every swap (e.g. to drop cached predictions)."""
+        self._listeners.append(callback)
+
+    def current(self) -> Optional[ModelArtifact]:
+        """Return the active artifact (None until all files exist and load cleanly)."""
+        return self._artifact
+
+    def load(self) -> bool:
+        """(Re)load the artifacts if any file changed on disk. Returns True on swap."""
+        with self._lock:
+            signatures = {k: _file_signature(p) for k, p in self.paths.items()}
+            if any(sig is None for sig in signatures.values()):
+                return False
+            if signatures == self._signatures:
+                return False
+
+            start = time.perf_counter()
+            try:
+                version = _checksum(self.paths)
+                if self._artifact is not None and version == self._artifact.version:
+                    # touched but identical content - nothing to swap
+                    self._signatures = signatures
+                    return False
+                objects = {k: self.loader(p) for k, p in self.paths.items()}
+            except Exception as e:
+                # Keep serving the previous model if the new files are half-written/corrupt
+                self._last_error = str(e)
+                print(f"⚠️ Failed to load {self.name} model artifacts: {e}")
+                return False
+
+            load_seconds = time.perf_counter() - start
+            memory_bytes = sum(estimate_memory_bytes(obj) for obj in objects.values())
+            self._artifact = ModelArtifact(objects, version, load_seconds, memory_bytes)
+            self._signatures = signatures
+            self._last_error = None
+            print(f"✅ Loaded {self.name} model version {version} in {load_seconds*1000:.1f} ms")
+            for callback in self._listeners:
+                try:
+                    callback(self._artifact)
+                except Exception as e:
+                    print(f"⚠️ {self.name} model swap listener failed: {e}")
+            return True
+
+    def start(self) -> 'ModelRegistry':
+        """Load now and start a daemon thread that polls the files for changes."""
+        self.load()
+        if self._watcher is None and self.reload_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name=f'{self.name}-model-watcher', daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            self.load()
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary suitable for a /health response."""
+        artifact = self._artifact
+        info = {
+            'model_loaded': artifact is not None,
+            'artifacts': self.paths,
+        }
+        if artifact is not None:
+            info.update({
+                'version': artifact.version,
+                'loaded_at': artifact.loaded_at,
+                'load_time_ms': round(artifact.load_seconds * 1000, 2),
+                'memory_bytes': artifact.memory_bytes,
+            })
+        if self._last_error:
+            info['last_error'] = self._last_error
+        return info
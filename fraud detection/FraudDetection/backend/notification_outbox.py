@@ -0,0 +1,323 @@
+import json
+import os
+import random
+import smtplib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import NOTIFICATIONS, NOTIFY_SECONDS, REGISTRY
+
+# Worker pool / delivery policy, overridable from the environment
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "30"))
+OUTBOX_RETRY_MAX = 3600.0
+# Messages per second across all workers (SMTP providers throttle bursts)
+OUTBOX_RATE_PER_SEC = float(os.getenv("OUTBOX_RATE_PER_SEC", "10"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+# Close pooled SMTP sessions after this long without traffic
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+# A message stuck in 'sending' this long belongs to a dead worker and is claimed again
+STALE_CLAIM_SECONDS = 300
+
+OUTBOX_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        kind TEXT NOT NULL,
+        ref_id INTEGER,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        claimed_at REAL,
+        sent_at TIMESTAMP,
+        last_error TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (status, next_attempt_at)',
+]
+
+
+# Started outboxes, for the backlog gauge (counted at scrape time)
+_running: List['NotificationOutbox'] = []
+
+
+def _backlog():
+    out = {}
+    for outbox in list(_running):
+        for status, count in outbox.stats().items():
+            out[(outbox.name, status)] = count
+    return out
+
+
+REGISTRY.gauge('notification_outbox_messages', 'Outbox messages by status', ('outbox', 'status')).set_function(_backlog)
+
+
+class PermanentDeliveryError(Exception):
+    """Raised by a sender when retrying can never succeed (e.g. recipient refused)."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire`` blocks until a token is available."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SmtpSession:
+    """A reusable, lazily (re)connected SMTP session with STARTTLS + login."""
+
+    def __init__(self, host: str, port: int, user: str, password: str, idle_timeout: float = SMTP_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        server.starttls()
+        server.login(self.user, self.password)
+        self._server = server
+
+    def send(self, msg):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # the server dropped an idle session; reconnect once and retry
+            self.close()
+            self._connect()
+            self._server.send_message(msg)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentDeliveryError(str(e))
+        self._last_used = time.monotonic()
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+
+class NotificationOutbox:
+    """Durable outbox table drained by a pool of background sender threads.
+
+    Producers call ``enqueue``/``enqueue_many`` (optionally inside their own write
+    transaction, so the message commits atomically with the business row) and
+    return immediately. Workers claim due messages in batches, send them through
+    per-worker senders that keep their connections open, and retry failures with
+    exponential backoff. ``on_delivered`` callbacks run in the same transaction
+    that marks messages sent.
+
+    ``sender_factories`` maps a message kind to a zero-argument factory returning
+    an object with ``send(payload)`` and ``close()``; each worker builds its own.
+    """
+
+    def __init__(self, pool, sender_factories: Dict[str, Callable[[], Any]], workers: int = OUTBOX_WORKERS,
+                 batch_size: int = OUTBOX_BATCH_SIZE, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 retry_base: float = OUTBOX_RETRY_BASE, rate_per_sec: float = OUTBOX_RATE_PER_SEC,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, name: str = 'outbox'):
+        self.name = name
+        self.pool = pool
+        self.sender_factories = dict(sender_factories)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.rate_limiter = TokenBucket(rate_per_sec)
+        self._delivered_callbacks: Dict[str, List[Callable]] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        with pool.transaction() as conn:
+            for statement in OUTBOX_SCHEMA:
+                conn.execute(statement)
+
+    def on_delivered(self, kind: str, callback: Callable[[Any, List[int]], None]):
+        """Register ``callback(conn, ref_ids)`` for delivered messages of ``kind``."""
+        self._delivered_callbacks.setdefault(kind, []).append(callback)
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], ref_id: Optional[int] = None, conn=None):
+        self.enqueue_many([(kind, payload, ref_id)], conn=conn)
+
+    def enqueue_many(self, messages: Iterable[Tuple[str, Dict[str, Any], Optional[int]]], conn=None):
+        """Queue (kind, payload, ref_id) messages.
+
+        Pass ``conn`` to join the caller's open transaction; the caller should then
+        call ``notify()`` after committing so idle workers pick the messages up.
+        """
+        rows = [(kind, json.dumps(payload, default=str), ref_id) for kind, payload, ref_id in messages]
+        if not rows:
+            return 0
+        sql = 'INSERT INTO notification_outbox (kind, payload, ref_id) VALUES (?, ?, ?)'
+        if conn is not None:
+            conn.executemany(sql, rows)
+        else:
+            with self.pool.transaction() as own_conn:
+                own_conn.executemany(sql, rows)
+            self.notify()
+        return len(rows)
+
+    def notify(self):
+        """Wake idle workers so newly committed messages are sent without waiting for the next poll."""
+        self._wakeup.set()
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        if self._threads:
+            return self
+        with self._lock:
+            if self._threads:
+                return self
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'outbox-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            _running.append(self)
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self.pool.connection() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM notification_outbox GROUP BY status').fetchall()
+        return dict(rows)
+
+    def _claim(self):
+        """Claim due messages, plus any whose claim expired (its worker died mid-send)."""
+        now = time.time()
+        with self.pool.transaction() as conn:
+            rows = conn.execute(
+                '''SELECT id, kind, payload, ref_id, attempts FROM notification_outbox
+                   WHERE (status = 'pending' AND next_attempt_at <= ?)
+                      OR (status = 'sending' AND claimed_at < ?)
+                   ORDER BY id LIMIT ?''', (now, now - STALE_CLAIM_SECONDS, self.batch_size)).fetchall()
+            if rows:
+                conn.executemany("UPDATE notification_outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+                                 [(now, row[0]) for row in rows])
+        return rows
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(OUTBOX_RETRY_MAX, self.retry_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _finish(self, delivered, failed):
+        now = time.time()
+        with self.pool.transaction() as conn:
+            if delivered:
+                conn.executemany(
+                    "UPDATE notification_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, "
+                    "attempts = attempts + 1, last_error = NULL WHERE id = ?",
+                    [(msg_id,) for msg_id, _, _ in delivered])
+                by_kind: Dict[str, List[int]] = {}
+                for _, kind, ref_id in delivered:
+                    if ref_id is not None:
+                        by_kind.setdefault(kind, []).append(ref_id)
+                for kind, ref_ids in by_kind.items():
+                    for callback in self._delivered_callbacks.get(kind, []):
+                        callback(conn, ref_ids)
+            for msg_id, attempts, error, permanent in failed:
+                if permanent or attempts >= self.max_attempts:
+                    conn.execute("UPDATE notification_outbox SET status = 'failed', attempts = ?, last_error = ? "
+                                 "WHERE id = ?", (attempts, error, msg_id))
+                else:
+                    conn.execute("UPDATE notification_outbox SET status = 'pending', attempts = ?, last_error = ?, "
+                                 "next_attempt_at = ? WHERE id = ?",
+                                 (attempts, error, now + self._backoff(attempts), msg_id))
+
+    def _run(self):
+        senders: Dict[str, Any] = {}
+        last_activity = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    batch = self._claim()
+                except Exception as e:
+                    print(f"⚠️ Outbox claim failed: {e}")
+                    batch = []
+
+                if not batch:
+                    if senders and time.monotonic() - last_activity > SMTP_IDLE_TIMEOUT:
+                        self._close_senders(senders)
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+
+                delivered, failed = [], []
+                for msg_id, kind, payload, ref_id, attempts in batch:
+                    try:
+                        factory = self.sender_factories.get(kind)
+                        if factory is None:
+                            raise PermanentDeliveryError(f'no sender registered for {kind!r}')
+                        sender = senders.get(kind)
+                        if sender is None:
+                            sender = senders[kind] = factory()
+                        self.rate_limiter.acquire()
+                        with NOTIFY_SECONDS.time(kind=kind):
+                            sender.send(json.loads(payload))
+                        delivered.append((msg_id, kind, ref_id))
+                        NOTIFICATIONS.inc(kind=kind, outcome='sent')
+                    except PermanentDeliveryError as e:
+                        failed.append((msg_id, attempts + 1, str(e), True))
+                        NOTIFICATIONS.inc(kind=kind, outcome='failed')
+                    except Exception as e:
+                        failed.append((msg_id, attempts + 1, str(e), False))
+                        NOTIFICATIONS.inc(kind=kind, outcome='retry')
+                        # a broken session shouldn't poison the rest of the batch
+                        broken = senders.pop(kind, None)
+                        if broken is not None:
+                            broken.close()
+                last_activity = time.monotonic()
+
+                try:
+                    self._finish(delivered, failed)
+                except Exception as e:
+                    print(f"⚠️ Outbox bookkeeping failed: {e}")
+        finally:
+            self._close_senders(senders)
+
+    @staticmethod
+    def _close_senders(senders):
+        for sender in senders.values():
+            try:
+                sender.close()
+            except Exception:
+                pass
+        senders.clear()
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Most cached predictions kept, and how long (seconds) each stays valid
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "300"))
+# Larger requests (bulk CSV uploads) bypass the cache instead of flushing it
+PREDICTION_CACHE_MAX_ROWS = int(os.getenv("PREDICTION_CACHE_MAX_ROWS", "64"))
+
+
+def feature_keys(X, version: str = '') -> List[bytes]:
+    """One canonical hash per row of a preprocessed feature frame/matrix.
+
+    Values are hashed as float64 with -0.0 folded into 0.0 and every NaN made the
+    same NaN. So the same application hashes the same whether a field arrived as
+    an int, a float or a string that parsed to one. Column names (when ``X`` is a
+    DataFrame) and the model version are part of the key.
+    """
+    columns = getattr(X, 'columns', None)
+    values = np.array(X, dtype=np.float64, copy=True)
+    values[values == 0] = 0.0
+    values[np.isnan(values)] = np.nan
+    values = np.ascontiguousarray(values)
+
+    prefix = hashlib.blake2b(digest_size=16)
+    prefix.update(version.encode())
+    if columns is not None:
+        prefix.update('\x1f'.join(map(str, columns)).encode())
+    keys = []
+    for row in values:
+        h = prefix.copy()
+        h.update(row.tobytes())
+        keys.append(h.digest())
+    return keys
+
+
+class PredictionCache:
+    """Bounded LRU cache of model outputs with a per-entry TTL.
+
+    Only predictions are cached; callers still run their per-request side effects
+    (persisting rejections, queueing emails) for cached rows. ``invalidate`` is
+    hooked to the model registry so a swapped model never serves old entries.
+    """
+
+    def __init__(self, capacity: int = PREDICTION_CACHE_SIZE, ttl: float = PREDICTION_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: 'OrderedDict[bytes, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[Any]]:
+        """Cached value per key, None for misses (expired entries are dropped)."""
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    out.append(entry[1])
+        return out
+
+    def put_many(self, keys: Sequence[bytes], values: Sequence[Any]):
+        if self.capacity <= 0:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = (expires, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *_):
+        """Drop every entry (registered as a model-swap listener, so it ignores its arguments)."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'capacity': self.capacity,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,196 @@
+"""Pre-fitted preprocessing for the loan model.
+
+``train_loan_model.py`` writes the whole input transform to one JSON file next to
+the model: the feature columns in model order, the code tables for the text
+categoricals, the per-column fill values and the fitted MinMax scale/offset. The
+loan API applies the plan in one pass. It writes straight into a preallocated
+float64 matrix, then fills and scales in place. No DataFrame copy, no
+``select_dtypes``, no separate ``scaler.transform``.
+
+Deployments trained before the plan existed only have scaler.pkl. ``plan_loader``
+derives the same plan from the pickled scaler for them.
+
+Usage:
+    python preprocessing_plan.py [--scaler scaler.pkl] [-o loan_preprocessing.json]
+"""
+import argparse
+import json
+import os
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from model_registry import pickle_loader
+
+BASE_DIR = os.path.dirname(__file__)
+PLAN_PATH = os.getenv("LOAN_PLAN_PATH", os.path.join(BASE_DIR, 'loan_preprocessing.json'))
+
+# Text categoricals and the codes the model was trained on
+CATEGORY_CODES = {
+    'education': {'Graduate': 1, 'Not Graduate': 0},
+    'self_employed': {'Yes': 1, 'No': 0},
+}
+# Never model inputs, even when numeric
+EXCLUDED_COLUMNS = ('loan_status', 'loan_id')
+# Value for missing, empty or unparseable fields (training fills NA with 0)
+FILL_VALUE = 0.0
+
+
+class PreprocessingPlan:
+    """Column order, categorical codes, fill values and MinMax scaling for loan inputs."""
+
+    def __init__(self, columns: Sequence[str], categories: Optional[Mapping[str, Mapping[str, float]]] = None,
+                 fill: Optional[Sequence[float]] = None, scale: Optional[Sequence[float]] = None,
+                 offset: Optional[Sequence[float]] = None, clip: Optional[Sequence[float]] = None,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.columns = [str(c) for c in columns]
+        k = len(self.columns)
+        self.categories = {col: dict(codes) for col, codes in (categories or {}).items() if col in self.columns}
+        self.fill = np.asarray(fill if fill is not None else [FILL_VALUE] * k, dtype=np.float64)
+        self.scale = np.asarray(scale if scale is not None else np.ones(k), dtype=np.float64)
+        self.offset = np.asarray(offset if offset is not None else np.zeros(k), dtype=np.float64)
+        self.clip = tuple(clip) if clip is not None else None
+        self.meta = dict(meta or {})
+        for name, arr in (('fill', self.fill), ('scale', self.scale), ('offset', self.offset)):
+            if arr.shape != (k,):
+                raise ValueError(f'Plan {name} has {arr.size} values for {k} columns')
+
+        self._index = {col: j for j, col in enumerate(self.columns)}
+        self._codes = [self.categories.get(col) for col in self.columns]
+        # raw record key -> column position (None for fields the model doesn't use)
+        self._keys: Dict[Any, Optional[int]] = {}
+
+    @classmethod
+    def from_scaler(cls, scaler, categories: Mapping[str, Mapping[str, float]] = CATEGORY_CODES,
+                    columns: Optional[Sequence[str]] = None, **meta) -> 'PreprocessingPlan':
+        """Plan for a fitted MinMaxScaler (its ``feature_names_in_`` give the column order)."""
+        if columns is None:
+            columns = getattr(scaler, 'feature_names_in_', None)
+        if columns is None:
+            raise ValueError('Scaler was fitted without feature names; pass the columns explicitly')
+        clip = getattr(scaler, 'feature_range', None) if getattr(scaler, 'clip', False) else None
+        return cls(columns, categories, scale=scaler.scale_, offset=scaler.min_, clip=clip, meta=meta)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'columns': self.columns,
+            'categories': self.categories,
+            'fill': self.fill.tolist(),
+            'scale': self.scale.tolist(),
+            'offset': self.offset.tolist(),
+            'clip': list(self.clip) if self.clip is not None else None,
+            'meta': self.meta,
+        }
+
+    def save(self, path: str = PLAN_PATH):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = PLAN_PATH) -> 'PreprocessingPlan':
+        with open(path) as f:
+            spec = json.load(f)
+        return cls(spec['columns'], spec.get('categories'), spec.get('fill'), spec.get('scale'),
+                   spec.get('offset'), spec.get('clip'), spec.get('meta'))
+
+    def _position(self, key) -> Optional[int]:
+        try:
+            return self._keys[key]
+        except KeyError:
+            j = self._index.get(str(key).strip())
+            if len(self._keys) < 1024:
+                self._keys[key] = j
+            return j
+
+    def _finish(self, out: np.ndarray) -> np.ndarray:
+        """Fill missing values and scale, in place."""
+        np.copyto(out, self.fill, where=np.isnan(out))
+        out *= self.scale
+        out += self.offset
+        if self.clip is not None:
+            np.clip(out, self.clip[0], self.clip[1], out=out)
+        return out
+
+    def transform_records(self, records: Sequence[Mapping[str, Any]]) -> np.ndarray:
+        """(n, k) model inputs for JSON records (dicts of field -> value)."""
+        out = np.full((len(records), len(self.columns)), np.nan, dtype=np.float64)
+        for i, record in enumerate(records):
+            for key, value in record.items():
+                j = self._position(key)
+                if j is None or value is None:
+                    continue
+                codes = self._codes[j]
+                if codes is not None and isinstance(value, str):
+                    out[i, j] = codes.get(value.strip(), np.nan)
+                    continue
+                try:
+                    out[i, j] = float(value)
+                except (TypeError, ValueError):
+                    pass
+        return self._finish(out)
+
+    def transform_frame(self, df: pd.DataFrame) -> np.ndarray:
+        """(n, k) model inputs for a parsed CSV (or any DataFrame of raw fields)."""
+        out = np.full((len(df), len(self.columns)), np.nan, dtype=np.float64)
+        for pos, name in enumerate(df.columns):
+            j = self._position(name)
+            if j is None:
+                continue
+            values = df.iloc[:, pos]
+            if pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+                out[:, j] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+                continue
+            codes = self._codes[j]
+            if codes is not None:
+                # map each distinct string once, then scatter the codes back by row
+                uniques, inverse = np.unique(values.astype(str).to_numpy(), return_inverse=True)
+                table = np.array([codes.get(u.strip(), np.nan) for u in uniques], dtype=np.float64)
+                mapped = table[inverse]
+                # numeric strings and already-encoded values still count
+                unmapped = np.isnan(mapped)
+                if unmapped.any():
+                    mapped[unmapped] = pd.to_numeric(values[unmapped], errors='coerce').to_numpy(dtype=np.float64)
+                out[:, j] = mapped
+            else:
+                out[:, j] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        return self._finish(out)
+
+    def transform(self, data) -> np.ndarray:
+        """Model inputs for a DataFrame, a list of records or a single record."""
+        if isinstance(data, pd.DataFrame):
+            return self.transform_frame(data)
+        if isinstance(data, Mapping):
+            data = [data]
+        return self.transform_records(data)
+
+    def describe(self) -> Dict[str, Any]:
+        return {'columns': len(self.columns), 'categorical': sorted(self.categories),
+                'trained_at': self.meta.get('trained_at'), 'source': self.meta.get('source', 'plan')}
+
+
+def plan_loader(path: str) -> Any:
+    """ModelRegistry loader: the JSON plan, or a plan derived from a pickled MinMaxScaler."""
+    if path.endswith('.json'):
+        return PreprocessingPlan.load(path)
+    obj = pickle_loader(path)
+    if hasattr(obj, 'scale_') and hasattr(obj, 'min_'):
+        return PreprocessingPlan.from_scaler(obj, source=os.path.basename(path))
+    return obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the loan preprocessing plan for an existing scaler.pkl')
+    parser.add_argument('--scaler', default=os.path.join(BASE_DIR, 'scaler.pkl'))
+    parser.add_argument('-o', '--output', default=PLAN_PATH)
+    args = parser.parse_args()
+
+    plan = PreprocessingPlan.from_scaler(pickle_loader(args.scaler), source=os.path.basename(args.scaler))
+    plan.save(args.output)
+    print(f"✅ Preprocessing plan for {len(plan.columns)} columns written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""On-demand request profiling for the Flask apps.
+
+``RequestProfiler(name).install(app)`` adds request hooks and the
+``/admin/profiles`` routes. Nothing is profiled until one of these happens:
+- ``POST /admin/profiles {"count": N}`` arms cProfile for the next N requests
+  (``"mode": "sample"`` uses the stack sampler instead).
+- A request carries ``X-Profile: <PROFILE_TOKEN>``. This only works when
+  ``PROFILE_TOKEN`` is set, so outside callers can't switch profiling on.
+- ``PROFILE_SLOW_MS`` (or ``"slow_ms"`` in the POST) is above zero. Every request
+  is then stack-sampled, and the samples are kept only if the request took longer.
+
+cProfile sees every call, so it shows exactly where one slow request goes, at
+about twice the request time. The sampler reads the handler thread's stack every
+``PROFILE_SAMPLE_MS`` from a background thread. The request itself runs at full
+speed, which is what makes the latency threshold cheap enough to leave on.
+Samples are written as collapsed stacks (``flamegraph.pl``/speedscope input).
+
+Each profile is one ``.prof`` (pstats) or ``.folded`` file plus a ``.json`` with
+the request's method, path, status and duration, in ``PROFILE_DIR``. Only the
+newest ``PROFILE_KEEP`` are kept. ``GET /admin/profiles`` lists them and
+``GET /admin/profiles/<id>`` renders one as text (``?raw=1`` downloads the file).
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from flask import Response, g, jsonify, request, send_from_directory
+
+# Directory for captured profiles
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), 'profiles'))
+# Profiles kept on disk; the oldest are deleted beyond this
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Keep a stack-sampled profile of every request slower than this (0 = off)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+# Stack sampling interval
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+# Value of the X-Profile request header that profiles that request (empty = header ignored)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_HEADER = 'X-Profile'
+# Upper bound for one POST /admin/profiles
+MAX_ARMED = 1000
+
+MODES = ('cprofile', 'sample')
+
+
+class StackSampler:
+    """Background thread counting the call stacks of registered threads."""
+
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_MS):
+        self.interval = max(interval_ms, 0.5) / 1000
+        self._active: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._labels: Dict[Any, str] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int) -> Counter:
+        counts = Counter()
+        with self._lock:
+            self._active[thread_id] = counts
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+            self._wake.set()
+        return counts
+
+    def stop(self, thread_id: int) -> Counter:
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+            if len(self._labels) < 65536:
+                self._labels[code] = label
+        return label
+
+    def _stack(self, frame) -> tuple:
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for thread_id, counts in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    counts[self._stack(frame)] += 1
+            del frames
+
+
+def folded(counts: Counter) -> str:
+    """Collapsed stacks, heaviest first: ``root;...;leaf <samples>`` per line."""
+    return ''.join(f"{';'.join(stack)} {n}\n" for stack, n in counts.most_common())
+
+
+class RequestProfiler:
+    """Captures cProfile or sampled-stack profiles of selected requests of one app."""
+
+    def __init__(self, name: str, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP,
+                 slow_ms: float = PROFILE_SLOW_MS, token: str = PROFILE_TOKEN,
+                 sampler: Optional[StackSampler] = None):
+        self.name = name
+        self.directory = directory
+        self.keep = keep
+        self.slow_ms = slow_ms
+        self.token = token
+        self.sampler = sampler or StackSampler()
+        self._lock = threading.Lock()
+        self._armed = 0
+        self._armed_mode = 'cprofile'
+        self.captured = 0
+        self.skipped = 0
+
+    def arm(self, count: int = 1, mode: str = 'cprofile') -> Dict[str, Any]:
+        """Profile the next ``count`` requests with ``mode``."""
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}')
+        count = int(count)
+        if not 0 <= count <= MAX_ARMED:
+            raise ValueError(f'count must be between 0 and {MAX_ARMED}')
+        with self._lock:
+            self._armed, self._armed_mode = count, mode
+        return self.stats()
+
+    def _choose(self):
+        """(mode, trigger) for the current request, or None to leave it alone."""
+        if self.token and request.headers.get(PROFILE_HEADER) == self.token:
+            return 'cprofile', 'header'
+        if self._armed:
+            with self._lock:
+                if self._armed:
+                    self._armed -= 1
+                    return self._armed_mode, 'armed'
+        if self.slow_ms > 0:
+            return 'sample', 'slow'
+        return None
+
+    def _before(self):
+        if request.path.startswith('/admin/profiles'):
+            return
+        choice = self._choose()
+        if choice is None:
+            return
+        mode, trigger = choice
+        profile = None
+        if mode == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is already active in this process (Python 3.12+); sample instead
+                profile, mode = None, 'sample'
+        g.profile = {
+            'id': f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{self.name}",
+            'mode': mode, 'trigger': trigger, 'profile': profile,
+            'samples': self.sampler.start(threading.get_ident()) if mode == 'sample' else None,
+            'started': time.perf_counter(),
+        }
+
+    def _after(self, response):
+        state = g.get('profile')
+        if state is not None:
+            state['status'] = response.status_code
+            if state['trigger'] != 'slow':
+                response.headers['X-Profile-Id'] = state['id']
+        return response
+
+    def _teardown(self, exc):
+        state = g.pop('profile', None)
+        if state is None:
+            return
+        duration_ms = (time.perf_counter() - state['started']) * 1000
+        if state['profile'] is not None:
+            state['profile'].disable()
+        if state['samples'] is not None:
+            self.sampler.stop(threading.get_ident())
+        if state['trigger'] == 'slow' and duration_ms < self.slow_ms:
+            self.skipped += 1
+            return
+        meta = {'id': state['id'], 'app': self.name, 'method': request.method, 'path': request.path,
+                'status': state.get('status', 500), 'duration_ms': round(duration_ms, 2),
+                'mode': state['mode'], 'trigger': state['trigger'],
+                'created': datetime.now().isoformat(timespec='seconds')}
+        try:
+            self._save(meta, state)
+        except OSError as e:
+            print(f"⚠️ Could not save profile {state['id']}: {e}")
+
+    def _save(self, meta: Dict[str, Any], state: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        if state['profile'] is not None:
+            meta['file'] = f"{meta['id']}.prof"
+            state['profile'].dump_stats(os.path.join(self.directory, meta['file']))
+        else:
+            meta['file'] = f"{meta['id']}.folded"
+            meta['samples'] = sum(state['samples'].values())
+            with open(os.path.join(self.directory, meta['file']), 'w') as f:
+                f.write(folded(state['samples']))
+        # metadata last: a profile is listed only once its data file is complete
+        with open(os.path.join(self.directory, f"{meta['id']}.json"), 'w') as f:
+            json.dump(meta, f)
+        with self._lock:
+            self.captured += 1
+            self._rotate()
+
+    def _rotate(self):
+        ids = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for stale in ids[:max(len(ids) - self.keep, 0)]:
+            for ext in ('.json', '.prof', '.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, stale + ext))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Metadata of the kept profiles (all apps sharing the directory), newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        out = []
+        for name in sorted((n for n in os.listdir(self.directory) if n.endswith('.json')), reverse=True)[:limit]:
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return out
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        for meta in self.list(limit=self.keep * 4):
+            if meta['id'] == profile_id:
+                return meta
+        return None
+
+    def render(self, meta: Dict[str, Any], sort: str = 'cumulative', limit: int = 40) -> str:
+        """Text report: pstats top functions, or the heaviest collapsed stacks."""
+        path = os.path.join(self.directory, meta['file'])
+        header = (f"{meta['method']} {meta['path']} -> {meta['status']} in {meta['duration_ms']} ms "
+                  f"({meta['mode']}, {meta['trigger']}, {meta['created']})\n\n")
+        if meta['mode'] == 'cprofile':
+            out = io.StringIO()
+            pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+            return header + out.getvalue()
+        with open(path) as f:
+            lines = f.readlines()
+        return header + ''.join(lines[:limit])
+
+    def stats(self) -> Dict[str, Any]:
+        return {'armed': self._armed, 'armed_mode': self._armed_mode, 'slow_ms': self.slow_ms,
+                'header': bool(self.token), 'captured': self.captured, 'skipped_fast': self.skipped,
+                'directory': self.directory, 'keep': self.keep}
+
+    def install(self, app):
+        """Register the request hooks and the /admin/profiles routes on ``app``."""
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/admin/profiles', 'admin_profiles', self._list_view, methods=['GET'])
+        app.add_url_rule('/admin/profiles', 'admin_profiles_arm', self._arm_view, methods=['POST'])
+        app.add_url_rule('/admin/profiles/<profile_id>', 'admin_profile', self._profile_view, methods=['GET'])
+        return self
+
+    def _list_view(self):
+        """Kept profiles, newest first: ?limit=N"""
+        try:
+            limit = int(request.args.get('limit', 100))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        return jsonify({'profiler': self.stats(), 'profiles': self.list(limit)})
+
+    def _arm_view(self):
+        """Arm profiling: {"count": N, "mode": "cprofile"|"sample", "slow_ms": X} (all optional)"""
+        body = request.get_json(silent=True) or {}
+        try:
+            if 'slow_ms' in body:
+                self.slow_ms = max(float(body['slow_ms']), 0.0)
+            stats = self.arm(body.get('count', 1), body.get('mode', 'cprofile'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(stats)
+
+    def _profile_view(self, profile_id):
+        """One profile as text: ?sort=cumulative|tottime|calls&limit=N, or ?raw=1 for the file"""
+        meta = self.get(profile_id)
+        if meta is None:
+            return jsonify({'error': f'No profile {profile_id}'}), 404
+        if request.args.get('raw', '').lower() in ('1', 'true', 'yes'):
+            return send_from_directory(self.directory, meta['file'], as_attachment=True)
+        try:
+            limit = int(request.args.get('limit', 40))
+            text = self.render(meta, request.args.get('sort', 'cumulative'), limit)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        except OSError:
+            return jsonify({'error': f'Profile {profile_id} was rotated away'}), 404
+        return Response(text, content_type='text/plain; charset=utf-8')
@@ -3,7 +3,14 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import sqlite3
 import os
+import base64
+import threading
 from datetime import datetime
+import numpy as np
+import pandas as pd
+from db_pool import ConnectionPool
+from notification_outbox import NotificationOutbox, SmtpSession, PermanentDeliveryError
+from audit_log import get_audit_logger
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'rejected_applications.db')
 
@@ -19,59 +26,276 @@ EMAIL_CONFIGURED = (SENDER_EMAIL != "your_email@gmail.com" and
                    SENDER_EMAIL and SENDER_PASSWORD)
 
 
+# Application fields persisted for each rejection, in table column order
+APPLICATION_FIELDS = [
+    'applicant_name', 'income_annum', 'loan_amount', 'loan_term', 'cibil_score',
+    'education', 'self_employed', 'no_of_dependents', 'residential_assets_value',
+    'commercial_assets_value', 'luxury_assets_value', 'bank_asset_value'
+]
+
+INSERT_REJECTION_SQL = '''
+    INSERT INTO rejected_applications (
+        applicant_name, income_annum, loan_amount, loan_term, cibil_score,
+        education, self_employed, no_of_dependents, residential_assets_value,
+        commercial_assets_value, luxury_assets_value, bank_asset_value,
+        debt_to_income_ratio, rejection_probability, rejection_reason, applicant_email
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS rejected_applications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        application_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        applicant_name TEXT,
+        income_annum REAL,
+        loan_amount REAL,
+        loan_term INTEGER,
+        cibil_score INTEGER,
+        education TEXT,
+        self_employed TEXT,
+        no_of_dependents INTEGER,
+        residential_assets_value REAL,
+        commercial_assets_value REAL,
+        luxury_assets_value REAL,
+        bank_asset_value REAL,
+        debt_to_income_ratio REAL,
+        rejection_probability REAL,
+        rejection_reason TEXT,
+        applicant_email TEXT,
+        email_sent BOOLEAN DEFAULT 0
+    )
+    ''',
+    # Keyset pagination walks (application_date, id); filtered listings get their own
+    # composite index so the filter and the ordering are served by one index scan
+    'CREATE INDEX IF NOT EXISTS idx_rejected_date_id ON rejected_applications (application_date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_rejected_email_date ON rejected_applications (applicant_email, application_date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_rejected_sent_date ON rejected_applications (email_sent, application_date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_rejected_cibil ON rejected_applications (cibil_score)',
+    # Analyst decisions on rejected applications, consumed by incremental_training.py in id order;
+    # relabelling replaces the row, so it gets a new id and is picked up again
+    '''
+    CREATE TABLE IF NOT EXISTS application_labels (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        application_id INTEGER NOT NULL UNIQUE,
+        loan_status INTEGER NOT NULL CHECK (loan_status IN (0, 1)),
+        analyst TEXT,
+        labelled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+# Columns that may be requested from the admin listing
+REJECTION_COLUMNS = [
+    'id', 'application_date', 'applicant_name', 'income_annum', 'loan_amount', 'loan_term',
+    'cibil_score', 'education', 'self_employed', 'no_of_dependents', 'residential_assets_value',
+    'commercial_assets_value', 'luxury_assets_value', 'bank_asset_value', 'debt_to_income_ratio',
+    'rejection_probability', 'rejection_reason', 'applicant_email', 'email_sent'
+]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Running aggregates over rejected_applications, maintained by triggers in the same
+# transaction as every insert/delete so /admin/rejection-stats never scans the table.
+# Averages are stored as (sum, count) pairs because AVG ignores NULLs.
+AGGREGATE_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS rejection_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total INTEGER NOT NULL DEFAULT 0,
+        emailed INTEGER NOT NULL DEFAULT 0,
+        cibil_sum REAL NOT NULL DEFAULT 0,
+        cibil_count INTEGER NOT NULL DEFAULT 0,
+        dti_sum REAL NOT NULL DEFAULT 0,
+        dti_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rejection_rollups (
+        granularity TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        emailed INTEGER NOT NULL DEFAULT 0,
+        cibil_sum REAL NOT NULL DEFAULT 0,
+        cibil_count INTEGER NOT NULL DEFAULT 0,
+        dti_sum REAL NOT NULL DEFAULT 0,
+        dti_count INTEGER NOT NULL DEFAULT 0,
+        probability_sum REAL NOT NULL DEFAULT 0,
+        probability_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket_start)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rejection_reason_rollups (
+        granularity TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        reason TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket_start, reason)
+    ) WITHOUT ROWID
+    ''',
+    # rejection_reason holds several "; "-joined reasons; each category is matched by substring
+    '''
+    CREATE TABLE IF NOT EXISTS rejection_reason_categories (
+        reason TEXT PRIMARY KEY
+    )
+    ''',
+]
+
+REASON_CATEGORIES = [
+    "Low credit score (below 500)",
+    "Below-average credit score",
+    "High debt-to-income ratio",
+    "Limited asset base for collateral",
+    "Self-employment status may indicate income volatility",
+    "High number of dependents may affect repayment capacity",
+    "Insufficient financial credentials",
+]
+
+# Bucket expressions over a row's application_date, per rollup granularity
+ROLLUP_BUCKETS = {
+    'hour': "strftime('%Y-%m-%d %H:00:00', {row}.application_date)",
+    'day': "date({row}.application_date)",
+}
+
+
+def _aggregate_trigger_sql(event, row, sign):
+    """Trigger body statements adding (sign=+1) or removing (sign=-1) one row from every aggregate"""
+    values = (
+        f"{sign}, {sign} * (coalesce({row}.email_sent, 0) = 1), "
+        f"{sign} * coalesce({row}.cibil_score, 0), {sign} * ({row}.cibil_score IS NOT NULL), "
+        f"{sign} * coalesce({row}.debt_to_income_ratio, 0), {sign} * ({row}.debt_to_income_ratio IS NOT NULL)"
+    )
+    statements = [f"""
+        UPDATE rejection_stats SET
+            total = total + {sign},
+            emailed = emailed + {sign} * (coalesce({row}.email_sent, 0) = 1),
+            cibil_sum = cibil_sum + {sign} * coalesce({row}.cibil_score, 0),
+            cibil_count = cibil_count + {sign} * ({row}.cibil_score IS NOT NULL),
+            dti_sum = dti_sum + {sign} * coalesce({row}.debt_to_income_ratio, 0),
+            dti_count = dti_count + {sign} * ({row}.debt_to_income_ratio IS NOT NULL)
+        WHERE id = 1;"""]
+    for granularity, bucket in ROLLUP_BUCKETS.items():
+        bucket = bucket.format(row=row)
+        statements.append(f"""
+        INSERT INTO rejection_rollups (granularity, bucket_start, total, emailed, cibil_sum, cibil_count,
+                                       dti_sum, dti_count, probability_sum, probability_count)
+        VALUES ('{granularity}', {bucket}, {values},
+                {sign} * coalesce({row}.rejection_probability, 0), {sign} * ({row}.rejection_probability IS NOT NULL))
+        ON CONFLICT (granularity, bucket_start) DO UPDATE SET
+            total = total + excluded.total,
+            emailed = emailed + excluded.emailed,
+            cibil_sum = cibil_sum + excluded.cibil_sum,
+            cibil_count = cibil_count + excluded.cibil_count,
+            dti_sum = dti_sum + excluded.dti_sum,
+            dti_count = dti_count + excluded.dti_count,
+            probability_sum = probability_sum + excluded.probability_sum,
+            probability_count = probability_count + excluded.probability_count;""")
+        statements.append(f"""
+        INSERT INTO rejection_reason_rollups (granularity, bucket_start, reason, count)
+        SELECT '{granularity}', {bucket}, reason, {sign} FROM rejection_reason_categories
+        WHERE instr({row}.rejection_reason, reason) > 0
+        ON CONFLICT (granularity, bucket_start, reason) DO UPDATE SET count = count + excluded.count;""")
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS trg_rejection_aggregates_{event.lower()}
+    AFTER {event} ON rejected_applications
+    BEGIN{''.join(statements)}
+    END
+    """
+
+
+AGGREGATE_TRIGGERS = [
+    _aggregate_trigger_sql('INSERT', 'NEW', '+1'),
+    _aggregate_trigger_sql('DELETE', 'OLD', '-1'),
+    # email_sent is flipped after delivery; move the row's contribution to the emailed counters
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_rejection_aggregates_email_sent
+    AFTER UPDATE OF email_sent ON rejected_applications
+    WHEN coalesce(OLD.email_sent, 0) != coalesce(NEW.email_sent, 0)
+    BEGIN
+        UPDATE rejection_stats SET emailed = emailed + (NEW.email_sent = 1) - (OLD.email_sent = 1) WHERE id = 1;
+        UPDATE rejection_rollups SET emailed = emailed + (NEW.email_sent = 1) - (OLD.email_sent = 1)
+        WHERE (granularity = 'hour' AND bucket_start = strftime('%Y-%m-%d %H:00:00', NEW.application_date))
+           OR (granularity = 'day' AND bucket_start = date(NEW.application_date));
+    END
+    ''',
+]
+
+
+def _init_aggregates(conn):
+    """Create the aggregate tables and triggers, backfilling them once from existing rows"""
+    for statement in AGGREGATE_TABLES:
+        conn.execute(statement)
+    conn.executemany('INSERT OR IGNORE INTO rejection_reason_categories (reason) VALUES (?)',
+                     [(reason,) for reason in REASON_CATEGORIES])
+    
+    if conn.execute('SELECT 1 FROM rejection_stats WHERE id = 1').fetchone() is None:
+        conn.execute('''
+            INSERT INTO rejection_stats (id, total, emailed, cibil_sum, cibil_count, dti_sum, dti_count)
+            SELECT 1, COUNT(*), coalesce(SUM(email_sent = 1), 0),
+                   coalesce(SUM(cibil_score), 0), COUNT(cibil_score),
+                   coalesce(SUM(debt_to_income_ratio), 0), COUNT(debt_to_income_ratio)
+            FROM rejected_applications
+        ''')
+        for granularity, bucket in ROLLUP_BUCKETS.items():
+            bucket = bucket.format(row='r')
+            conn.execute(f'''
+                INSERT INTO rejection_rollups
+                SELECT '{granularity}', {bucket}, COUNT(*), coalesce(SUM(email_sent = 1), 0),
+                       coalesce(SUM(cibil_score), 0), COUNT(cibil_score),
+                       coalesce(SUM(debt_to_income_ratio), 0), COUNT(debt_to_income_ratio),
+                       coalesce(SUM(rejection_probability), 0), COUNT(rejection_probability)
+                FROM rejected_applications r GROUP BY 2
+            ''')
+            conn.execute(f'''
+                INSERT INTO rejection_reason_rollups
+                SELECT '{granularity}', {bucket}, c.reason, COUNT(*)
+                FROM rejected_applications r
+                JOIN rejection_reason_categories c ON instr(r.rejection_reason, c.reason) > 0
+                GROUP BY 2, 3
+            ''')
+    
+    for statement in AGGREGATE_TRIGGERS:
+        conn.execute(statement)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared connection pool for DB_PATH; the schema is created once per pool"""
+    global _pool
+    pool = _pool
+    if pool is None or pool.path != DB_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.path != DB_PATH:
+                if _pool is not None:
+                    _pool.close()
+                new_pool = ConnectionPool(DB_PATH)
+                with new_pool.transaction() as conn:
+                    for statement in SCHEMA_STATEMENTS:
+                        conn.execute(statement)
+                    _init_aggregates(conn)
+                _pool = new_pool
+            pool = _pool
+    return pool
+
+
 def init_database():
     """Initialize SQLite database for rejected applications"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS rejected_applications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            application_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            applicant_name TEXT,
-            income_annum REAL,
-            loan_amount REAL,
-            loan_term INTEGER,
-            cibil_score INTEGER,
-            education TEXT,
-            self_employed TEXT,
-            no_of_dependents INTEGER,
-            residential_assets_value REAL,
-            commercial_assets_value REAL,
-            luxury_assets_value REAL,
-            bank_asset_value REAL,
-            debt_to_income_ratio REAL,
-            rejection_probability REAL,
-            rejection_reason TEXT,
-            applicant_email TEXT,
-            email_sent BOOLEAN DEFAULT 0
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    get_pool()
 
 
 def save_rejected_application(data, probability, applicant_email=None):
     """Save rejected application to database"""
-    init_database()
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     debt_to_income = (data.get('loan_amount', 0) / data.get('income_annum', 1)) * 100
     
     # Determine rejection reason
     rejection_reason = get_rejection_reason(data, probability)
     
-    cursor.execute('''
-        INSERT INTO rejected_applications (
-            applicant_name, income_annum, loan_amount, loan_term, cibil_score,
-            education, self_employed, no_of_dependents, residential_assets_value,
-            commercial_assets_value, luxury_assets_value, bank_asset_value,
-            debt_to_income_ratio, rejection_probability, rejection_reason, applicant_email
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    params = (
         data.get('applicant_name', 'Unknown'),
         data.get('income_annum'),
         data.get('loan_amount'),
@@ -88,10 +312,48 @@ def save_rejected_application(data, probability, applicant_email=None):
         probability,
         rejection_reason,
         applicant_email
-    ))
+    )
     
-    conn.commit()
-    conn.close()
+    with get_pool().transaction() as conn:
+        conn.execute(INSERT_REJECTION_SQL, params)
+
+
+def save_rejected_applications_bulk(df, probabilities, emails, names=None):
+    """Save a batch of rejected applications (one row per DataFrame row) in a single transaction
+
+    When `names` is given, a rejection email is queued in the notification outbox for
+    every row with an email address, in the same transaction. Returns the new row ids.
+    """
+    frame = df.reindex(columns=APPLICATION_FIELDS)
+    frame['applicant_name'] = frame['applicant_name'].fillna('Unknown')
+    frame['debt_to_income_ratio'] = _numeric_column(df, 'loan_amount') / _numeric_column(df, 'income_annum', 1) * 100
+    frame['rejection_probability'] = np.asarray(probabilities, dtype=float)
+    frame['rejection_reason'] = get_rejection_reasons(df)
+    frame['applicant_email'] = list(emails)
+    
+    # object dtype so sqlite3 receives native Python values, NaN -> NULL
+    rows = frame.astype(object).where(frame.notna(), None).to_numpy().tolist()
+    
+    outbox = get_outbox() if names is not None else None
+    with get_pool().transaction() as conn:
+        conn.executemany(INSERT_REJECTION_SQL, rows)
+        # we hold the write lock, so the AUTOINCREMENT ids of this batch are consecutive
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        ids = list(range(last_id - len(rows) + 1, last_id + 1))
+        
+        if outbox is not None:
+            records = df.to_dict('records')
+            outbox.enqueue_many((
+                ('rejection_email',
+                 {'name': name, 'email': email, 'data': record, 'probability': float(probability)},
+                 row_id)
+                for row_id, name, email, record, probability
+                in zip(ids, names, emails, records, probabilities) if email
+            ), conn=conn)
+    
+    if outbox is not None:
+        outbox.notify()
+    return ids
 
 
 def get_rejection_reason(data, probability):
@@ -125,47 +387,82 @@ def get_rejection_reason(data, probability):
     return "; ".join(reasons) if reasons else "Insufficient financial credentials"
 
 
+# JSON-lines audit log of emails recorded in TEST MODE
+EMAIL_LOG_FILE = os.getenv("EMAIL_LOG_FILE", os.path.join(os.path.dirname(__file__), 'rejection_emails.log'))
+
+
+def _numeric_column(df, name, default=0):
+    """Column as a Series, or a constant Series when the column is absent (mirrors dict.get defaults)"""
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index)
+
+
+def get_rejection_reasons(df):
+    """Columnar version of get_rejection_reason for a whole DataFrame of applications"""
+    cibil_score = _numeric_column(df, 'cibil_score')
+    debt_to_income = _numeric_column(df, 'loan_amount') / _numeric_column(df, 'income_annum', 1) * 100
+    total_assets = (_numeric_column(df, 'residential_assets_value') +
+                    _numeric_column(df, 'commercial_assets_value') +
+                    _numeric_column(df, 'luxury_assets_value') +
+                    _numeric_column(df, 'bank_asset_value'))
+    
+    high_dti = debt_to_income > 50
+    dti_reason = pd.Series('', index=df.index, dtype=object)
+    dti_reason[high_dti] = "High debt-to-income ratio (" + debt_to_income[high_dti].map('{:.1f}'.format) + "%); "
+    
+    # Each part carries its own "; " separator so the parts can simply be concatenated
+    parts = [
+        np.where(cibil_score < 500, "Low credit score (below 500); ",
+                 np.where(cibil_score < 650, "Below-average credit score; ", "")),
+        dti_reason.to_numpy(),
+        np.where(total_assets < 500000, "Limited asset base for collateral; ", ""),
+        np.where(_numeric_column(df, 'self_employed', None) == 'Yes',
+                 "Self-employment status may indicate income volatility; ", ""),
+        np.where(_numeric_column(df, 'no_of_dependents') > 4,
+                 "High number of dependents may affect repayment capacity; ", ""),
+    ]
+    
+    joined = pd.Series('', index=df.index, dtype=object)
+    for part in parts:
+        joined = joined + part
+    
+    return joined.str[:-2].where(joined != '', "Insufficient financial credentials")
+
+
+def email_log_fields(applicant_name, applicant_email, data, probability):
+    """Structured TEST MODE audit record for one rejection email"""
+    debt_to_income = (data.get('loan_amount', 0) / data.get('income_annum', 1)) * 100
+    total_assets = (data.get('residential_assets_value', 0) + 
+                   data.get('commercial_assets_value', 0) + 
+                   data.get('luxury_assets_value', 0) + 
+                   data.get('bank_asset_value', 0))
+    
+    return {
+        'to': applicant_email,
+        'from': SENDER_EMAIL,
+        'name': applicant_name,
+        'subject': 'Loan Application Status - Requires Review',
+        'income_annum': data.get('income_annum', 0),
+        'loan_amount': data.get('loan_amount', 0),
+        'debt_to_income_ratio': round(debt_to_income, 1),
+        'cibil_score': data.get('cibil_score', 0),
+        'total_assets': total_assets,
+        'risk_score': round(probability * 100, 1),
+        'rejection_reason': get_rejection_reason(data, probability),
+    }
+
+
 def save_email_to_file(applicant_name, applicant_email, data, probability):
-    """Save email content to file (TEST MODE)"""
+    """Record the email in the audit log instead of sending it (TEST MODE)
+
+    Written synchronously: the callers (the outbox sender, send_rejection_email) are
+    off the request path and report the result, so False means the record did not
+    reach the log.
+    """
     try:
-        log_file = os.path.join(os.path.dirname(__file__), 'rejection_emails.log')
-        
-        debt_to_income = (data.get('loan_amount', 0) / data.get('income_annum', 1)) * 100
-        total_assets = (data.get('residential_assets_value', 0) + 
-                       data.get('commercial_assets_value', 0) + 
-                       data.get('luxury_assets_value', 0) + 
-                       data.get('bank_asset_value', 0))
-        
-        rejection_reason = get_rejection_reason(data, probability)
-        suggestions = get_improvement_suggestions(data)
-        
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"\n{'='*70}\n")
-            f.write(f"REJECTION EMAIL - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"{'='*70}\n")
-            f.write(f"TO: {applicant_email}\n")
-            f.write(f"FROM: {SENDER_EMAIL}\n")
-            f.write(f"NAME: {applicant_name}\n")
-            f.write(f"SUBJECT: Loan Application Status - Requires Review\n")
-            f.write(f"\n--- APPLICATION DETAILS ---\n")
-            f.write(f"Annual Income: ${data.get('income_annum', 0):,.0f}\n")
-            f.write(f"Loan Amount: ${data.get('loan_amount', 0):,.0f}\n")
-            f.write(f"Debt-to-Income Ratio: {debt_to_income:.1f}%\n")
-            f.write(f"CIBIL Score: {data.get('cibil_score', 0)}\n")
-            f.write(f"Total Assets: ${total_assets:,.0f}\n")
-            f.write(f"Risk Score: {probability*100:.1f}%\n")
-            f.write(f"\n--- REJECTION REASON ---\n")
-            f.write(f"{rejection_reason}\n")
-            f.write(f"\n--- EMAIL BODY PREVIEW ---\n")
-            f.write(f"Dear {applicant_name},\n\n")
-            f.write(f"Thank you for applying for a loan. After analyzing your application,\n")
-            f.write(f"we regret to inform you that it does not meet our approval criteria.\n\n")
-            f.write(f"Reasons: {rejection_reason}\n\n")
-            f.write(f"✅ EMAIL NOTIFICATION TRIGGERED SUCCESSFULLY\n")
-            f.write(f"{'='*70}\n\n")
-        
-        print(f"✅ Email notification logged to: {log_file}")
-        print(f"📧 Email would be sent to: {applicant_email}")
+        get_audit_logger(EMAIL_LOG_FILE).write(
+            'rejection_email', **email_log_fields(applicant_name, applicant_email, data, probability))
         return True
         
     except Exception as e:
@@ -173,6 +470,124 @@ def save_email_to_file(applicant_name, applicant_email, data, probability):
         return False
 
 
+def build_rejection_email(applicant_name, applicant_email, data, probability):
+    """Build the HTML rejection notification message"""
+    # Calculate metrics for email
+    debt_to_income = (data.get('loan_amount', 0) / data.get('income_annum', 1)) * 100
+    total_assets = (data.get('residential_assets_value', 0) + 
+                   data.get('commercial_assets_value', 0) + 
+                   data.get('luxury_assets_value', 0) + 
+                   data.get('bank_asset_value', 0))
+
+    rejection_reason = get_rejection_reason(data, probability)
+
+    # Generate suggestions
+    suggestions = get_improvement_suggestions(data)
+
+    # Create email
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = "Loan Application Status - Requires Review"
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = applicant_email
+
+    # HTML email body
+    html = f"""
+    <html>
+        <head>
+            <style>
+                body {{ font-family: Arial, sans-serif; color: #333; }}
+                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                .header {{ background: #f44336; color: white; padding: 20px; border-radius: 5px; text-align: center; }}
+                .content {{ padding: 20px; background: #f9f9f9; margin: 20px 0; border-radius: 5px; }}
+                .section {{ margin: 20px 0; }}
+                .section h3 {{ color: #d32f2f; margin-bottom: 10px; }}
+                .metric {{ display: flex; justify-content: space-between; padding: 8px 0; border-bottom: 1px solid #ddd; }}
+                .suggestion {{ background: #e3f2fd; padding: 12px; margin: 8px 0; border-left: 4px solid #2196f3; border-radius: 3px; }}
+                .footer {{ text-align: center; color: #999; font-size: 12px; margin-top: 30px; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h2>Loan Application Status</h2>
+                    <p>⚠️ Application Requires Further Review</p>
+                </div>
+
+                <div class="content">
+                    <p>Dear {applicant_name},</p>
+
+                    <p>Thank you for applying for a loan with us. We appreciate the opportunity to review your application.</p>
+
+                    <p>After careful analysis of your financial profile using our AI assessment system, we regret to inform you that your current application does not meet our approval criteria at this time.</p>
+
+                    <div class="section">
+                        <h3>📊 Application Analysis</h3>
+                        <div class="metric">
+                            <span>Annual Income:</span>
+                            <strong>${data.get('income_annum', 0):,.0f}</strong>
+                        </div>
+                        <div class="metric">
+                            <span>Requested Loan Amount:</span>
+                            <strong>${data.get('loan_amount', 0):,.0f}</strong>
+                        </div>
+                        <div class="metric">
+                            <span>Debt-to-Income Ratio:</span>
+                            <strong>{debt_to_income:.1f}%</strong>
+                        </div>
+                        <div class="metric">
+                            <span>Credit Score (CIBIL):</span>
+                            <strong>{data.get('cibil_score', 0)}</strong>
+                        </div>
+                        <div class="metric">
+                            <span>Total Assets:</span>
+                            <strong>${total_assets:,.0f}</strong>
+                        </div>
+                        <div class="metric">
+                            <span>Risk Assessment Confidence:</span>
+                            <strong>{probability*100:.1f}%</strong>
+                        </div>
+                    </div>
+
+                    <div class="section">
+                        <h3>❌ Reason for Review</h3>
+                        <p>{rejection_reason}</p>
+                    </div>
+
+                    <div class="section">
+                        <h3>✅ How to Improve Your Application</h3>
+                        {suggestions}
+                    </div>
+
+                    <div class="section">
+                        <p><strong>Next Steps:</strong></p>
+                        <ul>
+                            <li>Review the suggestions above to strengthen your financial profile</li>
+                            <li>Reapply after 3-6 months with improved metrics</li>
+                            <li>Contact our loan officer for personalized guidance</li>
+                            <li>Consider alternative loan amounts or terms</li>
+                        </ul>
+                    </div>
+
+                    <p>We encourage you to reapply once you've addressed the above areas. Our team is here to help you achieve your financial goals.</p>
+
+                    <p>Best regards,<br>
+                    <strong>AI Loan Assessment Team</strong><br>
+                    Your Financial Partner</p>
+                </div>
+
+                <div class="footer">
+                    <p>This is an automated message. Please do not reply to this email.</p>
+                    <p>For assistance, contact our loan department at support@loanapproval.com</p>
+                </div>
+            </div>
+        </body>
+    </html>
+    """
+
+    msg.attach(MIMEText(html, 'html'))
+    return msg
+
+
 def send_rejection_email(applicant_name, applicant_email, data, probability):
     """Send rejection notification email"""
     if not applicant_email:
@@ -183,8 +598,6 @@ def send_rejection_email(applicant_name, applicant_email, data, probability):
     TEST_MODE = os.getenv("EMAIL_TEST_MODE", "true").lower() == "true"
     
     if TEST_MODE:
-        print(f"📧 TEST MODE: Email would be sent to {applicant_email}")
-        print("   (Email content will be saved to rejection_emails.log)")
         return save_email_to_file(applicant_name, applicant_email, data, probability)
     
     if not EMAIL_CONFIGURED:
@@ -196,119 +609,7 @@ def send_rejection_email(applicant_name, applicant_email, data, probability):
         return False
     
     try:
-        # Calculate metrics for email
-        debt_to_income = (data.get('loan_amount', 0) / data.get('income_annum', 1)) * 100
-        total_assets = (data.get('residential_assets_value', 0) + 
-                       data.get('commercial_assets_value', 0) + 
-                       data.get('luxury_assets_value', 0) + 
-                       data.get('bank_asset_value', 0))
-        
-        rejection_reason = get_rejection_reason(data, probability)
-        
-        # Generate suggestions
-        suggestions = get_improvement_suggestions(data)
-        
-        # Create email
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = "Loan Application Status - Requires Review"
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = applicant_email
-        
-        # HTML email body
-        html = f"""
-        <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: #f44336; color: white; padding: 20px; border-radius: 5px; text-align: center; }}
-                    .content {{ padding: 20px; background: #f9f9f9; margin: 20px 0; border-radius: 5px; }}
-                    .section {{ margin: 20px 0; }}
-                    .section h3 {{ color: #d32f2f; margin-bottom: 10px; }}
-                    .metric {{ display: flex; justify-content: space-between; padding: 8px 0; border-bottom: 1px solid #ddd; }}
-                    .suggestion {{ background: #e3f2fd; padding: 12px; margin: 8px 0; border-left: 4px solid #2196f3; border-radius: 3px; }}
-                    .footer {{ text-align: center; color: #999; font-size: 12px; margin-top: 30px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h2>Loan Application Status</h2>
-                        <p>⚠️ Application Requires Further Review</p>
-                    </div>
-                    
-                    <div class="content">
-                        <p>Dear {applicant_name},</p>
-                        
-                        <p>Thank you for applying for a loan with us. We appreciate the opportunity to review your application.</p>
-                        
-                        <p>After careful analysis of your financial profile using our AI assessment system, we regret to inform you that your current application does not meet our approval criteria at this time.</p>
-                        
-                        <div class="section">
-                            <h3>📊 Application Analysis</h3>
-                            <div class="metric">
-                                <span>Annual Income:</span>
-                                <strong>${data.get('income_annum', 0):,.0f}</strong>
-                            </div>
-                            <div class="metric">
-                                <span>Requested Loan Amount:</span>
-                                <strong>${data.get('loan_amount', 0):,.0f}</strong>
-                            </div>
-                            <div class="metric">
-                                <span>Debt-to-Income Ratio:</span>
-                                <strong>{debt_to_income:.1f}%</strong>
-                            </div>
-                            <div class="metric">
-                                <span>Credit Score (CIBIL):</span>
-                                <strong>{data.get('cibil_score', 0)}</strong>
-                            </div>
-                            <div class="metric">
-                                <span>Total Assets:</span>
-                                <strong>${total_assets:,.0f}</strong>
-                            </div>
-                            <div class="metric">
-                                <span>Risk Assessment Confidence:</span>
-                                <strong>{probability*100:.1f}%</strong>
-                            </div>
-                        </div>
-                        
-                        <div class="section">
-                            <h3>❌ Reason for Review</h3>
-                            <p>{rejection_reason}</p>
-                        </div>
-                        
-                        <div class="section">
-                            <h3>✅ How to Improve Your Application</h3>
-                            {suggestions}
-                        </div>
-                        
-                        <div class="section">
-                            <p><strong>Next Steps:</strong></p>
-                            <ul>
-                                <li>Review the suggestions above to strengthen your financial profile</li>
-                                <li>Reapply after 3-6 months with improved metrics</li>
-                                <li>Contact our loan officer for personalized guidance</li>
-                                <li>Consider alternative loan amounts or terms</li>
-                            </ul>
-                        </div>
-                        
-                        <p>We encourage you to reapply once you've addressed the above areas. Our team is here to help you achieve your financial goals.</p>
-                        
-                        <p>Best regards,<br>
-                        <strong>AI Loan Assessment Team</strong><br>
-                        Your Financial Partner</p>
-                    </div>
-                    
-                    <div class="footer">
-                        <p>This is an automated message. Please do not reply to this email.</p>
-                        <p>For assistance, contact our loan department at support@loanapproval.com</p>
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        msg.attach(MIMEText(html, 'html'))
+        msg = build_rejection_email(applicant_name, applicant_email, data, probability)
         
         # Send email
         with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
@@ -325,6 +626,52 @@ def send_rejection_email(applicant_name, applicant_email, data, probability):
         return False
 
 
+class RejectionEmailSender:
+    """Outbox sender for rejection emails; keeps one SMTP session open per worker"""
+
+    def __init__(self):
+        self.session = None
+
+    def send(self, payload):
+        args = (payload['name'], payload['email'], payload['data'], payload['probability'])
+        if os.getenv("EMAIL_TEST_MODE", "true").lower() == "true":
+            if not save_email_to_file(*args):
+                raise RuntimeError(f"Could not record TEST MODE email to {EMAIL_LOG_FILE}")
+            return
+        if not EMAIL_CONFIGURED:
+            raise PermanentDeliveryError("Email not configured: set SENDER_EMAIL and SENDER_PASSWORD")
+        if self.session is None:
+            self.session = SmtpSession(SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD)
+        self.session.send(build_rejection_email(*args))
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+def _mark_emails_sent(conn, rejection_ids):
+    conn.executemany('UPDATE rejected_applications SET email_sent = 1 WHERE id = ?',
+                     [(row_id,) for row_id in rejection_ids])
+
+
+_outbox = None
+
+
+def get_outbox():
+    """Notification outbox stored alongside the rejections; its workers start on first use"""
+    global _outbox
+    pool = get_pool()
+    if _outbox is None or _outbox.pool is not pool:
+        with _pool_lock:
+            if _outbox is None or _outbox.pool is not pool:
+                if _outbox is not None:
+                    _outbox.stop(timeout=0)
+                outbox = NotificationOutbox(pool, {'rejection_email': RejectionEmailSender}, name='rejections')
+                outbox.on_delivered('rejection_email', _mark_emails_sent)
+                _outbox = outbox.start()
+    return _outbox
+
+
 def get_improvement_suggestions(data):
     """Generate HTML suggestions for improving application"""
     suggestions_html = ""
@@ -404,43 +751,197 @@ def get_improvement_suggestions(data):
 
 def get_rejected_applications():
     """Retrieve all rejected applications from database"""
-    init_database()
-    
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM rejected_applications ORDER BY application_date DESC')
-    applications = cursor.fetchall()
-    conn.close()
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute('SELECT * FROM rejected_applications ORDER BY application_date DESC')
+        applications = cursor.fetchall()
     
     return [dict(app) for app in applications]
 
 
+def encode_cursor(application_date, row_id):
+    """Opaque pagination cursor for the position after (application_date, id)"""
+    raw = f"{application_date}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        application_date, row_id = raw.rsplit('|', 1)
+        return application_date, int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def query_rejected_applications(limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None, email=None,
+                                min_cibil=None, max_cibil=None, start_date=None, end_date=None,
+                                email_sent=None):
+    """Return one page of rejected applications, newest first, and the cursor for the next page.
+
+    Uses keyset pagination on (application_date, id) so every page costs the same
+    regardless of how deep into the history it is. Returns (rows, next_cursor);
+    next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    columns = list(columns) if columns else list(REJECTION_COLUMNS)
+    unknown = [c for c in columns if c not in REJECTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    # the cursor needs the sort keys even if the caller didn't ask for them
+    selected = columns + [c for c in ('application_date', 'id') if c not in columns]
+    
+    where, params = [], []
+    if email is not None:
+        where.append('applicant_email = ?')
+        params.append(email)
+    if min_cibil is not None:
+        where.append('cibil_score >= ?')
+        params.append(int(min_cibil))
+    if max_cibil is not None:
+        where.append('cibil_score <= ?')
+        params.append(int(max_cibil))
+    if start_date is not None:
+        where.append('application_date >= ?')
+        params.append(start_date)
+    if end_date is not None:
+        # a bare date covers the whole day
+        where.append('application_date <= ?')
+        params.append(f"{end_date} 23:59:59" if len(end_date) == 10 else end_date)
+    if email_sent is not None:
+        where.append('email_sent = ?')
+        params.append(1 if email_sent else 0)
+    if cursor:
+        where.append('(application_date, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+    
+    sql = f"SELECT {', '.join(selected)} FROM rejected_applications"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY application_date DESC, id DESC LIMIT ?'
+    # fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+    
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
+        rows = cur.execute(sql, params).fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['application_date'], rows[-1]['id'])
+    
+    return [{c: row[c] for c in columns} for row in rows], next_cursor
+
+
+# Accepted spellings of an analyst's loan_status label
+LABEL_CODES = {'approved': 1, 'rejected': 0, '1': 1, '0': 0}
+
+
+def _label_code(status):
+    if isinstance(status, (int, float, np.integer, np.floating)) and status in (0, 1):
+        return int(status)
+    return LABEL_CODES.get(str(status).strip().lower())
+
+
+def save_application_labels(labels, analyst=None):
+    """Store analyst labels: (application_id, loan_status) pairs, status Approved/Rejected or 1/0.
+
+    Ids that are not in rejected_applications are skipped. Returns the number stored.
+    """
+    rows = []
+    for application_id, status in labels:
+        code = _label_code(status)
+        if code is None:
+            raise ValueError(f"Invalid loan_status {status!r} for application {application_id}; "
+                             f"use Approved/Rejected or 1/0")
+        rows.append((code, analyst, int(application_id)))
+
+    with get_pool().transaction() as conn:
+        before = conn.total_changes
+        conn.executemany(
+            '''INSERT OR REPLACE INTO application_labels (loan_status, analyst, application_id)
+               SELECT ?, ?, id FROM rejected_applications WHERE id = ?''', rows)
+        return conn.total_changes - before
+
+
+def get_labelled_applications(after_label_id=0):
+    """Labelled rejected applications with a label id above ``after_label_id``, oldest label first.
+
+    Returns a DataFrame of the application fields plus ``loan_status`` and ``label_id``.
+    """
+    fields = ', '.join(f'r.{f}' for f in APPLICATION_FIELDS)
+    sql = f'''SELECT l.id AS label_id, l.loan_status, {fields}
+              FROM application_labels l JOIN rejected_applications r ON r.id = l.application_id
+              WHERE l.id > ? ORDER BY l.id'''
+    with get_pool().connection() as conn:
+        return pd.read_sql_query(sql, conn, params=(int(after_label_id),))
+
+
+def _average(total, count):
+    return total / count if count else None
+
+
 def get_rejection_stats():
-    """Get statistics about rejected applications"""
-    init_database()
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) as total FROM rejected_applications')
-    total = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) as emailed FROM rejected_applications WHERE email_sent = 1')
-    emailed = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT AVG(cibil_score) as avg_score FROM rejected_applications')
-    avg_score = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT AVG(debt_to_income_ratio) as avg_dti FROM rejected_applications')
-    avg_dti = cursor.fetchone()[0]
-    
-    conn.close()
+    """Get statistics about rejected applications (O(1): reads the running aggregates)"""
+    with get_pool().connection() as conn:
+        row = conn.execute(
+            'SELECT total, emailed, cibil_sum, cibil_count, dti_sum, dti_count FROM rejection_stats WHERE id = 1'
+        ).fetchone()
+    total, emailed, cibil_sum, cibil_count, dti_sum, dti_count = row or (0, 0, 0, 0, 0, 0)
     
     return {
         'total_rejected': total,
         'emails_sent': emailed,
-        'avg_credit_score': avg_score,
-        'avg_debt_to_income': avg_dti
+        'avg_credit_score': _average(cibil_sum, cibil_count),
+        'avg_debt_to_income': _average(dti_sum, dti_count)
     }
+
+
+def get_rejection_rollups(granularity='hour', start=None, end=None, limit=168):
+    """Time-bucketed rejection counts, averages and reason histograms, newest bucket first"""
+    if granularity not in ROLLUP_BUCKETS:
+        raise ValueError(f"granularity must be one of: {', '.join(ROLLUP_BUCKETS)}")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    
+    where, params = ['granularity = ?'], [granularity]
+    if start is not None:
+        where.append('bucket_start >= ?')
+        params.append(start)
+    if end is not None:
+        where.append('bucket_start <= ?')
+        params.append(end)
+    clause = ' AND '.join(where)
+    
+    with get_pool().connection() as conn:
+        buckets = conn.execute(
+            f'''SELECT bucket_start, total, emailed, cibil_sum, cibil_count, dti_sum, dti_count,
+                       probability_sum, probability_count
+                FROM rejection_rollups WHERE {clause} AND total > 0
+                ORDER BY bucket_start DESC LIMIT ?''',
+            params + [limit]
+        ).fetchall()
+        if not buckets:
+            return []
+        oldest = buckets[-1][0]
+        reasons = conn.execute(
+            f'''SELECT bucket_start, reason, count FROM rejection_reason_rollups
+                WHERE {clause} AND bucket_start >= ? AND count > 0''',
+            params + [oldest]
+        ).fetchall()
+    
+    histograms = {}
+    for bucket_start, reason, count in reasons:
+        histograms.setdefault(bucket_start, {})[reason] = count
+    
+    return [{
+        'bucket_start': bucket_start,
+        'total_rejected': total,
+        'emails_sent': emailed,
+        'avg_credit_score': _average(cibil_sum, cibil_count),
+        'avg_debt_to_income': _average(dti_sum, dti_count),
+        'avg_rejection_probability': _average(prob_sum, prob_count),
+        'reasons': histograms.get(bucket_start, {}),
+    } for bucket_start, total, emailed, cibil_sum, cibil_count, dti_sum, dti_count, prob_sum, prob_count in buckets]
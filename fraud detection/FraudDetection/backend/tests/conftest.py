@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# the backend is a flat set of modules run from its own directory
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'hi_small_sample.csv')
+
+
+@pytest.fixture(scope='session')
+def raw_sample():
+    """240 transactions in the HI-Small_Trans.csv layout (two 'Account' columns, unsorted)."""
+    return pd.read_csv(SAMPLE_PATH)
+
+
+@pytest.fixture(scope='session')
+def notebook_frame(raw_sample):
+    """The notebook's feature cells run on the sample (the reference for parity tests)."""
+    from feature_pipeline import notebook_features
+    return notebook_features(raw_sample)
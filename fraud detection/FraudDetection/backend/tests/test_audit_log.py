@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from audit_log import AuditLogger
+
+
+def records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_failed_flush_keeps_records(tmp_path):
+    path = tmp_path / 'missing' / 'audit.log'
+    audit = AuditLogger(str(path), flush_interval=3600).start()
+    audit.log('first', n=1)
+    audit.log('second', n=2)
+
+    with pytest.raises(OSError):
+        audit.flush()
+    assert audit.stats()['buffered'] == 2
+    assert audit.written == 0
+
+    audit.log('third', n=3)
+    path.parent.mkdir()
+    audit.flush()
+    assert [r['event'] for r in records(path)] == ['first', 'second', 'third']
+    assert audit.stats()['buffered'] == 0
+
+
+def test_overflow_after_a_failed_flush_drops_the_oldest(tmp_path):
+    path = tmp_path / 'missing' / 'audit.log'
+    audit = AuditLogger(str(path), capacity=3, flush_interval=3600).start()
+    for n in range(3):
+        audit.log('event', n=n)
+    with pytest.raises(OSError):
+        audit.flush()
+    audit.log('event', n=3)
+    path.parent.mkdir()
+    audit.flush()
+    assert [r['n'] for r in records(path)] == [1, 2, 3]
+
+
+def test_write_reports_failure(tmp_path):
+    audit = AuditLogger(str(tmp_path / 'missing' / 'audit.log'))
+    with pytest.raises(OSError):
+        audit.write('rejection_email', to='a@example.com')
+    (tmp_path / 'missing').mkdir()
+    audit.write('rejection_email', to='a@example.com')
+    assert records(tmp_path / 'missing' / 'audit.log')[0]['to'] == 'a@example.com'
+    assert audit._thread is None
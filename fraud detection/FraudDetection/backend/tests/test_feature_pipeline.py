@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import feature_pipeline
+from feature_pipeline import build_features, verify_parity
+
+
+def test_matches_notebook(raw_sample):
+    report = verify_parity(raw_sample, workers=1)
+    assert 'Rolling_Std_Amount_7D' in report and 'PageRank_Score' in report
+
+
+def test_process_pool_matches_notebook(raw_sample, monkeypatch):
+    monkeypatch.setattr(feature_pipeline, 'PARALLEL_MIN_ROWS', 0)
+    verify_parity(raw_sample, workers=2)
+
+
+def test_imputation_matches_notebook(raw_sample):
+    raw = raw_sample.copy()
+    raw.loc[[3, 50, 51], 'Amount Paid'] = np.nan
+    raw.loc[[7, 90], 'Payment Format'] = None
+    verify_parity(raw, workers=1)
+
+
+def test_parity_failure_is_reported(raw_sample, monkeypatch):
+    broken = build_features
+
+    def off_by_one(raw, embeddings=None, workers=1):
+        features = broken(raw, embeddings, workers=workers)
+        features['Num_Transactions_30D'] += 1
+        return features
+
+    monkeypatch.setattr(feature_pipeline, 'build_features', off_by_one)
+    with pytest.raises(AssertionError, match='Num_Transactions_30D'):
+        verify_parity(raw_sample, workers=1)
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import OnlineFeatureStore, SCALED_FEATURES
+
+NOTEBOOK_COLUMNS = {
+    'rolling_mean_amount_7d': 'Rolling_Mean_Amount_7D',
+    'rolling_std_amount_7d': 'Rolling_Std_Amount_7D',
+    'num_transactions_30d': 'Num_Transactions_30D',
+    'avg_transaction_30d': 'Avg_Transaction_30D',
+    'time_diff': 'Time_Diff',
+    'is_burst': 'Is_Burst',
+}
+
+
+def history(frame):
+    seconds = frame['Timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64) / 1e9
+    return frame['Sender_Account'].tolist(), np.expm1(frame['log_Amount_Paid'].to_numpy()).tolist(), seconds.tolist()
+
+
+def test_served_features_match_notebook(notebook_frame):
+    accounts, amounts, seconds = history(notebook_frame)
+    scaling = OnlineFeatureStore.from_history(accounts, amounts, seconds).scaling
+    assert set(scaling) == set(SCALED_FEATURES)
+
+    # replay the frame through /score's path: standardized amount_paid, raw log amount
+    store = OnlineFeatureStore(scaling=scaling)
+    served = []
+    for row in notebook_frame.to_dict('records'):
+        transaction = {'Amount_Paid': row['Amount_Paid'], 'log_Amount_Paid': row['log_Amount_Paid']}
+        served.append(store.enrich(transaction, event_time=row['Timestamp'].to_pydatetime(),
+                                   account=row['Sender_Account']))
+    served = pd.DataFrame(served)
+
+    for name, column in NOTEBOOK_COLUMNS.items():
+        np.testing.assert_allclose(served[name].to_numpy(dtype=float), notebook_frame[column].to_numpy(dtype=float),
+                                   rtol=1e-6, atol=1e-6, equal_nan=True, err_msg=name)
+
+
+def test_avg_transaction_is_in_currency_units(notebook_frame):
+    accounts, amounts, seconds = history(notebook_frame)
+    store = OnlineFeatureStore()
+    first = store.update(accounts[0], amounts[0], seconds[0])
+    assert first['avg_transaction_30d'] == pytest.approx(notebook_frame['Avg_Transaction_30D'].iloc[0])
+    assert first['avg_transaction_30d'] > 1
+
+
+def test_account_keys_are_normalized():
+    store = OnlineFeatureStore()
+    store.update(12, 100.0, 0)
+    second = store.update(12.0, 300.0, 30)
+    third = store.update('12', 200.0, 90)
+    assert len(store) == 1
+    assert second['num_transactions_30d'] == 2
+    assert third['rolling_mean_amount_7d'] == pytest.approx(200.0)
+    assert third['time_diff'] == 60
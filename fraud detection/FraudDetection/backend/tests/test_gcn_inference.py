@@ -0,0 +1,112 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from gcn_inference import InductiveGCN, export_gcn, load_weights
+
+
+def gcn_conv(x, edges, weight, bias):
+    """torch_geometric's GCNConv forward, written out edge by edge.
+
+    ``weight`` is ``lin.weight`` as torch stores it, (out, in). Nodes without a
+    self-loop get one (add_remaining_self_loops), degrees are counted at the
+    target, and each message flows source -> target scaled by
+    deg[source]^-1/2 * deg[target]^-1/2.
+    """
+    n = len(x)
+    edges = list(edges)
+    edges += [(i, i) for i in range(n) if (i, i) not in set(edges)]
+    degree = np.zeros(n)
+    for _, target in edges:
+        degree[target] += 1
+    h = x @ weight.T
+    out = np.zeros((n, weight.shape[0]))
+    for source, target in edges:
+        out[target] += h[source] / np.sqrt(degree[source] * degree[target])
+    return out + bias
+
+
+@pytest.fixture(scope='module')
+def state_dict():
+    """A GCN(2, 2) state_dict in torch_geometric's layout, as NumPy arrays."""
+    rng = np.random.default_rng(3)
+    return {
+        'conv1.lin.weight': rng.normal(size=(16, 2)).astype(np.float32),
+        'conv1.bias': rng.normal(size=16).astype(np.float32),
+        'conv2.lin.weight': rng.normal(size=(2, 16)).astype(np.float32),
+        'conv2.bias': rng.normal(size=2).astype(np.float32),
+    }
+
+
+@pytest.fixture(scope='module')
+def notebook_graph(notebook_frame, state_dict):
+    """The notebook's GCN cells on the sample: account order, conv1 embeddings and model output."""
+    G = nx.from_pandas_edgelist(notebook_frame, source="Sender_Account", target="Receiver_Account",
+                                edge_attr="Amount_Paid", create_using=nx.DiGraph())
+    account_mapping = {account: idx for idx, account in enumerate(G.nodes())}
+    node_features = {node: np.array([G.degree(node),
+                                     np.mean([G[u][v]['Amount_Paid'] for u, v in G.edges(node)])
+                                     if len(list(G.edges(node))) > 0 else 0]) for node in G.nodes()}
+    x = np.array(list(node_features.values()))
+    edges = [(account_mapping[s], account_mapping[t]) for s, t in G.edges()]
+    w = {k: v.astype(np.float64) for k, v in state_dict.items()}
+    embeddings = gcn_conv(x, edges, w['conv1.lin.weight'], w['conv1.bias'])
+    output = gcn_conv(np.maximum(embeddings, 0), edges, w['conv2.lin.weight'], w['conv2.bias'])
+    return account_mapping, embeddings, output
+
+
+@pytest.fixture(scope='module')
+def weights(state_dict, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('gcn') / 'weights.npz')
+    export_gcn(state_dict, path)
+    return load_weights(path)
+
+
+def columns(frame):
+    return (frame['Sender_Account'].to_numpy(), frame['Receiver_Account'].to_numpy(),
+            frame['Amount_Paid'].to_numpy())
+
+
+def test_export_transposes_lin_weight(state_dict, weights):
+    assert weights['conv1_weight'].shape == (2, 16)
+    np.testing.assert_array_equal(weights['conv1_weight'], state_dict['conv1.lin.weight'].T)
+    np.testing.assert_array_equal(weights['conv2_bias'], state_dict['conv2.bias'])
+
+
+def test_export_keeps_legacy_weight_layout(state_dict, weights, tmp_path):
+    # older torch_geometric stored convN.weight already as (in, out)
+    legacy = {}
+    for layer in ('conv1', 'conv2'):
+        legacy[f'{layer}.weight'] = state_dict[f'{layer}.lin.weight'].T
+        legacy[f'{layer}.bias'] = state_dict[f'{layer}.bias']
+    export_gcn(legacy, str(tmp_path / 'legacy.npz'))
+    for name, array in load_weights(str(tmp_path / 'legacy.npz')).items():
+        np.testing.assert_array_equal(array, weights[name])
+
+
+def test_full_graph_matches_gcnconv(notebook_frame, notebook_graph, weights):
+    account_mapping, embeddings, output = notebook_graph
+    gcn = InductiveGCN.from_transactions(weights, *columns(notebook_frame))
+    order = [account_mapping[a] for a in gcn.accounts]
+    np.testing.assert_allclose(gcn.embed_all(), embeddings[order], rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(gcn.forward_all(), output[order], rtol=1e-5, atol=1e-5)
+
+
+def test_live_transactions_match_gcnconv(notebook_frame, notebook_graph, weights):
+    account_mapping, embeddings, _ = notebook_graph
+    senders, receivers, amounts = columns(notebook_frame)
+    split = int(len(senders) * 0.9)
+    live = InductiveGCN.from_transactions(weights, senders[:split], receivers[:split], amounts[:split])
+    for s, r, a in zip(senders[split:], receivers[split:], amounts[split:]):
+        live.add_transaction(s, r, a)
+    accounts = list(account_mapping)
+    np.testing.assert_allclose(live.embed(accounts), embeddings[[account_mapping[a] for a in accounts]],
+                               rtol=1e-5, atol=1e-5)
+    assert np.isnan(live.embed(['never-seen'])).all()
+
+
+def test_account_keys_are_normalized(weights):
+    gcn = InductiveGCN.from_transactions(weights, ['12'], ['7'], [1.0])
+    gcn.add_transaction(12.0, 7, 2.0)
+    assert gcn.stats()['accounts'] == 2
+    np.testing.assert_array_equal(gcn.embed([12]), gcn.embed(['12']))
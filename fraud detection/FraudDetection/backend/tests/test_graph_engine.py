@@ -0,0 +1,30 @@
+import sys
+
+import networkx as nx
+import numpy as np
+
+import graph_engine
+from columnar import ColumnarFile
+from graph_engine import TransactionGraph
+
+
+def test_shortest_cycles_follow_edge_direction():
+    # a -> b -> c -> a is a 3-cycle; d <-> e a 2-cycle; f -> f a self-loop; g -> a none
+    graph = TransactionGraph.from_edgelist(list('abcdefg'), list('bcaedfa'))
+    cycles = dict(zip(graph.accounts.tolist(), graph.shortest_cycles().tolist()))
+    assert cycles == {'a': 3, 'b': 3, 'c': 3, 'd': 2, 'e': 2, 'f': 1, 'g': 0}
+
+
+def test_cli_centrality_matches_the_notebooks_undirected_graph(notebook_frame, tmp_path, monkeypatch):
+    source, output = tmp_path / 'edges.csv', tmp_path / 'graph.col'
+    notebook_frame[['Sender_Account', 'Receiver_Account']].to_csv(source, index=False)
+    monkeypatch.setattr(sys, 'argv', ['graph_engine.py', str(source), '-o', str(output)])
+    graph_engine.main()
+
+    # the notebook's cell: nx.from_pandas_edgelist builds an undirected Graph
+    G = nx.from_pandas_edgelist(notebook_frame, source="Sender_Account", target="Receiver_Account")
+    features = ColumnarFile(str(output))
+    accounts = [key.decode() for key in features['account'].tolist()]
+    np.testing.assert_allclose(features['degree_centrality'], [nx.degree_centrality(G)[a] for a in accounts])
+    np.testing.assert_allclose(features['pagerank'], [nx.pagerank(G)[a] for a in accounts], atol=1e-6)
+    assert features.meta['centrality'] == 'undirected'
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from graph_engine import TransactionGraph
+from incremental_graph import IncrementalGraph
+
+SENDERS = ['A1', 'B2', 'C3', 'A1', 'D4', 'E5', 'B2']
+RECEIVERS = ['B2', 'C3', 'A1', 'D4', 'E5', 'A1', 'E5']
+
+
+def exact_pagerank(senders, receivers):
+    graph = TransactionGraph.from_edgelist(senders, receivers, directed=False)
+    return dict(zip(graph.accounts.tolist(), graph.pagerank(tol=1e-12, max_iter=1000)))
+
+
+def assert_matches(incremental, senders, receivers, atol=1e-3):
+    expected = exact_pagerank(senders, receivers)
+    served = incremental.features(list(expected))['pagerank_score']
+    np.testing.assert_allclose(served, list(expected.values()), atol=atol)
+
+
+def test_keys_match_raw_ids_however_they_are_typed():
+    graph = IncrementalGraph(TransactionGraph.from_edgelist(['12', 'ab'], ['ab', '7'], directed=False))
+    features = graph.features([12, 12.0, '12', 'missing'])
+    assert features['degree_centrality'][:3].tolist() == [0.5] * 3
+    assert np.isnan(features['degree_centrality'][3])
+    assert not graph.add_edge(12.0, 'ab')
+
+
+def test_edges_added_during_a_refresh_are_replayed():
+    graph = IncrementalGraph(TransactionGraph.from_edgelist(SENDERS, RECEIVERS, directed=False))
+    # keep these updates from asking for a refresh of their own
+    graph.max_error, max_error = 1.0, graph.max_error
+    graph.add_edge('C3', 'F6')
+    solve = graph._solve
+
+    def solve_while_scoring(*args, **kwargs):
+        # /score keeps adding edges while the compaction thread solves
+        graph.add_edge('F6', 'G7')
+        graph.add_edge('A1', 'G7')
+        return solve(*args, **kwargs)
+
+    graph._solve = solve_while_scoring
+    graph.refresh()
+    assert graph.stats()['delta_edges'] == 2
+    senders, receivers = SENDERS + ['C3', 'F6', 'A1'], RECEIVERS + ['F6', 'G7', 'G7']
+    expected = TransactionGraph.from_edgelist(senders, receivers, directed=False)
+    served = graph.features(expected.accounts.tolist())['degree_centrality']
+    np.testing.assert_allclose(served, expected.degree_centrality())
+
+    # the replayed edges are part of the next base
+    graph._solve, graph.max_error = solve, max_error
+    graph.refresh()
+    assert graph.stats()['delta_edges'] == 0
+    assert_matches(graph, senders, receivers, atol=1e-5)
+
+
+def test_refresh_runs_on_the_compaction_thread():
+    graph = IncrementalGraph(TransactionGraph.from_edgelist(SENDERS, RECEIVERS, directed=False), compact_edges=3)
+    stop = threading.Event()
+    graph.start_compaction(interval=3600, stop=stop)
+    started = threading.Event()
+    solve = graph._solve
+
+    def slow_solve(*args, **kwargs):
+        started.set()
+        time.sleep(0.2)
+        return solve(*args, **kwargs)
+
+    graph._solve = slow_solve
+    try:
+        senders, receivers = ['F6', 'G7', 'H8'], ['A1', 'F6', 'C3']
+        for s, r in zip(senders, receivers):
+            graph.add_edge(s, r)
+        assert started.wait(5)
+        # the update path doesn't wait for the solve
+        begin = time.perf_counter()
+        graph.add_edge('H8', 'D4')
+        assert time.perf_counter() - begin < 0.1
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = graph.stats()
+            if stats['refreshes'] and not stats['refresh_pending']:
+                break
+            time.sleep(0.01)
+        assert stats['refreshes'] >= 1 and not stats['refresh_pending']
+        assert_matches(graph, SENDERS + senders + ['H8'], RECEIVERS + receivers + ['D4'], atol=graph.max_error)
+    finally:
+        stop.set()
+
+
+def test_save_includes_the_delta(tmp_path):
+    graph = IncrementalGraph(TransactionGraph.from_edgelist(SENDERS, RECEIVERS, directed=False))
+    graph.add_edge('C3', 'F6')
+    graph.save(str(tmp_path / 'graph.col'))
+    restored = IncrementalGraph.load(str(tmp_path / 'graph.col'))
+    assert restored.stats()['accounts'] == 6 and restored.stats()['delta_edges'] == 0
+    assert_matches(restored, SENDERS + ['C3'], RECEIVERS + ['F6'])
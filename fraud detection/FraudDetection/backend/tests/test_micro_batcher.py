@@ -0,0 +1,17 @@
+from metrics import REGISTRY
+from micro_batcher import MicroBatcher
+
+
+def test_batches_are_recorded_in_the_metrics_registry():
+    batcher = MicroBatcher(lambda X: X.sum(axis=1), name='test-batcher')
+    try:
+        assert [float(batcher.predict([1, 2])) for _ in range(3)] == [3.0] * 3
+    finally:
+        batcher.stop()
+
+    stats = batcher.stats()
+    assert stats['batch_size']['count'] == 3 and stats['batch_size']['sum'] == 3
+    assert stats['latency_seconds']['count'] == 3
+    rendered = REGISTRY.render()
+    assert 'batch_size_rows_count{batcher="test-batcher"} 3' in rendered
+    assert 'batch_latency_seconds_count{batcher="test-batcher"} 3' in rendered
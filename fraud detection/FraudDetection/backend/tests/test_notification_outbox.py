@@ -0,0 +1,27 @@
+import time
+
+import pytest
+
+from db_pool import ConnectionPool
+from notification_outbox import STALE_CLAIM_SECONDS, NotificationOutbox
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'outbox.db'))
+    yield NotificationOutbox(pool, {}, workers=0)
+    pool.close()
+
+
+def test_expired_claims_are_claimed_again(outbox):
+    outbox.enqueue_many([('email', {'n': i}, i) for i in range(3)])
+    assert len(outbox._claim()) == 3
+    # a worker died mid-send: nothing is due while its claim is fresh
+    assert outbox._claim() == []
+
+    with outbox.pool.transaction() as conn:
+        conn.execute('UPDATE notification_outbox SET claimed_at = ? WHERE id = 1',
+                     (time.time() - STALE_CLAIM_SECONDS - 1,))
+    assert [row[0] for row in outbox._claim()] == [1]
+    assert outbox._claim() == []
+    assert outbox.stats() == {'sending': 3}
@@ -1,13 +1,65 @@
+"""Train the loan approval model.
+
+The dataset is read in chunks with compact dtypes: float32 numbers, and the text
+categoricals as pandas categories (int8 codes) mapped through the plan's code
+tables. Rows are written straight to a float32 matrix on disk. The MinMax scaler
+is fitted chunk by chunk (``partial_fit``), so the whole CSV is never held in a
+DataFrame.
+
+The scaled matrix is laid out once in a temp directory (``np.save``): each CV
+fold is a contiguous block, and the 20% test split comes last. A process pool
+then evaluates a grid of RandomForest configurations with stratified k-fold CV.
+Workers memory-map the same file read-only, so the training data sits once in
+the page cache, not once per worker. A fold never copies its training rows. The
+model is fitted on the whole training block, with weight 0 for the held-out fold,
+and predicts the fold from a slice. The forests work in float32 internally, so
+nothing is lost.
+
+Configurations run fold by fold. After ``--min-folds`` folds, any configuration
+whose mean score is more than ``--prune-margin`` below the leader's stops early.
+The best survivor is refitted on the whole training block, checked on the test
+split and saved with the scaler and the preprocessing plan. The per-config
+scores, timings and memory go to a JSON report next to the model.
+
+Usage:
+    python train_loan_model.py [--data loan_approval_dataset.csv] [--jobs 4] [--folds 5]
+        [--grid '{"n_estimators": [50, 100], "max_depth": [10, null]}'] [--output-dir DIR]
+"""
+import argparse
+import json
 import os
-import pandas as pd
-import numpy as np
 import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, accuracy_score
+from sklearn.metrics import accuracy_score, classification_report, roc_auc_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, train_test_split
 from sklearn.preprocessing import MinMaxScaler
 
+try:
+    import resource
+except ImportError:  # Windows: peak memory is not reported
+    resource = None
+
+from preprocessing_plan import PreprocessingPlan, CATEGORY_CODES, EXCLUDED_COLUMNS, FILL_VALUE, PLAN_PATH
+
 BASE_DIR = os.path.dirname(__file__)
+TARGET = 'loan_status'
+TARGET_CODES = {'Approved': 1, 'Rejected': 0}
+# Rows per CSV chunk; bounds the DataFrame memory while reading
+CHUNK_ROWS = int(os.getenv("TRAIN_CHUNK_ROWS", "100000"))
+# Rows used to decide which columns are numeric
+SAMPLE_ROWS = 1000
+# Default search space; the first config is the model this script used to hard-code
+GRID = {'n_estimators': [50, 100, 200], 'max_depth': [15, 10, None], 'min_samples_leaf': [1, 3]}
+
 
 def find_dataset():
     # Look for dataset in repo backend, workspace root, and Downloads
@@ -26,67 +78,281 @@ def find_dataset():
     raise FileNotFoundError('Could not find loan_approval_dataset.csv or loan_approval_encoded.csv in expected locations')
 
 
-def load_and_preprocess(path):
-    df = pd.read_csv(path)
-    # If target already encoded as 0/1 keep, else map
-    df.columns = df.columns.str.strip()
-    if 'loan_status' not in df.columns:
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def max_rss(values) -> Optional[float]:
+    return max((v for v in values if v is not None), default=None)
+
+
+def inspect_columns(path):
+    """Feature columns (model order), categorical features and read dtypes, from a sample of rows."""
+    sample = pd.read_csv(path, nrows=SAMPLE_ROWS)
+    raw_names = {str(c).strip(): c for c in sample.columns}
+    if TARGET not in raw_names:
         raise ValueError('Dataset must contain loan_status column')
+    numeric = {name for name, raw in raw_names.items() if pd.api.types.is_numeric_dtype(sample[raw])}
+    columns = [name for name in raw_names
+               if name not in EXCLUDED_COLUMNS and (name in numeric or name in CATEGORY_CODES)]
+    categorical = {name for name in columns if name not in numeric}
+    dtypes = {raw_names[name]: 'category' if name in categorical else np.float32 for name in columns}
+    dtypes[raw_names[TARGET]] = np.float32 if TARGET in numeric else 'category'
+    return columns, categorical, dtypes
+
+
+def category_values(values: pd.Series, codes: Dict[str, float]) -> np.ndarray:
+    """float32 codes for a categorical column (NaN where unknown or missing)."""
+    table = np.array([codes.get(str(c).strip(), np.nan) for c in values.cat.categories] + [np.nan],
+                     dtype=np.float32)
+    return table[values.cat.codes.to_numpy()]
 
-    # If loan_status are strings like 'Approved'/'Rejected' map them
-    if df['loan_status'].dtype == object:
-        df['loan_status'] = df['loan_status'].str.strip().map({'Approved':1, 'Rejected':0})
 
-    # Map education/self_employed if present
-    if 'education' in df.columns and df['education'].dtype == object:
-        df['education'] = df['education'].str.strip().map({'Graduate':1, 'Not Graduate':0})
-    if 'self_employed' in df.columns and df['self_employed'].dtype == object:
-        df['self_employed'] = df['self_employed'].str.strip().map({'Yes':1, 'No':0})
+def read_compact(path, workdir, chunk_rows=CHUNK_ROWS):
+    """Stream the CSV into a float32 matrix file; fits the scaler on the way.
 
-    # Drop rows with missing target
-    df = df.dropna(subset=['loan_status'])
+    Returns the column names, the raw matrix (memory-mapped), labels as int8, the
+    CSV row of each kept row and the fitted scaler.
+    """
+    columns, categorical, dtypes = inspect_columns(path)
+    raw_path = os.path.join(workdir, 'raw.f32')
+    scaler = MinMaxScaler()
+    labels, source_rows = [], []
+    n, offset = 0, 0
+    with open(raw_path, 'wb') as f:
+        for chunk in pd.read_csv(path, usecols=list(dtypes), dtype=dtypes, chunksize=chunk_rows):
+            chunk.columns = chunk.columns.str.strip()
+            target = chunk[TARGET]
+            y = (category_values(target, TARGET_CODES) if isinstance(target.dtype, pd.CategoricalDtype)
+                 else target.to_numpy(dtype=np.float32, na_value=np.nan))
+            keep = ~np.isnan(y)
+            block = np.empty((int(keep.sum()), len(columns)), dtype=np.float32)
+            for j, col in enumerate(columns):
+                values = chunk[col]
+                block[:, j] = (category_values(values, CATEGORY_CODES[col]) if col in categorical
+                               else values.to_numpy(dtype=np.float32, na_value=np.nan))[keep]
+            block[np.isnan(block)] = FILL_VALUE
+            block.tofile(f)
+            if len(block):
+                scaler.partial_fit(pd.DataFrame(block.astype(np.float64), columns=columns))
+            labels.append(y[keep].astype(np.int8))
+            source_rows.append(np.flatnonzero(keep) + offset)
+            n += len(block)
+            offset += len(chunk)
+    if not n:
+        raise ValueError(f'{path} has no labelled rows')
+    raw = np.memmap(raw_path, dtype=np.float32, mode='r', shape=(n, len(columns)))
+    return columns, raw, np.concatenate(labels), np.concatenate(source_rows), scaler
+
+
+def layout(raw, y, scaler, workdir, folds, test_size, seed):
+    """Write the scaled matrix ordered fold by fold, with the test split last.
+
+    Returns the .npy paths, the fold boundaries (``bounds[-1]`` is the number of
+    training rows) and the permutation applied to the rows.
+    """
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=test_size, random_state=seed, stratify=y)
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    blocks = [train_idx[held_out] for _, held_out in splitter.split(train_idx, y[train_idx])]
+    bounds = np.cumsum([0] + [len(b) for b in blocks]).tolist()
+    perm = np.concatenate(blocks + [test_idx])
+
+    x_path, y_path = os.path.join(workdir, 'X.npy'), os.path.join(workdir, 'y.npy')
+    X = np.lib.format.open_memmap(x_path, mode='w+', dtype=np.float32, shape=raw.shape)
+    for start in range(0, len(perm), CHUNK_ROWS):
+        rows = perm[start:start + CHUNK_ROWS]
+        X[start:start + len(rows)] = raw[rows] * scaler.scale_ + scaler.min_
+    X.flush()
+    del X
+    np.save(y_path, y[perm])
+    return x_path, y_path, bounds, perm
+
+
+# Memory-mapped training data, opened once per worker process
+_shared: Dict[str, np.ndarray] = {}
+
+
+def _open_shared(x_path, y_path):
+    _shared['X'] = np.load(x_path, mmap_mode='r')
+    _shared['y'] = np.load(y_path, mmap_mode='r')
 
-    # Select numeric features automatically (exclude target and id)
-    X = df.select_dtypes(include=[np.number]).drop(columns=['loan_status', 'loan_id'], errors='ignore')
-    y = df['loan_status'].astype(int)
 
-    # Fill NA with 0 for numeric
-    X = X.fillna(0)
-    return X, y
+def evaluate_fold(params: Dict[str, Any], fold: int, bounds: Sequence[int], seed: int) -> Dict[str, Any]:
+    """Fit on the training block minus ``fold`` (weight 0) and score the fold."""
+    X, y = _shared['X'], _shared['y']
+    n_train, start, end = bounds[-1], bounds[fold], bounds[fold + 1]
+    weight = np.ones(n_train)
+    weight[start:end] = 0.0
+    model = RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+    started = time.perf_counter()
+    model.fit(X[:n_train], y[:n_train], sample_weight=weight)
+    fitted = time.perf_counter()
+    proba = model.predict_proba(X[start:end])[:, 1]
+    truth = y[start:end]
+    return {
+        'accuracy': float(accuracy_score(truth, proba > 0.5)),
+        'roc_auc': float(roc_auc_score(truth, proba)),
+        'fit_seconds': fitted - started,
+        'predict_seconds': time.perf_counter() - fitted,
+        'worker_rss_mb': peak_rss_mb(),
+    }
 
 
-def train_and_save():
-    path = find_dataset()
+def search(configs: List[Dict[str, Any]], x_path, y_path, bounds, jobs, scoring='accuracy',
+           prune_margin=0.01, min_folds=2, seed=42) -> List[Dict[str, Any]]:
+    """Cross-validate every config on a process pool, one fold round at a time, pruning laggards."""
+    n_folds = len(bounds) - 1
+    results = [{'params': p, 'folds': [], 'pruned_after': None} for p in configs]
+    alive = list(range(len(configs)))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_open_shared, initargs=(x_path, y_path)) as pool:
+        for fold in range(n_folds):
+            started = time.perf_counter()
+            futures = {pool.submit(evaluate_fold, configs[i], fold, bounds, seed): i for i in alive}
+            for future in as_completed(futures):
+                results[futures[future]]['folds'].append(future.result())
+            means = {i: np.mean([r[scoring] for r in results[i]['folds']]) for i in alive}
+            leader = max(means.values())
+            dropped = []
+            if min_folds <= fold + 1 < n_folds:
+                dropped = [i for i in alive if means[i] < leader - prune_margin]
+                for i in dropped:
+                    results[i]['pruned_after'] = fold + 1
+                alive = [i for i in alive if i not in dropped]
+            print(f"✅ Fold {fold + 1}/{n_folds}: {len(futures)} configs in {time.perf_counter() - started:.1f}s, "
+                  f"best {scoring} {leader:.4f}" + (f", {len(dropped)} pruned" if dropped else ''))
+    return [summarize(r, scoring) for r in results]
+
+
+def summarize(result: Dict[str, Any], scoring: str) -> Dict[str, Any]:
+    folds = result['folds']
+    scores = [r[scoring] for r in folds]
+    return {
+        'params': result['params'],
+        'folds_run': len(folds),
+        'pruned_after': result['pruned_after'],
+        scoring: round(float(np.mean(scores)), 5),
+        f'{scoring}_std': round(float(np.std(scores)), 5),
+        **{m: round(float(np.mean([r[m] for r in folds])), 5) for m in ('accuracy', 'roc_auc') if m != scoring},
+        'fit_seconds': round(float(np.mean([r['fit_seconds'] for r in folds])), 3),
+        'worker_rss_mb': max_rss(r['worker_rss_mb'] for r in folds),
+    }
+
+
+def train_and_save(path: Optional[str] = None, grid: Optional[Dict[str, list]] = None, jobs: Optional[int] = None,
+                   folds: int = 5, scoring: str = 'accuracy', prune_margin: float = 0.01, min_folds: int = 2,
+                   test_size: float = 0.2, seed: int = 42, output_dir: Optional[str] = None) -> Dict[str, Any]:
+    began = time.perf_counter()
+    path = path or find_dataset()
     print('Using dataset:', path)
-    X, y = load_and_preprocess(path)
+    jobs = jobs or os.cpu_count() or 1
+    configs = list(ParameterGrid(grid or GRID))
 
-    scaler = MinMaxScaler()
-    X_scaled = scaler.fit_transform(X)
+    with tempfile.TemporaryDirectory(prefix='loan-train-') as workdir:
+        started = time.perf_counter()
+        columns, raw, y, source_rows, scaler = read_compact(path, workdir)
+        x_path, y_path, bounds, perm = layout(raw, y, scaler, workdir, folds, test_size, seed)
+        del raw
+        read_seconds = time.perf_counter() - started
+        X = np.load(x_path, mmap_mode='r')
+        y_perm = np.load(y_path, mmap_mode='r')
+        n_train = bounds[-1]
+        print(f"✅ {len(y)} rows x {len(columns)} features ({X.nbytes / 1e6:.1f} MB float32) "
+              f"read in {read_seconds:.1f}s; {len(configs)} configs x {folds} folds on {jobs} workers")
 
-    X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.2, random_state=42, stratify=y)
+        started = time.perf_counter()
+        results = search(configs, x_path, y_path, bounds, jobs, scoring, prune_margin, min_folds, seed)
+        search_seconds = time.perf_counter() - started
+        finished = [r for r in results if r['folds_run'] == folds]
+        best = max(finished, key=lambda r: (r[scoring], -r['fit_seconds']))
+        print('Best config:', best['params'], f"({scoring} {best[scoring]:.4f})")
 
-    # Use fewer estimators for faster training, optimize with n_jobs
-    model = RandomForestClassifier(n_estimators=50, random_state=42, n_jobs=-1, max_depth=15)
-    print('Training model... this may take a minute...')
-    model.fit(X_train, y_train)
-    print('Training complete!')
+        started = time.perf_counter()
+        model = RandomForestClassifier(random_state=seed, n_jobs=-1, **best['params'])
+        model.fit(X[:n_train], y_perm[:n_train])
+        refit_seconds = time.perf_counter() - started
+        y_test = np.asarray(y_perm[n_train:])
+        proba = model.predict_proba(X[n_train:])[:, 1]
+        y_pred = (proba > 0.5).astype(int)
+        acc = accuracy_score(y_test, y_pred)
 
-    y_pred = model.predict(X_test)
-    acc = accuracy_score(y_test, y_pred)
-    report = classification_report(y_test, y_pred)
+        # The API applies this plan instead of re-running the pandas preprocessing and the scaler
+        plan = PreprocessingPlan.from_scaler(scaler, columns=columns, source=os.path.basename(path),
+                                             trained_at=datetime.now().isoformat(timespec='seconds'))
+        raw_head = pd.read_csv(path, nrows=SAMPLE_ROWS)
+        head = np.flatnonzero(source_rows < len(raw_head))
+        position = np.empty(len(perm), dtype=np.int64)
+        position[perm] = np.arange(len(perm))
+        if not np.allclose(plan.transform(raw_head.iloc[source_rows[head]]), X[position[head]], atol=1e-6):
+            raise RuntimeError('Preprocessing plan does not reproduce the training features')
+        del X, y_perm
 
-    model_path = os.path.join(BASE_DIR, 'loan_model.pkl')
-    scaler_path = os.path.join(BASE_DIR, 'scaler.pkl')
+    model_dir = output_dir or BASE_DIR
+    os.makedirs(model_dir, exist_ok=True)
+    model_path = os.path.join(model_dir, 'loan_model.pkl')
+    scaler_path = os.path.join(model_dir, 'scaler.pkl')
+    plan_path = os.path.join(output_dir, os.path.basename(PLAN_PATH)) if output_dir else PLAN_PATH
+    report_path = os.path.join(model_dir, 'loan_training_report.json')
     with open(model_path, 'wb') as f:
         pickle.dump(model, f)
     with open(scaler_path, 'wb') as f:
         pickle.dump(scaler, f)
+    plan.save(plan_path)
 
+    report = {
+        'dataset': os.path.abspath(path),
+        'trained_at': plan.meta['trained_at'],
+        'rows': int(len(y)), 'train_rows': int(n_train), 'test_rows': int(len(y) - n_train),
+        'features': columns,
+        'workers': jobs, 'folds': folds, 'scoring': scoring, 'prune_margin': prune_margin, 'min_folds': min_folds,
+        'timing': {'read_seconds': round(read_seconds, 2), 'search_seconds': round(search_seconds, 2),
+                   'refit_seconds': round(refit_seconds, 2), 'total_seconds': round(time.perf_counter() - began, 2)},
+        'peak_rss_mb': {'trainer': peak_rss_mb(), 'worker': max_rss(r['worker_rss_mb'] for r in results)},
+        'best': best,
+        'test': {'accuracy': round(float(acc), 5), 'roc_auc': round(float(roc_auc_score(y_test, proba)), 5),
+                 'report': classification_report(y_test, y_pred, output_dict=True)},
+        'configs': sorted(results, key=lambda r: (r['folds_run'], r[scoring]), reverse=True),
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'config':<60}{'folds':>6}{scoring:>10}{'fit s':>8}")
+    for r in report['configs']:
+        print(f"{json.dumps(r['params']):<60}{r['folds_run']:>6}{r[scoring]:>10.4f}{r['fit_seconds']:>8.2f}")
+    print()
     print('Model saved to', model_path)
     print('Scaler saved to', scaler_path)
+    print('Preprocessing plan saved to', plan_path)
+    print('Training report saved to', report_path)
     print('Accuracy:', acc)
-    print(report)
+    print(classification_report(y_test, y_pred))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grid-search and train the loan approval model')
+    parser.add_argument('--data', help='training CSV (default: first of the usual locations)')
+    parser.add_argument('--grid', help='JSON object of RandomForest parameter lists, or @file')
+    parser.add_argument('--jobs', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--scoring', choices=('accuracy', 'roc_auc'), default='accuracy')
+    parser.add_argument('--prune-margin', type=float, default=0.01,
+                        help='drop configs this far below the leader after --min-folds folds')
+    parser.add_argument('--min-folds', type=int, default=2)
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', help='write model, scaler, plan and report here instead of the live paths')
+    args = parser.parse_args()
+
+    grid = None
+    if args.grid:
+        grid = json.load(open(args.grid[1:])) if args.grid.startswith('@') else json.loads(args.grid)
+    train_and_save(args.data, grid, args.jobs, args.folds, args.scoring, args.prune_margin, args.min_folds,
+                   args.test_size, args.seed, args.output_dir)
 
 
 if __name__ == '__main__':
-    train_and_save()
+    main()
@@ -0,0 +1,344 @@
+"""Tree ensembles flattened into packed NumPy node arrays for low-latency scoring.
+
+``compile_model`` turns a fitted sklearn RandomForestClassifier or a binary
+XGBClassifier into one set of arrays covering every tree: split feature,
+threshold, left/right child, missing-value direction and leaf value. Prediction
+walks all trees for a whole batch at once. Each step is a handful of gathers
+over a (rows, trees) matrix of node indices, and the number of steps is the
+depth of the deepest tree. Small requests skip the per-call validation and
+DMatrix set-up of the native ``predict_proba``. Large batches are still handed to
+the native implementation, which is faster once there is enough work to amortize it.
+
+Usage:
+    python tree_compiler.py xgb_model.pkl [-o xgb_model.trees] [--benchmark]
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+
+from columnar import ColumnarFile, write_columns
+
+# Batches above this many rows go to the native predict_proba; 'auto' times both at load, 0 disables
+COMPILED_MAX_ROWS = os.getenv("COMPILED_MAX_ROWS", "auto")
+# Rows traversed together, bounding the (rows x trees) index matrices
+COMPILED_CHUNK_CELLS = 4_000_000
+
+ARRAYS = ('feature', 'threshold', 'left', 'default_left', 'value', 'roots')
+
+
+class CompiledEnsemble:
+    """Packed node arrays for every tree of one model.
+
+    Nodes are renumbered so each right child sits right after its left child,
+    so one step is ``left[node] + goes_right``. Leaves point to themselves with a
+    NaN threshold (no comparison is true), so every row can take exactly ``depth``
+    steps with no per-row bookkeeping. ``value`` holds the leaf output:
+    P(class 1) per tree for a random forest (averaged), and the leaf weight for
+    XGBoost (summed onto ``base_margin``, then passed through the sigmoid).
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], kind: str, depth: int, n_features: int,
+                 classes, base_margin: float = 0.0):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        if kind not in ('forest', 'xgboost'):
+            raise ValueError(f'Unknown ensemble kind {kind!r}')
+        self.kind = kind
+        self.depth = depth
+        self.n_features_in_ = n_features
+        self.classes_ = np.asarray(classes)
+        self.base_margin = base_margin
+        self.n_trees = len(self.roots)
+
+    def _tree_values(self, X: np.ndarray) -> np.ndarray:
+        """(rows, trees) leaf values for a float32 matrix."""
+        n = len(X)
+        node = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        # flat offsets of each row's features, so X[row, feature] is one gather
+        row_offset = (np.arange(n, dtype=np.int32) * X.shape[1])[:, None]
+        flat = X.ravel()
+        has_missing = bool(np.isnan(flat).any())
+        for _ in range(self.depth):
+            x = flat[row_offset + self.feature[node]]
+            threshold = self.threshold[node]
+            # sklearn sends x <= threshold left, xgboost x < threshold
+            goes_right = x > threshold if self.kind == 'forest' else x >= threshold
+            if has_missing:
+                goes_right |= np.isnan(x) & ~self.default_left[node]
+            node = self.left[node] + goes_right
+        return self.value[node]
+
+    def positive_proba(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Expected a 2-D matrix with {self.n_features_in_} features, got shape {X.shape}')
+        out = np.empty(len(X), dtype=np.float64)
+        step = max(1, COMPILED_CHUNK_CELLS // max(self.n_trees, 1))
+        for start in range(0, len(X), step):
+            values = self._tree_values(X[start:start + step])
+            if self.kind == 'forest':
+                out[start:start + step] = values.mean(axis=1)
+            else:
+                margin = self.base_margin + values.sum(axis=1)
+                out[start:start + step] = 1.0 / (1.0 + np.exp(-margin))
+        return out
+
+    def predict_proba(self, X) -> np.ndarray:
+        p = self.positive_proba(X)
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X) -> np.ndarray:
+        p = self.positive_proba(X)
+        # ties go to class 0, like argmax over predict_proba
+        return self.classes_[(p > 0.5).astype(np.intp)]
+
+    def save(self, path: str):
+        write_columns(path, {name: getattr(self, name) for name in ARRAYS}, meta={
+            'kind': self.kind, 'depth': self.depth, 'n_features': self.n_features_in_,
+            'classes': self.classes_.tolist(), 'base_margin': self.base_margin,
+        })
+
+    @classmethod
+    def load(cls, path: str) -> 'CompiledEnsemble':
+        f = ColumnarFile(path)
+        meta = f.meta
+        return cls({name: f[name] for name in ARRAYS}, meta['kind'], meta['depth'], meta['n_features'],
+                   meta['classes'], meta['base_margin'])
+
+
+def _pack(trees, kind: str) -> Dict[str, np.ndarray]:
+    """Concatenate per-tree (feature, threshold, left, right, default_left, value) with global node ids.
+
+    Each tree is renumbered breadth-first with siblings adjacent, so ``right == left + 1``.
+    """
+    columns = {name: [] for name in ARRAYS if name != 'roots'}
+    roots, offset = [], 0
+    for feature, threshold, left, right, default_left, value in trees:
+        order = [0]
+        for node in order:
+            if left[node] >= 0:
+                order.extend((left[node], right[node]))
+        order = np.asarray(order)
+        position = np.empty(len(left), dtype=np.int64)
+        position[order] = np.arange(len(order))
+
+        leaf = left[order] < 0
+        ids = np.arange(len(order))
+        columns['feature'].append(np.where(leaf, 0, feature[order]).astype(np.int32))
+        columns['threshold'].append(np.where(leaf, np.nan, threshold[order]))
+        columns['left'].append((np.where(leaf, ids, position[np.maximum(left[order], 0)]) + offset).astype(np.int32))
+        columns['default_left'].append(np.where(leaf, True, default_left[order].astype(bool)))
+        columns['value'].append(np.where(leaf, value[order], 0.0))
+        roots.append(offset)
+        offset += len(order)
+    arrays = {name: np.concatenate(parts) for name, parts in columns.items()}
+    # sklearn compares the float32 input against float64 thresholds, xgboost stays in float32
+    arrays['threshold'] = arrays['threshold'].astype(np.float64 if kind == 'forest' else np.float32)
+    arrays['roots'] = np.asarray(roots, dtype=np.int32)
+    return arrays
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    depth = np.zeros(len(left), dtype=np.int64)
+    # children always have larger ids than their parent in both libraries
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max()) if len(depth) else 0
+
+
+def compile_forest(model) -> CompiledEnsemble:
+    if len(model.classes_) != 2 or getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError('Only binary, single-output forests are supported')
+    trees, depth = [], 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        counts = tree.value[:, 0, :]
+        # older sklearn stores class counts, newer stores fractions; normalize either way
+        proba = counts[:, 1] / counts.sum(axis=1)
+        missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+        trees.append((tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                      missing_left, proba))
+        depth = max(depth, tree.max_depth)
+    return CompiledEnsemble(_pack(trees, 'forest'), 'forest', depth, model.n_features_in_, model.classes_)
+
+
+def compile_xgboost(model) -> CompiledEnsemble:
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    if objective != 'binary:logistic':
+        raise ValueError(f'Only binary:logistic XGBoost models are supported, not {objective}')
+    params = learner['learner_model_param']
+    # base_score is stored as a probability; the trees add to its logit
+    base_score = float(params['base_score'].strip('[]'))
+    gbtree = learner['gradient_booster']
+    if gbtree.get('name') != 'gbtree':
+        raise ValueError(f"Only gbtree boosters are supported, not {gbtree.get('name')}")
+    raw_trees = gbtree['model']['trees']
+    best = getattr(model, 'best_iteration', None) if booster.attr('best_iteration') is not None else None
+    if best is not None:
+        per_round = int(gbtree['model']['gbtree_model_param']['num_parallel_tree'])
+        raw_trees = raw_trees[:(best + 1) * per_round]
+
+    trees, depth = [], 0
+    for tree in raw_trees:
+        if any(tree['split_type']):
+            raise ValueError('Categorical splits are not supported')
+        left = np.asarray(tree['left_children'], dtype=np.int64)
+        right = np.asarray(tree['right_children'], dtype=np.int64)
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        # leaves keep their weight in split_conditions
+        trees.append((np.asarray(tree['split_indices']), conditions, left, right,
+                      np.asarray(tree['default_left']), conditions.astype(np.float64)))
+        depth = max(depth, _tree_depth(left, right))
+    return CompiledEnsemble(_pack(trees, 'xgboost'), 'xgboost', depth, int(params['num_feature']),
+                            model.classes_, base_margin=float(np.log(base_score / (1 - base_score))))
+
+
+def compile_model(model) -> CompiledEnsemble:
+    if hasattr(model, 'get_booster'):
+        return compile_xgboost(model)
+    if hasattr(model, 'estimators_') and all(hasattr(e, 'tree_') for e in model.estimators_):
+        return compile_forest(model)
+    raise ValueError(f'Cannot compile {type(model).__name__}')
+
+
+def sample_inputs(compiled: CompiledEnsemble, rows: int, missing: float = 0.0, seed: int = 0) -> np.ndarray:
+    """Random rows that land on both sides of many splits (values drawn around each feature's thresholds)."""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((rows, compiled.n_features_in_)).astype(np.float32)
+    for j in range(compiled.n_features_in_):
+        splits = compiled.threshold[(compiled.feature == j) & ~np.isnan(compiled.threshold)]
+        if len(splits):
+            X[:, j] = rng.choice(splits, rows) + rng.standard_normal(rows) * (np.std(splits) or 1.0) * 0.1
+    if missing:
+        X[rng.random(X.shape) < missing] = np.nan
+    return X
+
+
+def _seconds_per_call(fn, X, runs: int = 5) -> float:
+    fn(X)
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(X)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(native, compiled: CompiledEnsemble, limit: int = 4096) -> int:
+    """Largest power-of-two batch size for which the compiled predictor beats the native one."""
+    X = sample_inputs(compiled, limit)
+    best, rows = 0, 1
+    while rows <= limit:
+        if _seconds_per_call(compiled.predict_proba, X[:rows]) >= _seconds_per_call(native.predict_proba, X[:rows]):
+            break
+        best, rows = rows, rows * 2
+    return best
+
+
+class CompiledModel:
+    """Drop-in for the fitted model: compiled traversal for small batches, native calls for large ones."""
+
+    def __init__(self, native, compiled: CompiledEnsemble, max_rows: int):
+        self.native = native
+        self.compiled = compiled
+        self.max_rows = max_rows
+        self.classes_ = native.classes_
+        self.n_features_in_ = compiled.n_features_in_
+
+    def predict_proba(self, X):
+        if len(X) <= self.max_rows:
+            return self.compiled.predict_proba(X)
+        return self.native.predict_proba(X)
+
+    def predict(self, X):
+        if len(X) <= self.max_rows:
+            return self.compiled.predict(X)
+        return self.native.predict(X)
+
+    def __getattr__(self, name):
+        # anything else (get_params, feature_importances_, ...) comes from the original model
+        return getattr(self.native, name)
+
+
+def compiled_loader(loader=joblib.load, max_rows: str = COMPILED_MAX_ROWS):
+    """ModelRegistry loader that wraps supported ensembles in ``CompiledModel``."""
+    def load(path: str) -> Any:
+        model = loader(path)
+        # scalers/encoders loaded through the same registry are passed through untouched
+        if not (hasattr(model, 'get_booster') or hasattr(model, 'estimators_')):
+            return model
+        if max_rows != 'auto' and int(max_rows) <= 0:
+            return model
+        try:
+            compiled = compile_model(model)
+        except ValueError as e:
+            print(f"⚠️ Serving {os.path.basename(path)} without the compiled predictor: {e}")
+            return model
+        rows = calibrate(model, compiled) if max_rows == 'auto' else int(max_rows)
+        print(f"✅ Compiled {os.path.basename(path)}: batches of up to {rows} rows skip the native predictor")
+        return CompiledModel(model, compiled, rows)
+    return load
+
+
+def benchmark(model, X: np.ndarray, batch_sizes=(1, 8, 64, 256, 4096), repeat: int = 50,
+              compiled: Optional[CompiledEnsemble] = None) -> Dict[int, Dict[str, float]]:
+    """Mean seconds per call for native vs compiled predict_proba, plus the largest probability gap."""
+    compiled = compiled or compile_model(model)
+    report = {}
+    for size in batch_sizes:
+        batch = X[:size]
+        timings = {}
+        for name, fn in (('native', model.predict_proba), ('compiled', compiled.predict_proba)):
+            fn(batch)
+            runs = max(3, repeat if size <= 256 else repeat // 10)
+            start = time.perf_counter()
+            for _ in range(runs):
+                fn(batch)
+            timings[name] = (time.perf_counter() - start) / runs
+        timings['max_abs_diff'] = float(np.abs(model.predict_proba(batch)[:, 1]
+                                               - compiled.predict_proba(batch)[:, 1]).max())
+        report[size] = timings
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('model', help='pickled RandomForestClassifier or XGBClassifier')
+    parser.add_argument('-o', '--output', help='write the packed arrays here')
+    parser.add_argument('--benchmark', action='store_true', help='time native vs compiled predict_proba')
+    parser.add_argument('--rows', type=int, default=4096, help='random rows for the parity check/benchmark')
+    parser.add_argument('--tol', type=float, default=1e-5)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    start = time.perf_counter()
+    compiled = compile_model(model)
+    print(f"✅ Compiled {compiled.n_trees} trees / {len(compiled.feature)} nodes (depth {compiled.depth}) "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    if args.output:
+        compiled.save(args.output)
+        print(f"   written to {args.output}")
+
+    X = sample_inputs(compiled, args.rows, missing=0.01)
+    diff = float(np.abs(model.predict_proba(X)[:, 1] - compiled.predict_proba(X)[:, 1]).max())
+    if diff > args.tol:
+        raise SystemExit(f"❌ Compiled probabilities differ by up to {diff:.3g} (tolerance {args.tol})")
+    print(f"✅ Matches native predict_proba on {args.rows} rows (max abs diff {diff:.3g})")
+
+    if args.benchmark:
+        for size, t in benchmark(model, X, compiled=compiled).items():
+            print(f"   batch {size:>5}: native {t['native'] * 1e3:8.3f} ms  compiled {t['compiled'] * 1e3:8.3f} ms  "
+                  f"({t['native'] / t['compiled']:.1f}x)")
+        print(f"   compiled path used for batches of up to {calibrate(model, compiled)} rows")
+
+
+if __name__ == '__main__':
+    main()